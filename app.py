@@ -1,17 +1,60 @@
 # jinja2 template is for uplaoding dyanmic data in templates
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from uvicorn import run as app_run
 # uvicorn is lightweight asgi
-from typing import Optional
+import asyncio
+import json
+import os
+import time
+from contextlib import closing
+from typing import List, Optional
+from tempfile import SpooledTemporaryFile
+from pydantic import BaseModel
 
-from src.constants import APP_HOST, APP_PORT
+from src.constants import (APP_HOST, APP_PORT, APP_WORKERS, app_memory_report_seconds, app_warmup_retry_seconds, app_warmup_rows,
+                           bulk_scoring_chunk_rows, columnar_max_bytes, columnar_max_rows, prediction_batch_max_records, upload_spool_max_bytes)
+from src.logger import logging
 from src.pipeline.prediction_pipeline import VehicleData, VehicleDataClassifier
+from src.pipeline.prediction_batcher import PredictionBatcher
+from src.pipeline.prediction_executor import PredictionExecutor
+from src.pipeline.columnar_io import (arrow_media_type, get_missing_library, msgpack_media_types, read_arrow_features,
+                                     read_msgpack_features, write_arrow_predictions, write_msgpack_predictions)
+from src.pipeline.batch_prediction import (RawVehicleDataTransformer, get_scored_chunk, read_csv_chunks, read_ndjson_chunks,
+                                           score_raw_chunks)
+from src.pipeline.lead_ranking import rank_raw_chunks
+from src.pipeline.prediction_cache import PredictionCache
+from src.pipeline.model_reloader import ModelReloader
+from src.utils.prefork_server import PreforkServer, get_process_memory
+from src.utils.metrics import MetricsMiddleware, errors_total, form_parse_seconds, render_metrics, render_seconds
 
 app = FastAPI()
 
+# Shared prediction pipeline, the production model is loaded once per process
+model_predictor = VehicleDataClassifier()
+
+# Inference runs in a bounded pool so the event loop keeps serving requests
+prediction_executor = PredictionExecutor(classifier=model_predictor)
+
+# Single row predictions are coalesced into small batches before reaching the model
+prediction_batcher = PredictionBatcher(executor=prediction_executor)
+
+# Repeated single row submissions are answered from memory
+prediction_cache = PredictionCache()
+
+# A model pushed to S3 is picked up by polling, without a restart
+model_reloader = ModelReloader(classifier=model_predictor)
+
+# Maps uploaded rows in the raw schema onto the model input columns
+raw_data_transformer = RawVehicleDataTransformer()
+
+# Readiness of this process, it only reports ready once the model is loaded and warmed up
+app_state = {"ready": False, "warmup_seconds": None, "warmup_error": None, "warmup_task": None}
+
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory='templates')
 
@@ -27,6 +70,76 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Counts and times every request by route and status code for /metrics
+app.add_middleware(MetricsMiddleware)
+
+@app.on_event("startup")
+async def start_prediction_batcher():
+    await prediction_batcher.start()
+
+async def warmup_model():
+    """
+    Loads the model and scores synthetic rows off the event loop, retrying until it succeeds.
+    """
+    while True:
+        start = time.perf_counter()
+        try:
+            # building the estimator imports boto3, the S3 fetch runs on the S3 threads with
+            # a timeout and the scoring part on the request threads
+            estimator = await run_in_threadpool(model_predictor.get_estimator)
+            await estimator.get_model_async()
+            await run_in_threadpool(model_predictor.warmup, app_warmup_rows)
+            # process pool workers hold their own model copy, each one is loaded and warmed too
+            await prediction_executor.warmup(app_warmup_rows)
+            app_state.update(ready=True, warmup_seconds=time.perf_counter() - start, warmup_error=None)
+            logging.info(f"Model warmup finished in {app_state['warmup_seconds']:.2f}s, instance is ready")
+            model_reloader.start()
+            return
+        except Exception as e:
+            app_state["warmup_error"] = f"{e}"
+            logging.error(f"Model warmup failed, retrying in {app_warmup_retry_seconds}s: {e}")
+            await asyncio.sleep(app_warmup_retry_seconds)
+
+# Warmup runs in the background so /healthz answers while the model is loading
+@app.on_event("startup")
+async def start_model_warmup():
+    app_state["warmup_task"] = asyncio.create_task(warmup_model())
+
+@app.on_event("shutdown")
+async def stop_prediction_batcher():
+    if app_state["warmup_task"] is not None:
+        app_state["warmup_task"].cancel()
+    await model_reloader.stop()
+    await prediction_batcher.stop()
+    prediction_executor.shutdown()
+
+# Liveness probe, the process is up and serving requests
+@app.get("/healthz")
+async def healthzRoute():
+    return {"status": True}
+
+# Readiness probe, 503 until the model is loaded and warmed up
+@app.get("/readyz")
+async def readyzRoute():
+    body = {"status": app_state["ready"], "warmup_seconds": app_state["warmup_seconds"],
+            "error": app_state["warmup_error"]}
+    return JSONResponse(body, status_code=200 if app_state["ready"] else 503)
+
+async def predict_vehicle_record(record: dict):
+    """
+    Predicts one VehicleData shaped record, from the prediction cache when the same
+    features were already scored by the current model.
+    """
+    # parsing rejects a malformed record on its own, before it can join and fail a coalesced batch
+    key = VehicleData.get_feature_key(record)
+
+    model_version = model_predictor.get_model_version()
+    result = prediction_cache.get(key, model_version)
+    if result is None:
+        result = await prediction_batcher.predict(record)
+        prediction_cache.put(key, result, model_version)
+    return result
+
 class DataForm:
     """
     DataForm class to handle and process incoming form data from users.
@@ -65,14 +178,36 @@ class DataForm:
         self.Vehicle_Age_gt_2_Years = form.get("Vehicle_Age_gt_2_Years")
         self.Vehicle_Damage_Yes = form.get("Vehicle_Damage_Yes")
 
+class VehicleRecord(BaseModel):
+    """
+    One VehicleData shaped record of the JSON batch prediction endpoint.
+    """
+    Gender: int
+    Age: int
+    Driving_License: int
+    Region_Code: float
+    Previously_Insured: int
+    Annual_Premium: float
+    Policy_Sales_Channel: float
+    Vintage: int
+    Vehicle_Age_lt_1_Year: int
+    Vehicle_Age_gt_2_Years: int
+    Vehicle_Damage_Yes: int
+
+class BatchPredictionRequest(BaseModel):
+    records: List[VehicleRecord]
+
 # Route to render the main page with the form
 @app.get("/", tags=["authentication"])
 async def index(request: Request):
     """
     Renders the main HTML form page for vehicle data input.
     """
-    return templates.TemplateResponse(
+    start = time.perf_counter()
+    response = templates.TemplateResponse(
             "index.html",{"request": request, "context": "Press the Predict button"})
+    render_seconds.observe(time.perf_counter() - start)
+    return response
 
 
 # Route to handle form submission and make predictions
@@ -82,8 +217,10 @@ async def predictRouteClient(request: Request):
     Endpoint to receive form data, process it, and make a prediction.
     """
     try:
+        start = time.perf_counter()
         form = DataForm(request)
         await form.get_vehicle_data()
+        form_parse_seconds.observe(time.perf_counter() - start)
         
         vehicle_data=VehicleData(
                                 Gender= form.Gender,
@@ -99,27 +236,230 @@ async def predictRouteClient(request: Request):
                                 Vehicle_Damage_Yes = form.Vehicle_Damage_Yes
                                 )
 
-        # Convert form data into a DataFrame for the model
-        vehicle_df = vehicle_data.get_vehicle_input_data_frame()
-
-        # Initialize the prediction pipeline
-        model_predictor = VehicleDataClassifier()
-
-        # Make a prediction and retrieve the result
-        value = model_predictor.predict(dataframe=vehicle_df)[0]
+        # Make a prediction, batched together with other concurrent requests
+        value, _ = await predict_vehicle_record(vehicle_data.get_vehicle_data_as_record())
 
         # Interpret the prediction result as 'Response-Yes' or 'Response-No'
         status = "Response: Yes" if value == 1 else "Response: No"
 
         # Render the same HTML page with the prediction result
-        return templates.TemplateResponse(
+        start = time.perf_counter()
+        response = templates.TemplateResponse(
             "index.html",
             {"request": request, "context": status},
         )
+        render_seconds.observe(time.perf_counter() - start)
+        return response
         
     except Exception as e:
+        errors_total.labels("/").inc()
+        return {"status": False, "error": f"{e}"}
+
+# Route to score one JSON record, coalesced with other concurrent requests
+@app.post("/predict")
+async def predictRoute(record: VehicleRecord):
+    """
+    Endpoint to receive a single JSON record and return its predicted label
+    and the probability of a positive response.
+    """
+    try:
+        prediction, probability = await predict_vehicle_record(record.__dict__)
+        return {"status": True, "prediction": prediction, "probability": probability}
+
+    except Exception as e:
+        errors_total.labels("/predict").inc()
         return {"status": False, "error": f"{e}"}
 
+# Route to inspect the memory of the worker process serving the request
+@app.get("/memory")
+async def memoryRoute():
+    return {"pid": os.getpid(), "memory": get_process_memory(os.getpid())}
+
+# Route to inspect the served model version and hot reload counters
+@app.get("/model")
+async def modelRoute():
+    return model_reloader.stats()
+
+# Route to expose the metrics of this process in the Prometheus text format
+@app.get("/metrics")
+async def metricsRoute():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+# Route to inspect the prediction cache counters
+@app.get("/predict/cache")
+async def predictionCacheRoute():
+    return prediction_cache.stats()
+
+# Route to score many records with a single model call
+@app.post("/predict/batch")
+async def predictBatchRoute(batch: BatchPredictionRequest):
+    """
+    Endpoint to receive a JSON list of records and return the predicted labels
+    together with the probability of a positive response for each of them.
+    """
+    try:
+        if len(batch.records) > prediction_batch_max_records:
+            raise ValueError(f"Batch of {len(batch.records)} records exceeds the limit of {prediction_batch_max_records}")
+
+        predictions, probabilities = await prediction_executor.predict_records(
+            [record.__dict__ for record in batch.records])
+
+        return {
+            "status": True,
+            "predictions": predictions.astype(int).tolist(),
+            "probabilities": probabilities.tolist(),
+        }
+
+    except Exception as e:
+        errors_total.labels("/predict/batch").inc()
+        return {"status": False, "error": f"{e}"}
+
+# Route to score a binary columnar batch (Arrow IPC stream or msgpack column arrays)
+@app.post("/predict/columnar")
+async def predictColumnarRoute(request: Request):
+    """
+    Endpoint to receive the 11 model feature columns as an Arrow IPC stream
+    (Content-Type application/vnd.apache.arrow.stream) or a msgpack map of columns
+    (application/msgpack). The columns go straight into a numpy feature matrix and
+    the pandas free transform, and the predictions come back in the same format.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    # a format this server cannot decode is an unsupported media type, not a failed prediction
+    if content_type != arrow_media_type and content_type not in msgpack_media_types:
+        errors_total.labels("/predict/columnar").inc()
+        return JSONResponse({"status": False, "error": f"Unsupported Content-Type {content_type}, expected "
+                                                       f"{arrow_media_type} or one of {msgpack_media_types}"},
+                            status_code=415)
+    missing_library = get_missing_library(content_type)
+    if missing_library is not None:
+        errors_total.labels("/predict/columnar").inc()
+        return JSONResponse({"status": False, "error": f"{content_type} is not supported by this server, "
+                                                       f"{missing_library} is not installed"},
+                            status_code=415)
+    try:
+        # an oversized body is turned away before it is read, a body without a length while it streams in
+        content_length = request.headers.get("content-length")
+        if content_length is not None and int(content_length) > columnar_max_bytes:
+            raise ValueError(f"Body of {content_length} bytes exceeds the limit of {columnar_max_bytes}")
+        body = bytearray()
+        async for data in request.stream():
+            body += data
+            if len(body) > columnar_max_bytes:
+                raise ValueError(f"Body exceeds the limit of {columnar_max_bytes} bytes")
+
+        def read_columns():
+            if content_type == arrow_media_type:
+                return read_arrow_features(bytes(body)), True
+            return read_msgpack_features(bytes(body))
+
+        # decoding must not block the event loop, scoring goes through the bounded prediction pool
+        features, binary = await run_in_threadpool(read_columns)
+        if len(features) > columnar_max_rows:
+            raise ValueError(f"Batch of {len(features)} rows exceeds the limit of {columnar_max_rows}")
+        predictions, probabilities = await prediction_executor.predict_features(features)
+
+        if content_type == arrow_media_type:
+            content = await run_in_threadpool(write_arrow_predictions, predictions, probabilities)
+        else:
+            content = await run_in_threadpool(write_msgpack_predictions, predictions, probabilities, binary)
+        return Response(content, media_type=content_type)
+
+    except Exception as e:
+        errors_total.labels("/predict/columnar").inc()
+        return {"status": False, "error": f"{e}"}
+
+async def spool_request_body(request: Request) -> SpooledTemporaryFile:
+    """
+    Copies the request body into a temporary file that moves to disk once it
+    grows past upload_spool_max_bytes.
+    """
+    upload = SpooledTemporaryFile(max_size=upload_spool_max_bytes)
+    async for data in request.stream():
+        await run_in_threadpool(upload.write, data)
+    upload.seek(0)
+    return upload
+
+def read_upload_chunks(upload, is_ndjson: bool):
+    """
+    Reads a spooled CSV or NDJSON upload in raw schema chunks of bulk_scoring_chunk_rows rows.
+    """
+    read_chunks = read_ndjson_chunks if is_ndjson else read_csv_chunks
+    return read_chunks(upload, chunk_rows=bulk_scoring_chunk_rows, dtype=raw_data_transformer.get_input_dtypes())
+
+# Route to score a whole CSV or NDJSON file in the raw schema
+@app.post("/predict/upload")
+async def predictUploadRoute(request: Request):
+    """
+    Endpoint to receive a CSV or NDJSON request body (Content-Type text/csv or
+    application/x-ndjson) with rows in the raw schema of config/schema.yaml.
+    The body is spooled to disk, then parsed and scored bulk_scoring_chunk_rows rows
+    at a time and the predictions are streamed back in the same format, so memory
+    stays flat whatever the upload size. A failure after streaming started ends the
+    body with an error line, {"error": ...} for NDJSON or "# error: ..." for CSV.
+    """
+    is_ndjson = "json" in request.headers.get("content-type", "")
+    # the body has to be consumed before the response starts streaming
+    upload = await spool_request_body(request)
+
+    def format_result(chunk, predictions, probabilities, rows_scored):
+        result = get_scored_chunk(chunk, predictions, probabilities, first_row=rows_scored)
+        if is_ndjson:
+            return result.to_json(orient="records", lines=True, double_precision=15).rstrip("\n") + "\n"
+        return result.to_csv(index=False, header=rows_scored == 0)
+
+    async def stream_predictions():
+        chunks = read_upload_chunks(upload, is_ndjson)
+        try:
+            rows_scored = 0
+            async for chunk, _, predictions, probabilities in score_raw_chunks(chunks, prediction_executor,
+                                                                               raw_data_transformer):
+                yield await run_in_threadpool(format_result, chunk, predictions, probabilities, rows_scored)
+                rows_scored += len(chunk)
+        except Exception as e:
+            # the 200 status is already sent, a trailer line tells the client the body is incomplete
+            errors_total.labels("/predict/upload").inc()
+            logging.error(f"Upload scoring failed after {rows_scored} rows: {e}")
+            yield (json.dumps({"status": False, "error": f"{e}", "rows_scored": rows_scored}) + "\n" if is_ndjson
+                   else f"# error after {rows_scored} rows: {e}\n")
+        finally:
+            # the CSV reader flushes its handle when closed, before the upload goes away
+            chunks.close()
+            upload.close()
+
+    return StreamingResponse(stream_predictions(),
+                             media_type="application/x-ndjson" if is_ndjson else "text/csv")
+
+# Route to rank the leads of a CSV or NDJSON file by their probability to buy
+@app.post("/rank/upload")
+async def rankUploadRoute(request: Request, k: int = 100, group_by: Optional[str] = None):
+    """
+    Endpoint to receive a CSV or NDJSON body in the raw schema and return the k leads
+    most likely to respond, overall or per Region_Code / Policy_Sales_Channel.
+    Rows are scored in chunks and only the best k per group are kept in memory.
+    """
+    try:
+        is_ndjson = "json" in request.headers.get("content-type", "")
+        upload = await spool_request_body(request)
+
+        with upload, closing(read_upload_chunks(upload, is_ndjson)) as chunks:
+            leads = await rank_raw_chunks(chunks, prediction_executor, raw_data_transformer, k=k, group_by=group_by)
+        return {"status": True, "k": k, "group_by": group_by, "leads": leads}
+
+    except Exception as e:
+        errors_total.labels("/rank/upload").inc()
+        return {"status": False, "error": f"{e}"}
+
+def preload_model():
+    """
+    Loads the production model and its fast path into this process, so that
+    forked workers share the already loaded pages instead of each loading a copy
+    """
+    model_predictor.get_fast_predictor()
+
 # Main entry point to start the FastAPI server
 if __name__ == "__main__":
-    app_run(app, host=APP_HOST, port=APP_PORT)
\ No newline at end of file
+    if APP_WORKERS > 1:
+        PreforkServer(app, host=APP_HOST, port=APP_PORT, workers=APP_WORKERS, preload=preload_model,
+                      memory_report_seconds=app_memory_report_seconds).run()
+    else:
+        app_run(app, host=APP_HOST, port=APP_PORT)
\ No newline at end of file
@@ -0,0 +1,86 @@
+'''
+Compares batch scoring from a JSON body (the /predict/batch path: parse the
+records, build the typed DataFrame, transform, predict) with Arrow IPC and
+msgpack column bodies (the /predict/columnar path: decode the columns into a
+feature matrix, pandas free transform, predict, encode the answer) and checks
+all of them give identical predictions. Needs pyarrow and msgpack installed.
+
+run from the project root: python -m benchmarks.columnar_benchmark --rows 10000
+'''
+import argparse
+import json
+import logging
+import time
+
+import msgpack
+import numpy as np
+import pyarrow as pa
+
+from benchmarks.synthetic_model import make_synthetic_model,make_vehicle_frame
+from src.entity.compiled_forest import CompiledForest
+from src.pipeline.columnar_io import (read_arrow_features,read_msgpack_features,
+                                      write_arrow_predictions,write_msgpack_predictions)
+from src.pipeline.prediction_pipeline import VehicleData,VehicleFastPredictor
+
+def best_seconds(func,repeat:int)->float:
+    best=float("inf")
+    for _ in range(repeat):
+        start=time.perf_counter()
+        func()
+        best=min(best,time.perf_counter()-start)
+    return best
+
+def main():
+    parser=argparse.ArgumentParser(description=__doc__,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows",type=int,default=10000)
+    parser.add_argument("--repeat",type=int,default=5)
+    args=parser.parse_args()
+
+    logging.disable(logging.INFO)
+    model=make_synthetic_model()
+    model.compiled_model=CompiledForest.from_forest(model.trained_model_object)
+    fast_predictor=VehicleFastPredictor(model)
+    frame=make_vehicle_frame(args.rows,seed=7)
+
+    json_body=json.dumps({"records":frame.to_dict("records")}).encode()
+    sink=pa.BufferOutputStream()
+    table=pa.Table.from_pandas(frame,preserve_index=False)
+    with pa.ipc.new_stream(sink,table.schema) as writer:
+        writer.write_table(table)
+    arrow_body=sink.getvalue().to_pybytes()
+    msgpack_body=msgpack.packb({name:{"dtype":frame[name].dtype.str,"data":frame[name].to_numpy().tobytes()}
+                                for name in frame.columns},use_bin_type=True)
+
+    def json_path():
+        records=json.loads(json_body)["records"]
+        dataframe=VehicleData.get_batch_input_data_frame(records)
+        return model.predict_with_proba(dataframe)
+
+    def arrow_path():
+        predictions,probabilities=fast_predictor.predict_features_with_proba(read_arrow_features(arrow_body))
+        write_arrow_predictions(predictions,probabilities[:,1])
+        return predictions,probabilities
+
+    def msgpack_path():
+        features,binary=read_msgpack_features(msgpack_body)
+        predictions,probabilities=fast_predictor.predict_features_with_proba(features)
+        write_msgpack_predictions(predictions,probabilities[:,1],binary)
+        return predictions,probabilities
+
+    expected_predictions,expected_probabilities=json_path()
+    for path in (arrow_path,msgpack_path):
+        predictions,probabilities=path()
+        assert np.array_equal(expected_predictions,predictions),f"{path.__name__} predictions differ"
+        assert np.array_equal(expected_probabilities,probabilities),f"{path.__name__} probabilities differ"
+
+    report={"rows":args.rows,"identical_results":True,
+            "body_bytes":{"json":len(json_body),"arrow":len(arrow_body),"msgpack":len(msgpack_body)}}
+    json_seconds=best_seconds(json_path,args.repeat)
+    for name,path in (("json",json_path),("arrow",arrow_path),("msgpack",msgpack_path)):
+        seconds=json_seconds if path is json_path else best_seconds(path,args.repeat)
+        report[name]={"batch_ms":round(seconds*1000,3),"rows_per_second":round(args.rows/seconds),
+                      "speedup":round(json_seconds/seconds,2)}
+    print(json.dumps(report,indent=2))
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,52 @@
+'''
+Checks the CompiledForest engine against sklearn's RandomForestClassifier
+and compares their latency for a few batch sizes.
+
+run from the project root: python -m benchmarks.compiled_forest_benchmark
+'''
+import argparse
+import json
+import logging
+import time
+
+import numpy as np
+
+from benchmarks.synthetic_model import make_synthetic_model,make_vehicle_frame
+from src.entity.compiled_forest import CompiledForest
+
+def seconds_per_call(func,x,repeat:int)->float:
+    start=time.perf_counter()
+    for _ in range(repeat):
+        func(x)
+    return (time.perf_counter()-start)/repeat
+
+def main():
+    parser=argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--batch-sizes",type=int,nargs="+",default=[1,64,4096])
+    parser.add_argument("--repeat",type=int,default=5)
+    args=parser.parse_args()
+
+    logging.disable(logging.INFO)
+    model=make_synthetic_model()
+    forest=model.trained_model_object
+    compiled_forest=CompiledForest.from_forest(forest)
+
+    results=[]
+    for batch_size in args.batch_sizes:
+        x=model.preprocessing_object.transform(make_vehicle_frame(batch_size,seed=batch_size))
+        assert np.array_equal(compiled_forest.predict(x),forest.predict(x)),"labels differ from sklearn"
+        assert np.array_equal(compiled_forest.predict_proba(x),forest.predict_proba(x)),"probabilities differ from sklearn"
+
+        sklearn_seconds=seconds_per_call(forest.predict_proba,x,args.repeat)
+        compiled_seconds=seconds_per_call(compiled_forest.predict_proba,x,args.repeat)
+        results.append({
+            "batch_size":batch_size,
+            "sklearn_ms":round(sklearn_seconds*1000,3),
+            "compiled_ms":round(compiled_seconds*1000,3),
+            "speedup":round(sklearn_seconds/compiled_seconds,2),
+        })
+
+    print(json.dumps({"n_trees":len(forest.estimators_),"identical_results":True,"results":results},indent=2))
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,229 @@
+'''
+Filesystem backed stand-in for the few S3 calls the serving path makes
+(ListObjects, GetObject with If-None-Match, If-Match and Range, HeadObject, conditional
+PutObject, CopyObject and multipart uploads), so the app can run without AWS credentials.
+Objects live in <root>/<bucket>/<key>, parts of unfinished uploads in <root>/.uploads.
+
+run standalone: python -m benchmarks.fake_s3 --root /tmp/fake-s3 --port 9000
+then start the app with s3_endpoint_url=http://127.0.0.1:9000
+'''
+import argparse
+import hashlib
+import os
+import re
+import shutil
+import threading
+import uuid
+from email.utils import formatdate
+from datetime import datetime,timezone
+from http.server import BaseHTTPRequestHandler,ThreadingHTTPServer
+from urllib.parse import parse_qs,unquote,urlsplit
+from xml.sax.saxutils import escape
+
+class FakeS3Handler(BaseHTTPRequestHandler):
+    protocol_version="HTTP/1.1"
+
+    def log_message(self,format,*args):
+        pass
+
+    def _split_path(self):
+        url=urlsplit(self.path)
+        bucket,_,key=unquote(url.path).lstrip("/").partition("/")
+        return bucket,key,parse_qs(url.query,keep_blank_values=True)
+
+    def _object_path(self,bucket:str,key:str)->str:
+        path=os.path.realpath(os.path.join(self.server.root,bucket,key))
+        if not path.startswith(os.path.realpath(self.server.root)+os.sep):
+            raise PermissionError(key)
+        return path
+
+    def _send(self,status:int,body:bytes=b"",headers:dict=None,send_body:bool=True):
+        self.send_response(status)
+        for name,value in (headers or {}).items():
+            self.send_header(name,value)
+        self.send_header("Content-Length",str(len(body)))
+        self.end_headers()
+        if send_body and body:
+            self.wfile.write(body)
+
+    def _not_found(self,send_body:bool=True):
+        self._send(404,b"<?xml version=\"1.0\" encoding=\"UTF-8\"?><Error><Code>NoSuchKey</Code></Error>",
+                   {"Content-Type":"application/xml"},send_body)
+
+    def _object_headers(self,path:str)->dict:
+        stat=os.stat(path)
+        return {"ETag":f'"{self.server.etag(path)}"',
+                "Last-Modified":formatdate(stat.st_mtime,usegmt=True),
+                "Content-Type":"application/octet-stream"}
+
+    def _get_object(self,send_body:bool):
+        bucket,key,_=self._split_path()
+        path=self._object_path(bucket,key)
+        if not os.path.isfile(path):
+            return self._not_found(send_body)
+        headers=self._object_headers(path)
+        if self.headers.get("If-None-Match")==headers["ETag"]:
+            return self._send(304,headers={"ETag":headers["ETag"]},send_body=False)
+        if self.headers.get("If-Match") not in (None,headers["ETag"]):
+            return self._send(412,b"<?xml version=\"1.0\" encoding=\"UTF-8\"?><Error><Code>PreconditionFailed</Code></Error>",
+                              {"Content-Type":"application/xml"},send_body)
+        size=os.path.getsize(path)
+        byte_range=re.fullmatch(r"bytes=(\d+)-(\d*)",self.headers.get("Range",""))
+        with open(path,"rb") as object_file:
+            if byte_range is None:
+                return self._send(200,object_file.read(),headers,send_body)
+            # the ranged GETs of a parallel download
+            first=int(byte_range.group(1))
+            last=min(int(byte_range.group(2) or size-1),size-1)
+            object_file.seek(first)
+            body=object_file.read(last-first+1)
+        self._send(206,body,{**headers,"Content-Range":f"bytes {first}-{last}/{size}"},send_body)
+
+    def _list_objects(self,bucket:str,query:dict):
+        prefix=query.get("prefix",[""])[0]
+        bucket_dir=os.path.join(self.server.root,bucket)
+        contents=[]
+        for directory,_,file_names in os.walk(bucket_dir):
+            for file_name in file_names:
+                path=os.path.join(directory,file_name)
+                key=os.path.relpath(path,bucket_dir).replace(os.sep,"/")
+                if key.startswith(prefix):
+                    stat=os.stat(path)
+                    modified=datetime.fromtimestamp(stat.st_mtime,tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+                    contents.append(f"<Contents><Key>{escape(key)}</Key><LastModified>{modified}</LastModified>"
+                                    f"<ETag>&quot;{self.server.etag(path)}&quot;</ETag><Size>{stat.st_size}</Size>"
+                                    f"<StorageClass>STANDARD</StorageClass></Contents>")
+        count_tag="<KeyCount>{}</KeyCount>".format(len(contents)) if query.get("list-type")==["2"] else ""
+        body=("<?xml version=\"1.0\" encoding=\"UTF-8\"?>"
+              "<ListBucketResult xmlns=\"http://s3.amazonaws.com/doc/2006-03-01/\">"
+              f"<Name>{escape(bucket)}</Name><Prefix>{escape(prefix)}</Prefix>{count_tag}"
+              f"<MaxKeys>1000</MaxKeys><IsTruncated>false</IsTruncated>{''.join(sorted(contents))}"
+              "</ListBucketResult>").encode()
+        self._send(200,body,{"Content-Type":"application/xml"})
+
+    def do_GET(self):
+        bucket,key,query=self._split_path()
+        if not key:
+            return self._list_objects(bucket,query)
+        self._get_object(send_body=True)
+
+    def do_HEAD(self):
+        self._get_object(send_body=False)
+
+    def _upload_dir(self,upload_id:str)->str:
+        if not re.fullmatch(r"[0-9a-f]{32}",upload_id):
+            raise PermissionError(upload_id)
+        return os.path.join(self.server.root,".uploads",upload_id)
+
+    def do_PUT(self):
+        bucket,key,query=self._split_path()
+        body=self.rfile.read(int(self.headers.get("Content-Length",0)))
+        if "uploadId" in query:
+            # UploadPart
+            part_path=os.path.join(self._upload_dir(query["uploadId"][0]),f"{int(query['partNumber'][0]):05d}")
+            with open(part_path,"wb") as part_file:
+                part_file.write(body)
+            return self._send(200,headers={"ETag":f'"{hashlib.md5(body).hexdigest()}"'})
+
+        path=self._object_path(bucket,key)
+        copy_source=self.headers.get("x-amz-copy-source")
+        if copy_source is not None:
+            # CopyObject
+            source_bucket,_,source_key=unquote(copy_source).lstrip("/").partition("/")
+            source_path=self._object_path(source_bucket,source_key)
+            if not os.path.isfile(source_path):
+                return self._not_found()
+            with open(source_path,"rb") as source_file:
+                body=source_file.read()
+        # conditional writes, checked and applied under one lock like S3 does atomically
+        with self.server.write_lock:
+            etag=f'"{self.server.etag(path)}"' if os.path.isfile(path) else None
+            if_match,if_none_match=self.headers.get("If-Match"),self.headers.get("If-None-Match")
+            if (if_match is not None and if_match!=etag) or (if_none_match=="*" and etag is not None):
+                return self._send(412,b"<?xml version=\"1.0\" encoding=\"UTF-8\"?><Error><Code>PreconditionFailed</Code></Error>",
+                                  {"Content-Type":"application/xml"})
+            os.makedirs(os.path.dirname(path),exist_ok=True)
+            with open(path+".tmp","wb") as object_file:
+                object_file.write(body)
+            os.replace(path+".tmp",path)
+            etag=f'"{self.server.etag(path)}"'
+        if copy_source is not None:
+            return self._send(200,f"<CopyObjectResult><ETag>{escape(etag)}</ETag></CopyObjectResult>".encode(),
+                              {"Content-Type":"application/xml"})
+        self._send(200,headers={"ETag":etag})
+
+    def do_POST(self):
+        bucket,key,query=self._split_path()
+        self.rfile.read(int(self.headers.get("Content-Length",0)))
+        if "uploads" in query:
+            # CreateMultipartUpload
+            upload_id=uuid.uuid4().hex
+            os.makedirs(self._upload_dir(upload_id))
+            body=("<?xml version=\"1.0\" encoding=\"UTF-8\"?><InitiateMultipartUploadResult>"
+                  f"<Bucket>{escape(bucket)}</Bucket><Key>{escape(key)}</Key><UploadId>{upload_id}</UploadId>"
+                  "</InitiateMultipartUploadResult>").encode()
+            return self._send(200,body,{"Content-Type":"application/xml"})
+
+        # CompleteMultipartUpload, parts are joined in part number order
+        upload_dir=self._upload_dir(query["uploadId"][0])
+        path=self._object_path(bucket,key)
+        os.makedirs(os.path.dirname(path),exist_ok=True)
+        with open(path+".tmp","wb") as object_file:
+            for part_name in sorted(os.listdir(upload_dir)):
+                with open(os.path.join(upload_dir,part_name),"rb") as part_file:
+                    shutil.copyfileobj(part_file,object_file)
+        os.replace(path+".tmp",path)
+        shutil.rmtree(upload_dir)
+        body=("<?xml version=\"1.0\" encoding=\"UTF-8\"?><CompleteMultipartUploadResult>"
+              f"<Bucket>{escape(bucket)}</Bucket><Key>{escape(key)}</Key>"
+              f"<ETag>&quot;{self.server.etag(path)}&quot;</ETag></CompleteMultipartUploadResult>").encode()
+        self._send(200,body,{"Content-Type":"application/xml"})
+
+    def do_DELETE(self):
+        # AbortMultipartUpload
+        _,_,query=self._split_path()
+        if "uploadId" in query:
+            shutil.rmtree(self._upload_dir(query["uploadId"][0]),ignore_errors=True)
+        self._send(204)
+
+class FakeS3Server(ThreadingHTTPServer):
+    daemon_threads=True
+
+    def __init__(self,root:str,host:str="127.0.0.1",port:int=0):
+        self.root=root
+        self._etags={}
+        self.write_lock=threading.Lock()
+        super().__init__((host,port),FakeS3Handler)
+
+    @property
+    def endpoint_url(self)->str:
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def etag(self,path:str)->str:
+        # md5 of the content like a single part upload, cached per (path, mtime, size)
+        stat=os.stat(path)
+        cache_key=(path,stat.st_mtime_ns,stat.st_size)
+        etag=self._etags.get(cache_key)
+        if etag is None:
+            with open(path,"rb") as object_file:
+                etag=hashlib.md5(object_file.read()).hexdigest()
+            self._etags[cache_key]=etag
+        return etag
+
+    def start(self)->"FakeS3Server":
+        threading.Thread(target=self.serve_forever,daemon=True).start()
+        return self
+
+def main():
+    parser=argparse.ArgumentParser(description=__doc__,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--root",required=True)
+    parser.add_argument("--host",default="127.0.0.1")
+    parser.add_argument("--port",type=int,default=9000)
+    args=parser.parse_args()
+
+    server=FakeS3Server(args.root,args.host,args.port)
+    print(f"Serving {args.root} as S3 on {server.endpoint_url}")
+    server.serve_forever()
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,60 @@
+'''
+Compares single row latency of the DataFrame prediction path with the
+pandas free VehicleFastPredictor and checks both give identical results.
+
+run from the project root: python -m benchmarks.fast_path_benchmark
+'''
+import argparse
+import json
+import logging
+import time
+
+import numpy as np
+
+from benchmarks.synthetic_model import make_synthetic_model,make_vehicle_frame
+from src.pipeline.prediction_pipeline import VehicleData,VehicleFastPredictor
+
+def time_per_call(func,records,repeat:int)->float:
+    start=time.perf_counter()
+    for _ in range(repeat):
+        for record in records:
+            func(record)
+    return (time.perf_counter()-start)/(repeat*len(records))
+
+def main():
+    parser=argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows",type=int,default=200)
+    parser.add_argument("--repeat",type=int,default=3)
+    args=parser.parse_args()
+
+    logging.disable(logging.INFO)
+    model=make_synthetic_model()
+    fast_predictor=VehicleFastPredictor(model)
+    # form posts arrive as strings
+    records=[{k:str(v) for k,v in row.items()} for row in make_vehicle_frame(args.rows,seed=7).to_dict("records")]
+
+    def dataframe_path(record):
+        vehicle_df=VehicleData(**record).get_vehicle_input_data_frame()
+        transformed=model.preprocessing_object.transform(vehicle_df)
+        return model.trained_model_object.predict_proba(transformed)
+
+    def fast_path(record):
+        return fast_predictor.predict_with_proba(record)[1]
+
+    for record in records:
+        expected=dataframe_path(record)
+        assert np.array_equal(expected,fast_path(record)),f"fast path differs for {record}"
+        assert model.predict(VehicleData(**record).get_vehicle_input_data_frame())[0]==fast_predictor.predict_with_proba(record)[0][0]
+
+    dataframe_seconds=time_per_call(dataframe_path,records,args.repeat)
+    fast_seconds=time_per_call(fast_path,records,args.repeat)
+    print(json.dumps({
+        "rows":args.rows,
+        "identical_results":True,
+        "dataframe_path_ms":round(dataframe_seconds*1000,4),
+        "fast_path_ms":round(fast_seconds*1000,4),
+        "speedup":round(dataframe_seconds/fast_seconds,2),
+    },indent=2))
+
+if __name__=="__main__":
+    main()
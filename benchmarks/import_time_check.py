@@ -0,0 +1,55 @@
+'''
+Fails (exit code 1) when importing the serving app takes longer than the
+budget or pulls in modules that should only load when used: the S3 client
+stack, MongoDB, dill and scikit-learn (loaded by unpickling the model).
+Meant to run in CI next to the build.
+
+run from the project root: python -m benchmarks.import_time_check --budget-ms 1500
+'''
+import argparse
+import json
+import subprocess
+import sys
+
+lazy_modules=("boto3","botocore","mypy_boto3_s3","pymongo","dill","sklearn","imblearn")
+
+probe_code=f'''
+import sys
+import app
+print(",".join(module for module in {lazy_modules!r} if module in sys.modules))
+'''
+
+def measure(module:str)->tuple:
+    '''
+    Returns (cumulative import time of module in ms, eagerly imported lazy modules)
+    '''
+    result=subprocess.run([sys.executable,"-X","importtime","-c",probe_code],
+                          stdout=subprocess.PIPE,stderr=subprocess.PIPE,text=True,check=True)
+    import_ms=None
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        parts=line.split("|")
+        if len(parts)==3 and parts[2]==" "+module:
+            import_ms=int(parts[1])/1000
+    eager=[name for name in result.stdout.strip().splitlines()[-1].split(",") if name] if result.stdout.strip() else []
+    return import_ms,eager
+
+def main():
+    parser=argparse.ArgumentParser(description=__doc__,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget-ms",type=float,default=1500)
+    parser.add_argument("--runs",type=int,default=3,help="the fastest run is compared to the budget")
+    args=parser.parse_args()
+
+    runs=[measure("app") for _ in range(args.runs)]
+    import_ms=min(run[0] for run in runs)
+    eager=sorted(set(module for run in runs for module in run[1]))
+
+    report={"import_ms":import_ms,"budget_ms":args.budget_ms,"eager_lazy_modules":eager}
+    print(json.dumps(report,indent=2))
+    if import_ms>args.budget_ms or eager:
+        print("Import time budget exceeded" if import_ms>args.budget_ms
+              else f"Modules meant to load lazily were imported: {eager}",file=sys.stderr)
+        sys.exit(1)
+
+if __name__=="__main__":
+    main()
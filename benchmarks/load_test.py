@@ -0,0 +1,178 @@
+'''
+Open loop HTTP load test of app.py without AWS credentials.
+
+Trains a model on synthetic data, seeds it into a filesystem backed fake S3
+(benchmarks/fake_s3.py), boots app.py against it, waits for
+/readyz and then fires form (POST /) and JSON (POST /predict) requests at a
+fixed target rate. Requests are sent on schedule whether or not earlier ones
+finished and latency is measured from the scheduled send time, so a slow
+server shows up as latency instead of a lower request rate.
+Prints throughput, error rates and p50/p95/p99 latency as JSON.
+The serving path needs no MongoDB, only the model in S3.
+
+run from the project root: python -m benchmarks.load_test --rps 200 --duration 30
+'''
+import argparse
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import numpy as np
+
+from benchmarks.fake_s3 import FakeS3Server
+from benchmarks.synthetic_model import make_synthetic_model,make_vehicle_frame
+from src.entity.compiled_forest import CompiledForest
+from src.entity.config_entity import VehiclePredictorConfig
+from src.utils.main_utils import save_object
+
+def seed_model(root:str,n_rows:int,seed:int,compiled:bool)->None:
+    model=make_synthetic_model(n_rows=n_rows,seed=seed)
+    if compiled:
+        model.compiled_model=CompiledForest.from_forest(model.trained_model_object)
+    config=VehiclePredictorConfig()
+    save_object(os.path.join(root,config.model_bucket_name,config.model_file_path),model)
+
+def start_app(endpoint_url:str,port:int,workers:int,extra_env:dict)->subprocess.Popen:
+    env={**os.environ,
+         "s3_endpoint_url":endpoint_url,
+         "aws_access_key_id":os.environ.get("aws_access_key_id","fake"),
+         "aws_secret_access_key":os.environ.get("aws_secret_access_key","fake"),
+         "app_host":"127.0.0.1",
+         "app_port":str(port),
+         "app_workers":str(workers),
+         **extra_env}
+    # the production entry point, more than one worker runs the prefork launcher
+    return subprocess.Popen([sys.executable,"app.py"],env=env,stdout=subprocess.DEVNULL,stderr=subprocess.DEVNULL)
+
+async def wait_until_ready(client:httpx.AsyncClient,timeout:float)->float:
+    start=time.perf_counter()
+    while time.perf_counter()-start<timeout:
+        try:
+            if (await client.get("/readyz")).status_code==200:
+                return time.perf_counter()-start
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise TimeoutError(f"App did not become ready within {timeout}s")
+
+def is_error(endpoint:str,response:httpx.Response)->bool:
+    if response.status_code!=200:
+        return True
+    # the routes answer errors with 200 and {"status": false}, the form route renders HTML on success
+    if endpoint=="form":
+        return response.headers.get("content-type","").startswith("application/json")
+    return response.json().get("status") is not True
+
+async def send(client:httpx.AsyncClient,endpoint:str,record:dict,scheduled:float,results:list,timeout:float):
+    try:
+        if endpoint=="form":
+            response=await client.post("/",data={k:str(v) for k,v in record.items()},timeout=timeout)
+        else:
+            response=await client.post("/predict",json=record,timeout=timeout)
+        error="error" if is_error(endpoint,response) else None
+    except httpx.TimeoutException:
+        error="timeout"
+    except httpx.HTTPError as e:
+        error=type(e).__name__
+    results.append((endpoint,time.perf_counter()-scheduled,error))
+
+async def run_load(args,base_url:str)->dict:
+    rng=np.random.default_rng(args.seed)
+    records=make_vehicle_frame(args.unique_records,seed=args.seed).to_dict("records")
+    total=int(args.rps*args.duration)
+    # exponential gaps make a Poisson arrival process with the target mean rate
+    send_at=np.cumsum(rng.exponential(1/args.rps,total)) if args.poisson else np.arange(total)/args.rps
+    endpoints=np.where(rng.random(total)<args.form_share,"form","json")
+    record_index=rng.integers(0,len(records),total)
+
+    limits=httpx.Limits(max_connections=args.max_connections,max_keepalive_connections=args.max_connections)
+    async with httpx.AsyncClient(base_url=base_url,limits=limits) as client:
+        ready_seconds=await wait_until_ready(client,args.ready_timeout)
+
+        results,tasks=[],[]
+        start=time.perf_counter()
+        for i in range(total):
+            scheduled=start+send_at[i]
+            delay=scheduled-time.perf_counter()
+            if delay>0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(
+                send(client,str(endpoints[i]),records[record_index[i]],scheduled,results,args.request_timeout)))
+        await asyncio.gather(*tasks)
+        elapsed=time.perf_counter()-start
+
+    return {"ready_seconds":round(ready_seconds,3),"elapsed_seconds":round(elapsed,3),
+            "results":results,"sent":total}
+
+def summarize(results:list,elapsed:float)->dict:
+    latencies=np.array([latency for _,latency,error in results if error is None])*1000
+    errors={}
+    for _,_,error in results:
+        if error is not None:
+            errors[error]=errors.get(error,0)+1
+    summary={
+        "requests":len(results),
+        "ok":int(len(latencies)),
+        "error_rate":round(1-len(latencies)/len(results),6) if results else 0.0,
+        "errors":errors,
+        "throughput_rps":round(len(latencies)/elapsed,2),
+    }
+    if len(latencies):
+        summary["latency_ms"]={name:round(float(np.percentile(latencies,q)),3)
+                               for name,q in (("p50",50),("p95",95),("p99",99))}
+        summary["latency_ms"]["max"]=round(float(latencies.max()),3)
+    return summary
+
+def main():
+    parser=argparse.ArgumentParser(description=__doc__,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rps",type=float,default=100,help="target request rate")
+    parser.add_argument("--duration",type=float,default=20,help="seconds of load")
+    parser.add_argument("--form-share",type=float,default=0.5,help="share of requests sent to the form route")
+    parser.add_argument("--poisson",action="store_true",help="random arrivals instead of a fixed interval")
+    parser.add_argument("--unique-records",type=int,default=5000,help="distinct rows to draw requests from")
+    parser.add_argument("--workers",type=int,default=1,help="app workers, more than one uses the prefork launcher")
+    parser.add_argument("--port",type=int,default=5055)
+    parser.add_argument("--max-connections",type=int,default=256)
+    parser.add_argument("--request-timeout",type=float,default=10)
+    parser.add_argument("--ready-timeout",type=float,default=120)
+    parser.add_argument("--train-rows",type=int,default=20000)
+    parser.add_argument("--no-compiled",action="store_true",help="seed a model without the compiled forest")
+    parser.add_argument("--env",action="append",default=[],metavar="NAME=VALUE",
+                        help="extra environment for the app, e.g. prediction_cache_max_size=0")
+    parser.add_argument("--seed",type=int,default=0)
+    args=parser.parse_args()
+
+    # one log line per request would distort the client side timings
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory(prefix="fake-s3-") as root:
+        seed_model(root,args.train_rows,args.seed,compiled=not args.no_compiled)
+        s3_server=FakeS3Server(root).start()
+        app_process=start_app(s3_server.endpoint_url,args.port,args.workers,
+                              dict(item.split("=",1) for item in args.env))
+        try:
+            run=asyncio.run(run_load(args,f"http://127.0.0.1:{args.port}"))
+        finally:
+            app_process.terminate()
+            app_process.wait(timeout=30)
+            s3_server.shutdown()
+
+    results=run.pop("results")
+    report={
+        "config":{"target_rps":args.rps,"duration":args.duration,"form_share":args.form_share,
+                  "poisson":args.poisson,"workers":args.workers,"compiled":not args.no_compiled,
+                  "env":args.env,"seed":args.seed},
+        **run,
+        "overall":summarize(results,run["elapsed_seconds"]),
+        "endpoints":{endpoint:summarize([r for r in results if r[0]==endpoint],run["elapsed_seconds"])
+                     for endpoint in ("form","json")},
+    }
+    print(json.dumps(report,indent=2))
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,46 @@
+'''
+Measures what one logging.info call on the prediction path costs the caller
+in each log_mode, with and without sampling. Every mode runs in its own
+process since the logger is configured on import.
+
+run from the project root: python -m benchmarks.logging_benchmark
+'''
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+measure_code='''
+import time
+from src.logger import logging, stop_logging
+calls={calls}
+start=time.perf_counter()
+for i in range(calls):
+    logging.info(f"Entered predict_batch method of VehicleDataClassifier class with {{i}} rows")
+caller_seconds=time.perf_counter()-start
+stop_logging()
+print(caller_seconds/calls*1e6)
+'''
+
+modes={
+    "sync":{"log_mode":"sync","log_sample_rate_per_second":"0"},
+    "async":{"log_mode":"async","log_sample_rate_per_second":"0"},
+    "async_sampled":{"log_mode":"async","log_sample_rate_per_second":"20"},
+}
+
+def main():
+    parser=argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls",type=int,default=20000)
+    args=parser.parse_args()
+
+    results={}
+    for name,env in modes.items():
+        output=subprocess.run([sys.executable,"-c",measure_code.format(calls=args.calls)],
+                              env={**os.environ,**env},stdout=subprocess.PIPE,stderr=subprocess.PIPE,
+                              check=True,text=True).stdout
+        results[f"{name}_us_per_call"]=round(float(output.strip().splitlines()[-1]),2)
+    print(json.dumps(results,indent=2))
+
+if __name__=="__main__":
+    main()
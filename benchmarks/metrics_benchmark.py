@@ -0,0 +1,50 @@
+'''
+Measures the cost of one metrics observation on the prediction path
+(histogram observe including the perf_counter call around the timed stage)
+and of rendering /metrics.
+
+run from the project root: python -m benchmarks.metrics_benchmark
+'''
+import argparse
+import json
+import time
+
+from src.utils.metrics import Histogram,render_metrics
+
+def main():
+    parser=argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--observations",type=int,default=1_000_000)
+    args=parser.parse_args()
+
+    histogram=Histogram("benchmark_stage_seconds","benchmark only",label_names=("stage",))
+    child=histogram.labels("stage")
+    perf_counter=time.perf_counter
+
+    start=perf_counter()
+    for _ in range(args.observations):
+        pass
+    loop_seconds=perf_counter()-start
+
+    start=perf_counter()
+    for _ in range(args.observations):
+        child.observe(0.0003)
+    observe_seconds=perf_counter()-start-loop_seconds
+
+    start=perf_counter()
+    for _ in range(args.observations):
+        stage_start=perf_counter()
+        child.observe(perf_counter()-stage_start)
+    timed_seconds=perf_counter()-start-loop_seconds
+
+    start=perf_counter()
+    render_metrics()
+    render_seconds=perf_counter()-start
+
+    print(json.dumps({
+        "observe_ns":round(observe_seconds/args.observations*1e9,1),
+        "timed_observe_ns":round(timed_seconds/args.observations*1e9,1),
+        "render_metrics_ms":round(render_seconds*1e3,3),
+    },indent=2))
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,78 @@
+'''
+Compares the dill pickle of a MyModel with the compact array format
+(src/entity/compact_model.py): artifact size, load time in a warm process,
+load time in a fresh process (imports included, sklearn is not needed for the
+compact format) and checks both give the same predictions.
+
+run from the project root: python -m benchmarks.model_format_benchmark --train-rows 100000
+'''
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.synthetic_model import make_synthetic_model,make_vehicle_frame
+from src.entity.compiled_forest import CompiledForest
+from src.pipeline.prediction_pipeline import VehicleFastPredictor
+from src.utils.main_utils import load_object,save_object
+
+def best_seconds(func,repeat:int)->float:
+    best=float("inf")
+    for _ in range(repeat):
+        start=time.perf_counter()
+        func()
+        best=min(best,time.perf_counter()-start)
+    return best
+
+def cold_load_seconds(path:str)->float:
+    code=("import time;start=time.perf_counter();"
+          "from src.utils.main_utils import load_object;load_object(__import__('sys').argv[1]);"
+          "print(time.perf_counter()-start)")
+    output=subprocess.run([sys.executable,"-c",code,path],check=True,capture_output=True,text=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+def main():
+    parser=argparse.ArgumentParser(description=__doc__,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--train-rows",type=int,default=100000)
+    parser.add_argument("--rows",type=int,default=2000,help="rows scored for the parity check")
+    parser.add_argument("--repeat",type=int,default=3)
+    args=parser.parse_args()
+
+    logging.disable(logging.INFO)
+    model=make_synthetic_model(n_rows=args.train_rows)
+    model.compiled_model=CompiledForest.from_forest(model.trained_model_object)
+    frame=make_vehicle_frame(args.rows,seed=11)
+
+    report={"train_rows":args.train_rows}
+    with tempfile.TemporaryDirectory() as work_dir:
+        paths={"dill":os.path.join(work_dir,"model.pkl"),"compact":os.path.join(work_dir,"model.npz")}
+        save_object(paths["dill"],model)
+        save_object(paths["compact"],model,compact=True)
+
+        loaded={name:load_object(path) for name,path in paths.items()}
+        expected_labels,expected_proba=loaded["dill"].predict_with_proba(frame)
+        labels,proba=loaded["compact"].predict_with_proba(frame)
+        assert np.array_equal(expected_labels,labels),"compact model predicts other labels"
+        # the compact model scores every batch with the compiled forest, equal to sklearn up to summation rounding
+        assert np.allclose(expected_proba,proba,rtol=0,atol=1e-12),"compact model probabilities differ"
+        features=frame.to_numpy(dtype=np.float64)
+        assert np.array_equal(VehicleFastPredictor(loaded["dill"]).predict_features_with_proba(features)[1],
+                              VehicleFastPredictor(loaded["compact"]).predict_features_with_proba(features)[1])
+        report["same_predictions"]=True
+
+        for name,path in paths.items():
+            report[name]={"size_mb":round(os.path.getsize(path)/1024/1024,2),
+                          "load_ms":round(best_seconds(lambda:load_object(path),args.repeat)*1000,1),
+                          "cold_process_load_ms":round(min(cold_load_seconds(path) for _ in range(args.repeat))*1000,1)}
+    for metric in ("size_mb","load_ms","cold_process_load_ms"):
+        report[f"{metric}_ratio"]=round(report["dill"][metric]/report["compact"][metric],2)
+    print(json.dumps(report,indent=2))
+
+if __name__=="__main__":
+    main()
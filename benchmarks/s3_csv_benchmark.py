@@ -0,0 +1,116 @@
+'''
+Peak memory and time of reading a large CSV export in the raw schema of
+config/schema.yaml through the fake S3 (benchmarks/fake_s3.py):
+
+read_object  the old path, whole body read, decoded to one str, StringIO, read_csv
+read_csv     SimpleStorageService.read_csv, the body streamed into pandas
+schema       read_csv with usecols and the schema dtypes (categories instead of strings)
+chunks       iter_csv_chunks with usecols and schema dtypes, one chunk held at a time
+
+Every read runs in a fresh process so its peak RSS growth can be measured.
+
+run from the project root: python -m benchmarks.s3_csv_benchmark --rows 1000000
+'''
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from io import StringIO
+
+import numpy as np
+import pandas as pd
+
+bucket_name="benchmark-bucket"
+csv_key="exports/vehicle_data.csv"
+feature_columns=["Gender","Age","Driving_License","Region_Code","Previously_Insured","Vehicle_Age",
+                 "Vehicle_Damage","Annual_Premium","Policy_Sales_Channel","Vintage"]
+
+def make_raw_frame(n_rows:int,seed:int=0)->pd.DataFrame:
+    rng=np.random.default_rng(seed)
+    return pd.DataFrame({
+        "id":np.arange(1,n_rows+1),
+        "Gender":rng.choice(["Male","Female"],n_rows),
+        "Age":rng.integers(20,85,n_rows),
+        "Driving_License":rng.integers(0,2,n_rows),
+        "Region_Code":rng.integers(0,53,n_rows).astype(float),
+        "Previously_Insured":rng.integers(0,2,n_rows),
+        "Vehicle_Age":rng.choice(["< 1 Year","1-2 Year","> 2 Years"],n_rows),
+        "Vehicle_Damage":rng.choice(["Yes","No"],n_rows),
+        "Annual_Premium":rng.uniform(2630,100000,n_rows).round(1),
+        "Policy_Sales_Channel":rng.integers(1,164,n_rows).astype(float),
+        "Vintage":rng.integers(10,300,n_rows),
+        "Response":rng.integers(0,2,n_rows),
+    })
+
+def peak_rss_mb()->float:
+    # VmHWM belongs to the address space, unlike ru_maxrss it does not carry over the parent's peak
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1])/1024
+    return float("nan")
+
+def read_once(mode:str,chunk_rows:int)->dict:
+    # runs in the child process, the environment points src at the fake S3
+    from src.cloud_storage.aws_storage import SimpleStorageService
+    storage=SimpleStorageService()
+    baseline=peak_rss_mb()
+    start=time.perf_counter()
+    if mode=="read_object":
+        body=storage.read_object(storage.s3_resource.Object(bucket_name,csv_key),make_readable=True)
+        rows=len(pd.read_csv(body,na_values="na"))
+    elif mode=="read_csv":
+        rows=len(storage.read_csv(csv_key,bucket_name))
+    elif mode=="schema":
+        rows=len(storage.read_csv(csv_key,bucket_name,usecols=feature_columns,schema_dtypes=True))
+    else:
+        rows=sum(len(chunk) for chunk in storage.iter_csv_chunks(csv_key,bucket_name,chunk_rows,
+                                                                 usecols=feature_columns,schema_dtypes=True))
+    return {"seconds":round(time.perf_counter()-start,2),"peak_rss_growth_mb":round(peak_rss_mb()-baseline,1),
+            "rows":rows}
+
+def run_child(mode:str,chunk_rows:int,env:dict)->dict:
+    output=subprocess.run([sys.executable,"-m","benchmarks.s3_csv_benchmark","--read-mode",mode,
+                           "--chunk-rows",str(chunk_rows)],env=env,check=True,capture_output=True,text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser=argparse.ArgumentParser(description=__doc__,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows",type=int,default=1000000)
+    parser.add_argument("--chunk-rows",type=int,default=50000)
+    parser.add_argument("--port",type=int,default=9138)
+    parser.add_argument("--read-mode",help=argparse.SUPPRESS)
+    args=parser.parse_args()
+
+    logging.disable(logging.INFO)
+    if args.read_mode:
+        print(json.dumps(read_once(args.read_mode,args.chunk_rows)))
+        return
+
+    env={**os.environ,
+         "s3_endpoint_url":f"http://127.0.0.1:{args.port}",
+         "aws_access_key_id":os.environ.get("aws_access_key_id","fake"),
+         "aws_secret_access_key":os.environ.get("aws_secret_access_key","fake")}
+    with tempfile.TemporaryDirectory(prefix="fake-s3-") as root:
+        csv_path=os.path.join(root,bucket_name,*csv_key.split("/"))
+        os.makedirs(os.path.dirname(csv_path))
+        make_raw_frame(args.rows).to_csv(csv_path,index=False)
+
+        s3_server=subprocess.Popen([sys.executable,"-m","benchmarks.fake_s3","--root",root,"--port",str(args.port)],
+                                   stdout=subprocess.DEVNULL)
+        try:
+            time.sleep(1)
+            read={mode:run_child(mode,args.chunk_rows,env) for mode in ("read_object","read_csv","schema","chunks")}
+        finally:
+            s3_server.terminate()
+            s3_server.wait()
+
+        print(json.dumps({"csv_mb":round(os.path.getsize(csv_path)/1024/1024,1),"chunk_rows":args.chunk_rows,
+                          "read":read},indent=2))
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler,MinMaxScaler
+
+from src.constants import schema_file_path
+from src.entity.config_entity import ModelTrainerConfig
+from src.entity.estimator import MyModel
+from src.pipeline.prediction_pipeline import VehicleData
+from src.utils.main_utils import read_yaml_file
+
+def make_vehicle_frame(n_rows:int,seed:int=0)->pd.DataFrame:
+    '''
+    Random model input rows with the columns and value ranges of the vehicle data
+    '''
+    rng=np.random.default_rng(seed)
+    vehicle_age=rng.integers(0,3,n_rows)
+    return pd.DataFrame({
+        "Gender":rng.integers(0,2,n_rows),
+        "Age":rng.integers(20,85,n_rows),
+        "Driving_License":rng.integers(0,2,n_rows),
+        "Region_Code":rng.integers(0,53,n_rows).astype(float),
+        "Previously_Insured":rng.integers(0,2,n_rows),
+        "Annual_Premium":rng.uniform(2630,90000,n_rows).round(2),
+        "Policy_Sales_Channel":rng.integers(1,164,n_rows).astype(float),
+        "Vintage":rng.integers(10,300,n_rows),
+        "Vehicle_Age_lt_1_Year":(vehicle_age==0).astype(int),
+        "Vehicle_Age_gt_2_Years":(vehicle_age==2).astype(int),
+        "Vehicle_Damage_Yes":rng.integers(0,2,n_rows),
+    })[list(VehicleData.feature_dtypes)]
+
+def make_synthetic_model(n_rows:int=20000,seed:int=0)->MyModel:
+    '''
+    Trains a MyModel on synthetic rows with the same preprocessing and forest
+    settings as the training pipeline, so benchmarks need no MongoDB or S3
+    '''
+    schema_config=read_yaml_file(file_path=schema_file_path)
+    model_trainer_config=ModelTrainerConfig()
+
+    x=make_vehicle_frame(n_rows,seed)
+    rng=np.random.default_rng(seed+1)
+    y=((x["Previously_Insured"]==0)&(x["Vehicle_Damage_Yes"]==1)&(x["Age"]>30)).astype(float).to_numpy()
+    y=np.where(rng.random(n_rows)<0.1,1-y,y)
+
+    preprocessor=Pipeline(steps=[("Preprocessor",ColumnTransformer(
+        transformers=[
+            ("StandardScaler",StandardScaler(),schema_config['ss_features']),
+            ("MinMaxScaler",MinMaxScaler(),schema_config['mm_features'])
+        ],
+        remainder='passthrough'
+    ))])
+    x_arr=preprocessor.fit_transform(x)
+
+    model=RandomForestClassifier(
+        n_estimators=model_trainer_config.n_estimators,
+        min_samples_split=model_trainer_config.min_samples_split,
+        min_samples_leaf=model_trainer_config.min_samples_leaf,
+        max_depth=model_trainer_config.max_depth,
+        criterion=model_trainer_config.criterion,
+        random_state=model_trainer_config.random_state
+    )
+    model.fit(x_arr,y)
+    return MyModel(preprocessing_obj=preprocessor,trained_model_object=model)
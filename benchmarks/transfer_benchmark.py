@@ -0,0 +1,122 @@
+'''
+Upload and load time and peak memory of a large model through the fake S3
+(benchmarks/fake_s3.py):
+
+upload: one single threaded stream vs parallel multipart (s3_max_concurrency)
+load:   read_loads   the old path, whole body read into bytes then pickle.loads
+        stream       pickle.load straight from the response stream
+        ranged_cache SimpleStorageService.load_model with the model cache, a HEAD
+                     then parallel ranged GETs into the cache file and pickle.load from it
+
+Every load runs in a fresh process so its peak RSS growth can be measured.
+
+run from the project root: python -m benchmarks.transfer_benchmark --train-rows 200000
+'''
+import argparse
+import io
+import json
+import logging
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import time
+
+bucket_name="benchmark-bucket"
+model_key="model.pkl"
+
+def peak_rss_mb()->float:
+    # VmHWM belongs to the address space, unlike ru_maxrss it does not carry over the parent's peak
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1])/1024
+    return float("nan")
+
+def load_once(mode:str)->dict:
+    # runs in the child process, the environment points src at the fake S3
+    from src.cloud_storage.aws_storage import SimpleStorageService
+    storage=SimpleStorageService()
+    client=storage.s3_resource.meta.client
+    # imported up front so the peak growth is the model and its transfer buffers only
+    import sklearn.compose,sklearn.ensemble,sklearn.pipeline,sklearn.preprocessing
+    import src.entity.estimator
+    baseline=peak_rss_mb()
+    start=time.perf_counter()
+    if mode=="read_loads":
+        model=pickle.loads(client.get_object(Bucket=bucket_name,Key=model_key)["Body"].read())
+    elif mode=="stream":
+        body=client.get_object(Bucket=bucket_name,Key=model_key)["Body"]
+        model=pickle.load(io.BufferedReader(body,buffer_size=1024*1024))
+    else:
+        model=storage.load_model(model_key,bucket_name)
+    seconds=time.perf_counter()-start
+    return {"seconds":round(seconds,3),"peak_rss_growth_mb":round(peak_rss_mb()-baseline,1),
+            "model":type(model).__name__}
+
+def run_child(mode:str,env:dict)->dict:
+    output=subprocess.run([sys.executable,"-m","benchmarks.transfer_benchmark","--load-mode",mode],
+                          env=env,check=True,capture_output=True,text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser=argparse.ArgumentParser(description=__doc__,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--train-rows",type=int,default=200000,help="more rows grow a larger forest")
+    parser.add_argument("--port",type=int,default=9137)
+    parser.add_argument("--chunksize-mb",type=int,default=8)
+    parser.add_argument("--max-concurrency",type=int,default=8)
+    parser.add_argument("--load-mode",help=argparse.SUPPRESS)
+    args=parser.parse_args()
+
+    logging.disable(logging.INFO)
+    if args.load_mode:
+        print(json.dumps(load_once(args.load_mode)))
+        return
+
+    env={**os.environ,
+         "s3_endpoint_url":f"http://127.0.0.1:{args.port}",
+         "aws_access_key_id":os.environ.get("aws_access_key_id","fake"),
+         "aws_secret_access_key":os.environ.get("aws_secret_access_key","fake"),
+         "s3_multipart_threshold_mb":str(args.chunksize_mb),
+         "s3_multipart_chunksize_mb":str(args.chunksize_mb),
+         "s3_max_concurrency":str(args.max_concurrency)}
+    # src reads its settings on import
+    os.environ.update(env)
+    from benchmarks.synthetic_model import make_synthetic_model
+    with tempfile.TemporaryDirectory(prefix="fake-s3-") as root,tempfile.TemporaryDirectory() as work_dir:
+        os.makedirs(os.path.join(root,bucket_name))
+        model_path=os.path.join(work_dir,model_key)
+        with open(model_path,"wb") as model_file:
+            pickle.dump(make_synthetic_model(n_rows=args.train_rows),model_file)
+
+        s3_server=subprocess.Popen([sys.executable,"-m","benchmarks.fake_s3","--root",root,"--port",str(args.port)],
+                                   stdout=subprocess.DEVNULL)
+        try:
+            time.sleep(1)
+            from boto3.s3.transfer import TransferConfig
+            from src.cloud_storage.aws_storage import SimpleStorageService
+            storage=SimpleStorageService()
+            client=storage.s3_resource.meta.client
+
+            upload={}
+            for name,config in (("single_stream",TransferConfig(use_threads=False,multipart_threshold=1<<40)),
+                                ("parallel_multipart",storage.transfer_config)):
+                start=time.perf_counter()
+                client.upload_file(model_path,bucket_name,model_key,Config=config)
+                upload[name]={"seconds":round(time.perf_counter()-start,3)}
+
+            load={}
+            for mode in ("read_loads","stream","ranged_cache"):
+                with tempfile.TemporaryDirectory() as cache_dir:
+                    load[mode]=run_child(mode,{**env,"model_cache_dir":cache_dir})
+        finally:
+            s3_server.terminate()
+            s3_server.wait()
+
+        print(json.dumps({"model_mb":round(os.path.getsize(model_path)/1024/1024,1),
+                          "chunksize_mb":args.chunksize_mb,"max_concurrency":args.max_concurrency,
+                          "upload":upload,"load":load},indent=2))
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,21 @@
+import argparse
+
+from src.entity.config_entity import BulkScoringConfig
+from src.pipeline.bulk_scoring_pipeline import BulkScoringPipeline
+
+default_config=BulkScoringConfig()
+
+parser=argparse.ArgumentParser(description="Score a MongoDB collection with the production model and write the predictions back")
+parser.add_argument("--collection",default=default_config.collection_name,help="collection to score")
+parser.add_argument("--output-collection",default=default_config.output_collection_name,
+                    help=f"collection to write predictions to, defaults to {default_config.output_collection_name}")
+parser.add_argument("--chunk-rows",type=int,default=default_config.chunk_rows,help="documents scored per chunk")
+parser.add_argument("--workers",type=int,default=default_config.workers,help="worker processes, each holds one model copy")
+parser.add_argument("--restart",action="store_true",help="ignore the checkpoint and score the whole collection again")
+args=parser.parse_args()
+
+pipeline=BulkScoringPipeline(BulkScoringConfig(collection_name=args.collection,
+                                               output_collection_name=args.output_collection,
+                                               chunk_rows=args.chunk_rows,
+                                               workers=args.workers))
+pipeline.run_pipeline(restart=args.restart)
@@ -0,0 +1,112 @@
+import asyncio
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable,Optional,Tuple,TypeVar,Union
+
+from src.cloud_storage.aws_storage import SimpleStorageService
+from src.constants import (model_load_timeout_seconds,s3_async_max_workers,s3_async_timeout_seconds,
+                           s3_connect_timeout_seconds,s3_max_attempts,s3_read_timeout_seconds)
+from src.exception import MyException
+from src.logger import logging
+
+T=TypeVar("T")
+
+class AsyncSimpleStorageService:
+    '''
+    asyncio variant of SimpleStorageService for the serving process. botocore blocks,
+    so every call runs on a small thread pool of its own that shares the pooled
+    connections of the s3 client: a slow S3 neither blocks the event loop nor holds
+    the threads that handle requests and run inference, and the caller stops waiting
+    after timeout seconds
+    '''
+    # shared by every instance, like the s3 client and its connection pool
+    _executor:ThreadPoolExecutor=None
+    _executor_lock=threading.Lock()
+    # calls the caller stopped waiting for that still hold an S3 thread
+    timed_out_running:int=0
+    _timed_out_lock=threading.Lock()
+
+    def __init__(self,storage:SimpleStorageService=None,timeout:float=s3_async_timeout_seconds,
+                 load_timeout:float=model_load_timeout_seconds):
+        self.storage=storage or SimpleStorageService()
+        self.timeout=timeout
+        self.load_timeout=load_timeout
+
+    @classmethod
+    def reset(cls)->None:
+        '''
+        Forgets the pool of the parent process, its threads do not exist in a forked child
+        '''
+        cls._executor=None
+        cls._executor_lock=threading.Lock()
+        cls.timed_out_running=0
+        cls._timed_out_lock=threading.Lock()
+
+    @classmethod
+    def get_executor(cls)->ThreadPoolExecutor:
+        if cls._executor is None:
+            with cls._executor_lock:
+                if cls._executor is None:
+                    cls._executor=ThreadPoolExecutor(max_workers=s3_async_max_workers,thread_name_prefix="s3")
+        return cls._executor
+
+    async def run(self,func:Callable[...,T],*args,timeout:Optional[float]=None,**kwargs)->T:
+        '''
+        Runs a blocking S3 call on the S3 threads and waits for it at most timeout seconds
+        (the instance default if None). A call that times out while queued is dropped, one
+        already running keeps its thread until botocore's own connect and read timeouts
+        end it, those threads are counted in timed_out_running and logged
+        '''
+        timeout=self.timeout if timeout is None else timeout
+        call_future=self.get_executor().submit(partial(func,*args,**kwargs))
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(call_future),timeout)
+        except asyncio.TimeoutError as e:
+            # cancelling the wrapper cancelled the call unless it was already running
+            if not call_future.done():
+                self._track_timed_out(call_future,getattr(func,'__name__',func))
+            raise TimeoutError(f"S3 call {getattr(func,'__name__',func)} did not finish within {timeout}s") from e
+
+    @classmethod
+    def _track_timed_out(cls,call_future,name)->None:
+        with cls._timed_out_lock:
+            cls.timed_out_running+=1
+            running=cls.timed_out_running
+        logging.warning(f"S3 call {name} timed out but still holds an S3 thread, {running} of {s3_async_max_workers} "
+                        f"threads busy with timed out calls for up to "
+                        f"{(s3_connect_timeout_seconds+s3_read_timeout_seconds)*s3_max_attempts:.0f}s each")
+
+        def release(_)->None:
+            with cls._timed_out_lock:
+                cls.timed_out_running-=1
+                running=cls.timed_out_running
+            logging.info(f"Timed out S3 call {name} finished, {running} threads still busy with timed out calls")
+        call_future.add_done_callback(release)
+
+    async def head_object(self,bucket_name:str,s3_key:str,use_cache:bool=True)->Optional[dict]:
+        try:
+            return await self.run(self.storage.head_object,bucket_name,s3_key,use_cache=use_cache)
+        except Exception as e:
+            raise MyException(e,sys) from e
+
+    async def get_object_metadata(self,bucket_name:str,s3_key:str)->dict:
+        try:
+            return await self.run(self.storage.get_object_metadata,bucket_name=bucket_name,s3_key=s3_key)
+        except Exception as e:
+            raise MyException(e,sys) from e
+
+    async def load_model(self,model_name:str,bucket_name:str,model_dir:str=None,
+                         with_metadata:bool=False)->Union[object,Tuple[object,dict]]:
+        '''
+        Downloads (or revalidates the cached copy of) and loads a model, waiting at most load_timeout
+        '''
+        try:
+            return await self.run(self.storage.load_model,model_name,bucket_name,model_dir,
+                                  with_metadata=with_metadata,timeout=self.load_timeout)
+        except Exception as e:
+            raise MyException(e,sys) from e
+
+os.register_at_fork(after_in_child=AsyncSimpleStorageService.reset)
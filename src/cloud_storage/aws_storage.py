@@ -1,16 +1,23 @@
-import boto3
 from src.configuration.aws_connection import S3Client
 from io import StringIO
-from typing import Union,List
-import os,sys
+from typing import TYPE_CHECKING,Iterator,Optional,Sequence,Union,List,Tuple
+import io,os,shutil,sys
 from src.logger import logging
-# import Bucket type
-from mypy_boto3_s3.service_resource import Bucket
+# import Bucket type, only for type checkers
+if TYPE_CHECKING:
+    from mypy_boto3_s3.service_resource import Bucket
 
 from src.exception import MyException
-from botocore.exceptions import ClientError
 from pandas import DataFrame,read_csv
-import pickle
+from time import perf_counter
+
+from src.cloud_storage.metadata_cache import S3MetadataCache
+from src.cloud_storage.model_cache import ModelCache
+from src.entity.compact_model import load_model_file
+from src.constants import (model_cache_dir,s3_max_concurrency,s3_metadata_cache_ttl_seconds,
+                           s3_multipart_chunksize_mb,s3_multipart_threshold_mb,schema_file_path)
+from src.utils.main_utils import get_schema_dtypes,read_yaml_file
+from src.utils.metrics import model_cache_lookups_total,s3_model_fetch_seconds
 
 
 class SimpleStorageService:
@@ -18,26 +25,88 @@ class SimpleStorageService:
     class for interacting with AWS s3 storage, providing methods for file management,
     data uploads, and data retrieval in S3 buckets.
     '''
+    # shared by every instance, estimators and components each create their own
+    metadata_cache=S3MetadataCache(s3_metadata_cache_ttl_seconds)
 
     def __init__(self):
 
+        self._connect()
+        self.model_cache=ModelCache(model_cache_dir) if model_cache_dir else None
+        from boto3.s3.transfer import TransferConfig
+        self.transfer_config=TransferConfig(multipart_threshold=s3_multipart_threshold_mb*1024*1024,
+                                            multipart_chunksize=s3_multipart_chunksize_mb*1024*1024,
+                                            max_concurrency=s3_max_concurrency,
+                                            use_threads=s3_max_concurrency>1)
+
+    def _connect(self)->None:
         s3_client=S3Client()
-        self.s3_resource=s3_client.s3_resource
-        self.s3_client=s3_client.s3_client
+        self._s3_resource=s3_client.s3_resource
+        self._s3_client=s3_client.s3_client
+        self._pid=os.getpid()
+
+    @property
+    def s3_resource(self):
+        '''
+        The boto3 resource, connected again in a forked child (e.g. a prefork worker of
+        a storage created by the master), the parent's pooled sockets are not shared
+        '''
+        if self._pid!=os.getpid():
+            self._connect()
+        return self._s3_resource
+
+    @property
+    def s3_client(self):
+        if self._pid!=os.getpid():
+            self._connect()
+        return self._s3_client
 
     def s3_key_path_available(self,bucket_name,s3_key)->bool:
         '''
         check if specified s3_key(s3 key path){file_path} 
-        is available in specified bucket
+        is available in specified bucket, as an object or as a prefix of objects.
+        An exact key costs one HEAD request, a prefix at most one single key
+        LIST page, both answers are cached
         '''
         try:
-            # get_bucket is defined later
-            bucket=self.get_bucket(bucket_name)
-            file_objects=[file_object for file_object in bucket.objects.filter(Prefix=s3_key)]
-            return len(file_objects)>0
+            if self.head_object(bucket_name,s3_key) is not None:
+                return True
+
+            # not an object, it may still be a "folder" of other objects
+            found,available=self.metadata_cache.get(bucket_name,s3_key,kind="prefix")
+            if not found:
+                available=next(self.iter_objects(bucket_name,s3_key,page_size=1),None) is not None
+                self.metadata_cache.put(bucket_name,s3_key,available,kind="prefix")
+            return available
         
         except Exception as e:
             raise MyException(e,sys) from e
+
+    def head_object(self,bucket_name:str,s3_key:str,use_cache:bool=True)->Optional[dict]:
+        '''
+        ETag and LastModified of an exact key with one HEAD request, None if there is
+        no such object. Answers, missing keys included, are cached for
+        s3_metadata_cache_ttl_seconds unless use_cache is False
+        '''
+        if use_cache:
+            found,metadata=self.metadata_cache.get(bucket_name,s3_key)
+            if found:
+                return metadata
+
+        from botocore.exceptions import ClientError
+        try:
+            metadata=self._response_metadata(self.s3_resource.meta.client.head_object(Bucket=bucket_name,Key=s3_key))
+        except ClientError as e:
+            if e.response.get("ResponseMetadata",{}).get("HTTPStatusCode")!=404:
+                raise
+            metadata=None
+        self.metadata_cache.put(bucket_name,s3_key,metadata)
+        return metadata
+
+    def iter_objects(self,bucket_name:str,prefix:str,page_size:int=1000)->Iterator[object]:
+        '''
+        Yields the objects under prefix, fetching LIST pages of page_size keys only as they are consumed
+        '''
+        yield from self.get_bucket(bucket_name).objects.filter(Prefix=prefix).page_size(page_size)
     
     @staticmethod
     def read_object(object_name:str,decode:bool=True,make_readable:bool=False)->Union[StringIO,str]:
@@ -66,7 +135,7 @@ class SimpleStorageService:
         except Exception as e:
             raise MyException(e,sys) from e
         
-    def get_bucket(self,bucket_name:str)->Bucket:
+    def get_bucket(self,bucket_name:str)->"Bucket":
         logging.info("Entered the get_bucket method of SSS class")
         try:
             bucket=self.s3_resource.Bucket(bucket_name)
@@ -78,7 +147,8 @@ class SimpleStorageService:
         
     def get_file_object(self,filename:str,bucket_name:str)->Union[List[object],object]:
         '''
-        retrieves the file object(s) from bucket name 
+        retrieves the file object(s) from bucket name, an exact key is
+        found with a (cached) HEAD request instead of listing the prefix
         
         Args:
         filename(str): the name of file to retrieve
@@ -90,31 +160,147 @@ class SimpleStorageService:
         logging.info("Entered the get_file_object method of SSS class")
 
         try:
-            bucket=self.get_bucket(bucket_name)
-            file_objects=[file_object for file_object in bucket.objects.filter(Prefix=filename)]
-            func= lambda x:x[0] if len(x)==1 else x
-            file_objs=func(file_objects)
+            if self.head_object(bucket_name,filename) is not None:
+                file_objs=self.s3_resource.Object(bucket_name,filename)
+            else:
+                file_objects=list(self.iter_objects(bucket_name,filename))
+                func= lambda x:x[0] if len(x)==1 else x
+                file_objs=func(file_objects)
             logging.info("Exited the get_file_object method of SSS class")
             return file_objs
         
         except Exception as e:
             raise MyException(e,sys) from e
         
-    def load_model(self,model_name:str,bucket_name:str,model_dir:str=None)->object:
+    def get_object_metadata(self,bucket_name:str,s3_key:str)->dict:
+        '''
+        Returns the ETag and LastModified of an object with a single HEAD request,
+        without downloading it. Always asks s3, change detection must not see a cached answer
         '''
-        Load a serialized model
+        try:
+            metadata=self.head_object(bucket_name,s3_key,use_cache=False)
+            if metadata is None:
+                raise FileNotFoundError(f"s3://{bucket_name}/{s3_key} does not exist")
+            return metadata
+
+        except Exception as e:
+            raise MyException(e,sys) from e
+
+    @staticmethod
+    def _response_metadata(response:dict)->dict:
+        return {"etag":response["ETag"].strip('"'),
+                "last_modified":response["LastModified"].isoformat()}
+
+    def _download_pinned(self,bucket_name:str,model_file:str,head:dict,cache_file)->None:
+        '''
+        Downloads the object version the HEAD response describes, every GET carries
+        If-Match with its ETag so an object replaced meanwhile fails with 412
+        instead of caching new bytes under the old ETag
+        '''
+        client=self.s3_resource.meta.client
+        if head["ContentLength"]<self.transfer_config.multipart_threshold:
+            body=client.get_object(Bucket=bucket_name,Key=model_file,IfMatch=head["ETag"])["Body"]
+            shutil.copyfileobj(body,cache_file,1024*1024)
+            return
+
+        # large objects arrive as parallel ranged GETs, the transfer manager pins them to the
+        # ETag it is given (download_fileobj does not accept IfMatch and would HEAD again)
+        from boto3.s3.transfer import create_transfer_manager
+        from botocore.exceptions import ClientError
+        from s3transfer.exceptions import S3DownloadFailedError
+        from s3transfer.subscribers import BaseSubscriber
+
+        class ProvideHead(BaseSubscriber):
+            def on_queued(self,future,**kwargs):
+                future.meta.provide_transfer_size(head["ContentLength"])
+                future.meta.provide_object_etag(head["ETag"])
+
+        try:
+            with create_transfer_manager(client,self.transfer_config) as manager:
+                manager.download(bucket_name,model_file,cache_file,subscribers=[ProvideHead()]).result()
+        except S3DownloadFailedError as e:
+            # s3transfer wraps the 412 of a ranged GET, surface it like the single GET's
+            if isinstance(e.__context__,ClientError):
+                raise e.__context__ from e
+            raise
+
+    def _load_cached_model(self,model_file:str,bucket_name:str,retries:int=2)->Tuple[object,dict]:
+        '''
+        Revalidates the last good local copy with a conditional HEAD (If-None-Match), downloads
+        the object only when it changed and serves the local copy when s3 fails
+        '''
+        from botocore.exceptions import ClientError
+        client=self.s3_resource.meta.client
+        entry=self.model_cache.get_last_good(bucket_name,model_file)
+        request={"Bucket":bucket_name,"Key":model_file}
+        if entry is not None:
+            request["IfNoneMatch"]=f'"{entry["etag"]}"'
+        try:
+            head=client.head_object(**request)
+            metadata=self._response_metadata(head)
+            # the model is unpickled from the file without a copy in memory
+            path=self.model_cache.write_object(bucket_name,model_file,metadata["etag"],
+                lambda cache_file:self._download_pinned(bucket_name,model_file,head,cache_file))
+            model=self.model_cache.load(path)
+
+        except Exception as e:
+            # ClientError carries the HTTP status, connection errors and timeouts do not
+            status=e.response.get("ResponseMetadata",{}).get("HTTPStatusCode") if isinstance(e,ClientError) else None
+            # the object was replaced between the HEAD and the download, start over with the new one
+            if status==412 and retries>0:
+                logging.info(f"s3://{bucket_name}/{model_file} changed during its download, downloading it again")
+                return self._load_cached_model(model_file,bucket_name,retries=retries-1)
+            # a deleted object is not papered over with the cached copy
+            if entry is None or status in (404,412):
+                raise
+            metadata={"etag":entry["etag"],"last_modified":entry["last_modified"]}
+            if status==304:
+                try:
+                    model=self.model_cache.load(entry["path"])
+                except Exception as load_error:
+                    logging.warning(f"Cached model {entry['path']} is unreadable ({load_error}), downloading it again")
+                    self.model_cache.forget(bucket_name,model_file)
+                    return self._load_cached_model(model_file,bucket_name)
+                model_cache_lookups_total.labels("hit").inc()
+                logging.info(f"Model cache hit for s3://{bucket_name}/{model_file}, "
+                             f"not modified ({self.model_cache.describe_staleness(entry)})")
+                return model,metadata
+            self.model_cache.log_fallback(bucket_name,model_file,entry,e)
+            model_cache_lookups_total.labels("fallback").inc()
+            return self.model_cache.load(entry["path"]),metadata
+
+        self.model_cache.mark_good(bucket_name,model_file,metadata)
+        model_cache_lookups_total.labels("miss").inc()
+        logging.info(f"Model cache miss for s3://{bucket_name}/{model_file}, downloaded "
+                     f"{os.path.getsize(path)} bytes with ETag {metadata['etag']}"
+                     +(f" replacing {entry['etag']}" if entry else ""))
+        return model,metadata
+
+    def load_model(self,model_name:str,bucket_name:str,model_dir:str=None,
+                   with_metadata:bool=False)->Union[object,Tuple[object,dict]]:
+        '''
+        Load a serialized model, pickled or in the compact format, through the local
+        model cache unless model_cache_dir is ""
 
         args: model_dir(str): Directory path with in the bucket
+        with_metadata: also return the ETag and LastModified of the loaded object
         '''
         try:
+            start=perf_counter()
             model_file=model_dir+"/"+model_name if model_dir else model_name
-            file_object=self.get_file_object(model_file,bucket_name)
-            model_obj=self.read_object(file_object,decode=False)
-            model=pickle.loads(model_obj)
+            if self.model_cache is not None:
+                model,metadata=self._load_cached_model(model_file,bucket_name)
+            else:
+                response=self.s3_resource.meta.client.get_object(Bucket=bucket_name,Key=model_file)
+                # unpickled straight from the response stream, the body is never held as one bytes copy
+                model=load_model_file(io.BufferedReader(response["Body"],buffer_size=1024*1024))
+                metadata=self._response_metadata(response)
+            s3_model_fetch_seconds.observe(perf_counter()-start)
+            self.metadata_cache.put(bucket_name,model_file,metadata)
             logging.info("Production model loaded from S3 bucket")
-            
-            return model
-        
+
+            return (model,metadata) if with_metadata else model
+
         except Exception as e:
             raise MyException(e,sys) from e
         
@@ -123,6 +309,7 @@ class SimpleStorageService:
         Creates a folder in specified S3 bucket
         '''
         logging.info("Entered the create folder method of SSS class")
+        from botocore.exceptions import ClientError
         try:
             self.s3_resource.Object(bucket_name,folder_name).load()
 
@@ -130,6 +317,7 @@ class SimpleStorageService:
             if e.response["Error"]["Code"]=='404':
                 folder_obj=folder_name+"/"
                 self.s3_client.put_object(Bucket=bucket_name,key=folder_obj)
+                self.metadata_cache.invalidate(bucket_name,folder_obj)
         
         logging.info("Entered the create folder method of SSS class")
 
@@ -141,7 +329,8 @@ class SimpleStorageService:
         logging.info("Entered the upload_file_path of SSS class")
         try:
             logging.info(f"Uploading {from_filename} to {to_filename} in {bucket_name}")
-            self.s3_resource.meta.client.upload_file(from_filename,bucket_name,to_filename)
+            self.s3_resource.meta.client.upload_file(from_filename,bucket_name,to_filename,Config=self.transfer_config)
+            self.metadata_cache.invalidate(bucket_name,to_filename)
             logging.info(f"Uploaded {from_filename} to {to_filename} in {bucket_name}")
 
             if remove:
@@ -173,19 +362,64 @@ class SimpleStorageService:
         '''
         logging.info("Entered the get_df_from_object method of SSS class")
         try:
-            content=self.read_object(obj,make_readable=True)
-            df=read_csv(content,na_values='na')
-            logging.info("Entered the get_df_from_object method of SSS class")
+            # pandas parses the body as it arrives, no decoded copy of the whole object is made
+            with io.BufferedReader(obj.get()["Body"],buffer_size=1024*1024) as body:
+                df=read_csv(body,na_values='na')
+            logging.info("Exited the get_df_from_object method of SSS class")
             return df
         
         except Exception as e:
             raise MyException(e, sys) from e
+
+    def open_object_stream(self,bucket_name:str,s3_key:str,buffer_size:int=1024*1024)->io.BufferedReader:
+        '''
+        Opens the body of an s3 object as a binary stream that is read from the
+        network as it is consumed, instead of being downloaded whole first
+        '''
+        response=self.s3_resource.meta.client.get_object(Bucket=bucket_name,Key=s3_key)
+        return io.BufferedReader(response["Body"],buffer_size=buffer_size)
+
+    @staticmethod
+    def get_csv_dtypes(usecols:Optional[Sequence[str]]=None,dtype:Optional[dict]=None)->dict:
+        '''
+        pandas dtypes of the columns in config/schema.yaml (int64, float64, category),
+        limited to usecols, with dtype overriding single columns. A missing value in an
+        int64 column fails the read, override it with a nullable "Int64" or "float64"
+        '''
+        dtypes={**get_schema_dtypes(read_yaml_file(file_path=schema_file_path)),**(dtype or {})}
+        return {column:column_dtype for column,column_dtype in dtypes.items() if usecols is None or column in usecols}
+
+    def iter_csv_chunks(self,filename:str,bucket_name:str,chunk_rows:int,usecols:Optional[Sequence[str]]=None,
+                        dtype:Optional[dict]=None,schema_dtypes:bool=False)->Iterator[DataFrame]:
+        '''
+        Yields DataFrames of at most chunk_rows rows of a CSV object, streamed from s3,
+        so memory stays bounded by the chunk size whatever the size of the object.
+        usecols keeps only those columns, schema_dtypes parses columns with their
+        config/schema.yaml dtypes (dtype overrides single columns)
+        '''
+        logging.info(f"Streaming {filename} from bucket {bucket_name} in chunks of {chunk_rows} rows")
+        try:
+            if schema_dtypes:
+                dtype=self.get_csv_dtypes(usecols=usecols,dtype=dtype)
+            with self.open_object_stream(bucket_name,filename) as body:
+                with read_csv(body,usecols=usecols,dtype=dtype,na_values='na',chunksize=chunk_rows) as reader:
+                    yield from reader
+
+        except Exception as e:
+            raise MyException(e, sys) from e
     
-    def read_csv(self,filename:str,bucket_name:str)->DataFrame:
+    def read_csv(self,filename:str,bucket_name:str,usecols:Optional[Sequence[str]]=None,
+                 dtype:Optional[dict]=None,schema_dtypes:bool=False)->DataFrame:
+        '''
+        Reads a CSV object into one DataFrame, streaming the body into pandas,
+        see iter_csv_chunks for usecols, dtype and schema_dtypes
+        '''
         logging.info("Entered the read_csv method of SSS class")
         try:
-            csv_obj=self.get_file_object(filename,bucket_name)
-            df=self.get_df_from_object(csv_obj)
+            if schema_dtypes:
+                dtype=self.get_csv_dtypes(usecols=usecols,dtype=dtype)
+            with self.open_object_stream(bucket_name,filename) as body:
+                df=read_csv(body,usecols=usecols,dtype=dtype,na_values='na')
             logging.info("Exited the read_csv method of SSS class")
             return df
         except Exception as e:
@@ -0,0 +1,43 @@
+import threading
+import time
+from typing import Any,Tuple
+
+class S3MetadataCache:
+    '''
+    Process wide TTL cache of answers about s3 keys: HEAD results of exact keys
+    (kind "head", None for a missing key) and whether a prefix has any object
+    (kind "prefix"). Uploads through SimpleStorageService invalidate what they change,
+    changes made by other processes are seen once the entry expires
+    '''
+    def __init__(self,ttl_seconds:float):
+        self.ttl_seconds=ttl_seconds
+        # (bucket_name, kind, path) -> (expires at, value)
+        self._entries={}
+        self._lock=threading.Lock()
+
+    def get(self,bucket_name:str,path:str,kind:str="head")->Tuple[bool,Any]:
+        '''
+        Returns: whether a fresh entry exists and its value
+        '''
+        entry=self._entries.get((bucket_name,kind,path))
+        if entry is None or entry[0]<time.monotonic():
+            return False,None
+        return True,entry[1]
+
+    def put(self,bucket_name:str,path:str,value:Any,kind:str="head")->None:
+        if self.ttl_seconds<=0:
+            return
+        with self._lock:
+            self._entries[(bucket_name,kind,path)]=(time.monotonic()+self.ttl_seconds,value)
+
+    def invalidate(self,bucket_name:str,s3_key:str)->None:
+        '''
+        Drops the entries a write of s3_key can change: its own and those of every prefix of it
+        '''
+        with self._lock:
+            for key in [key for key in self._entries if key[0]==bucket_name and s3_key.startswith(key[2])]:
+                del self._entries[key]
+
+    def clear(self)->None:
+        with self._lock:
+            self._entries.clear()
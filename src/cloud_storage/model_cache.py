@@ -0,0 +1,113 @@
+import json
+import os
+import tempfile
+import time
+from typing import BinaryIO,Callable,Optional
+
+from src.entity.compact_model import load_model_file
+from src.logger import logging
+
+class ModelCache:
+    '''
+    Local copies of s3 model objects under <cache_dir>/<bucket>/<key>/<etag>.pkl.
+    last_good.json in the same directory points at the copy that last unpickled
+    successfully, it is what the next load revalidates with If-None-Match and
+    what is served when s3 can not be reached. Every file is written to a
+    temporary file and renamed, so readers never see a partial model
+    '''
+    pointer_file_name="last_good.json"
+
+    def __init__(self,cache_dir:str):
+        self.cache_dir=cache_dir
+
+    def _entry_dir(self,bucket_name:str,s3_key:str)->str:
+        return os.path.join(self.cache_dir,bucket_name,*s3_key.split("/"))
+
+    @staticmethod
+    def _atomic_write(path:str,write:Callable[[BinaryIO],None])->None:
+        os.makedirs(os.path.dirname(path),exist_ok=True)
+        fd,temp_path=tempfile.mkstemp(dir=os.path.dirname(path),suffix=".tmp")
+        try:
+            with os.fdopen(fd,"wb") as temp_file:
+                write(temp_file)
+                temp_file.flush()
+                os.fsync(temp_file.fileno())
+            os.replace(temp_path,path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def get_last_good(self,bucket_name:str,s3_key:str)->Optional[dict]:
+        '''
+        Returns etag, last_modified, cached_at and path of the last good copy, or None
+        '''
+        entry_dir=self._entry_dir(bucket_name,s3_key)
+        try:
+            with open(os.path.join(entry_dir,self.pointer_file_name)) as pointer_file:
+                entry=json.load(pointer_file)
+        except (OSError,ValueError):
+            return None
+        entry["path"]=os.path.join(entry_dir,f"{entry['etag']}.pkl")
+        return entry if os.path.isfile(entry["path"]) else None
+
+    def write_object(self,bucket_name:str,s3_key:str,etag:str,download:Callable[[BinaryIO],None])->str:
+        '''
+        Stores the copy of an s3 object, download writes the object into the file
+        it is given. Returns the path of the copy
+        '''
+        path=os.path.join(self._entry_dir(bucket_name,s3_key),f"{etag}.pkl")
+        self._atomic_write(path,download)
+        return path
+
+    def mark_good(self,bucket_name:str,s3_key:str,metadata:dict)->None:
+        '''
+        Points last_good.json at the copy of metadata["etag"] and removes older copies
+        '''
+        entry_dir=self._entry_dir(bucket_name,s3_key)
+        entry={**metadata,"cached_at":time.time()}
+        self._atomic_write(os.path.join(entry_dir,self.pointer_file_name),
+                           lambda pointer_file:pointer_file.write(json.dumps(entry).encode()))
+        for file_name in os.listdir(entry_dir):
+            if file_name.endswith(".pkl") and file_name!=f"{metadata['etag']}.pkl":
+                try:
+                    os.remove(os.path.join(entry_dir,file_name))
+                except OSError:
+                    # another process may be replacing the same copy
+                    pass
+
+    def forget(self,bucket_name:str,s3_key:str)->None:
+        '''
+        Drops the last good pointer, e.g. when its copy no longer unpickles
+        '''
+        try:
+            os.remove(os.path.join(self._entry_dir(bucket_name,s3_key),self.pointer_file_name))
+        except FileNotFoundError:
+            pass
+
+    def store_document(self,bucket_name:str,s3_key:str,document:dict)->None:
+        '''
+        Keeps a copy of a small JSON object, e.g. the model registry manifest
+        '''
+        path=os.path.join(self._entry_dir(bucket_name,s3_key),"document.json")
+        self._atomic_write(path,lambda document_file:document_file.write(json.dumps(document).encode()))
+
+    def load_document(self,bucket_name:str,s3_key:str)->Optional[dict]:
+        try:
+            with open(os.path.join(self._entry_dir(bucket_name,s3_key),"document.json")) as document_file:
+                return json.load(document_file)
+        except (OSError,ValueError):
+            return None
+
+    @staticmethod
+    def load(path:str)->object:
+        with open(path,"rb") as cache_file:
+            return load_model_file(cache_file)
+
+    @staticmethod
+    def describe_staleness(entry:dict)->str:
+        age=time.time()-entry["cached_at"]
+        return f"ETag {entry['etag']}, LastModified {entry['last_modified']}, cached {age:.0f}s ago"
+
+    def log_fallback(self,bucket_name:str,s3_key:str,entry:dict,error:Exception)->None:
+        logging.warning(f"S3 unavailable for s3://{bucket_name}/{s3_key} ({error}), serving the last known "
+                        f"good cached model ({self.describe_staleness(entry)})")
@@ -44,7 +44,8 @@ class ModelEvaluation:
             bucket_name=self.model_eval_config.bucket_name
             model_path=self.model_eval_config.s3_model_key_path
             proj_estimator=ProjEstimator(bucket_name=bucket_name,
-                                         model_path=model_path)
+                                         model_path=model_path,
+                                         registry_prefix=self.model_eval_config.model_registry_prefix)
             
             if proj_estimator.is_model_present(model_path=model_path):
                 return proj_estimator
@@ -16,7 +16,8 @@ class ModelPusher:
         self.model_evaluation_artifact=model_evaluation_artifact
         self.model_pusher_config=model_pusher_config
         self.proj_estimator=ProjEstimator(bucket_name=model_pusher_config.bucket_name,
-                                          model_path=model_pusher_config.s3_model_key_path)
+                                          model_path=model_pusher_config.s3_model_key_path,
+                                          registry_prefix=model_pusher_config.model_registry_prefix)
         
         
     def initiate_model_pusher(self)->ModelPusherArtifact:
@@ -29,7 +30,7 @@ class ModelPusher:
             logging.info("Uploading artifacts folder to s3 bucket")
             self.proj_estimator.save_model(from_file=self.model_evaluation_artifact.trained_model_path)
             model_pusher_artifact=ModelPusherArtifact(bucket_name=self.model_pusher_config.bucket_name,
-                                                      s3_model_path=self.model_pusher_config.s3_model_key_path)
+                                                      s3_model_path=self.proj_estimator.get_model_key())
             
             logging.info("Uploaded artifacts folder to s3 bucket")
             logging.info(f"Model pusher artifact: [{model_pusher_artifact}]")
@@ -1,5 +1,5 @@
 import sys
-from typing import Tuple
+from typing import Optional,Tuple
 
 import numpy as np
 from sklearn.ensemble import RandomForestClassifier
@@ -11,6 +11,7 @@ from src.utils.main_utils import load_numpy_array_data,load_object,save_object
 from src.entity.config_entity import ModelTrainerConfig
 from src.entity.artifact_entity import DataTransformationArtifact,ModelTrainerArtifact,ClassifactionMetricArtifact
 from src.entity.estimator import MyModel
+from src.entity.compiled_forest import CompiledForest
 
 class ModelTrainer:
     def __init__(self,data_transformation_artifact:DataTransformationArtifact,
@@ -57,6 +58,29 @@ class ModelTrainer:
         except Exception as e:
             raise MyException(e,sys) from e
         
+    def get_compiled_model(self,trained_model:RandomForestClassifier,test:np.array)->Optional[CompiledForest]:
+        '''
+        Flattens the forest into the array backed engine and checks it against sklearn
+        on the test set, returns None when they disagree
+        '''
+        try:
+            logging.info("Compiling the trained forest into the array backed engine")
+            compiled_model=CompiledForest.from_forest(trained_model)
+
+            x_test=test[:,:-1]
+            same_labels=np.array_equal(compiled_model.predict(x_test),trained_model.predict(x_test))
+            # both sum the trees in estimator order, so the probabilities must be identical
+            same_proba=np.array_equal(compiled_model.predict_proba(x_test),trained_model.predict_proba(x_test))
+            if not (same_labels and same_proba):
+                logging.warning("Compiled forest does not match sklearn predictions, it will not be used")
+                return None
+
+            logging.info(f"Compiled forest matches sklearn on {len(x_test)} test rows")
+            return compiled_model
+
+        except Exception as e:
+            raise MyException(e,sys) from e
+
     def initiate_model_trainer(self)->ModelTrainerArtifact:
         logging.info("Entered initiate_model_trainer method of ModelTrainer class")
 
@@ -79,8 +103,16 @@ class ModelTrainer:
                 raise Exception("No model found with score above base score")
             
             logging.info("Saving new model as performance is better than previous one")
-            my_model=MyModel(preprocessing_obj=preprocessing_obj,trained_model_object=trained_model)
-            save_object(self.model_trainer_config.trained_model_file_path,my_model)
+            compiled_model=None
+            if self.model_trainer_config.compile_forest:
+                compiled_model=self.get_compiled_model(trained_model=trained_model,test=test_arr)
+
+            my_model=MyModel(preprocessing_obj=preprocessing_obj,trained_model_object=trained_model,compiled_model=compiled_model)
+            # the compact format stores the compiled forest, only one that matched sklearn is used
+            compact=self.model_trainer_config.compact_artifact and compiled_model is not None
+            if self.model_trainer_config.compact_artifact and not compact:
+                logging.warning("No verified compiled forest, saving the model as a pickle instead of compact arrays")
+            save_object(self.model_trainer_config.trained_model_file_path,my_model,compact=compact)
             logging.info("Saved final model object that includes both pre-processing and trained model")
 
             model_trainer_artifact=ModelTrainerArtifact(
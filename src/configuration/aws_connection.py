@@ -1,6 +1,7 @@
-import boto3
 import os
-from src.constants import aws_secret_access_key_env_key,aws_access_key_id_env_key,region_name
+from src.constants import (aws_secret_access_key_env_key,aws_access_key_id_env_key,region_name,s3_endpoint_url,
+                           s3_connect_timeout_seconds,s3_read_timeout_seconds,s3_max_attempts,
+                           s3_max_pool_connections)
 
 
 class S3Client:
@@ -27,14 +28,34 @@ class S3Client:
             if secret_access_key is None:
                 raise Exception(f"Environment variable: {aws_secret_access_key_env_key} is not set")
             
+            # imported on first use, boto3 takes a large share of the serving import time
+            import boto3
+            from botocore.config import Config
             # in bracket 's3' is the service you want to interact with
             S3Client.s3_resource=boto3.resource('s3',
                                                 aws_access_key_id=access_key_id,
                                                 aws_secret_access_key=secret_access_key,
-                                                region_name=region_name
+                                                region_name=region_name,
+                                                endpoint_url=s3_endpoint_url,
+                                                config=Config(connect_timeout=s3_connect_timeout_seconds,
+                                                              read_timeout=s3_read_timeout_seconds,
+                                                              max_pool_connections=s3_max_pool_connections,
+                                                              retries={"max_attempts":s3_max_attempts,"mode":"standard"})
                                                 )
             
             self.s3_resource=S3Client.s3_resource
             self.s3_client=S3Client.s3_client
             # it is none only
 
+    @classmethod
+    def reset(cls)->None:
+        '''
+        Drops the shared resource, the next S3Client creates a new one with its own connection pool
+        '''
+        cls.s3_resource=None
+        cls.s3_client=None
+
+# a forked worker must not reuse the keep-alive sockets of its parent's pool,
+# both processes would read each other's responses from them
+os.register_at_fork(after_in_child=S3Client.reset)
+
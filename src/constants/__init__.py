@@ -3,6 +3,16 @@ from dotenv import load_dotenv
 load_dotenv()
 from datetime import date
 
+# "async" writes log records from a background thread, "sync" writes them in the caller
+log_mode:str=os.getenv("log_mode","async")
+# per logger/module minimum levels, e.g. "botocore=WARNING,src.entity=INFO"
+log_levels:str=os.getenv("log_levels","")
+log_queue_max_size:int=int(os.getenv("log_queue_max_size",10000)) # records beyond it are dropped
+# records below WARNING are rate limited per call site when above 0, e.g. 20 for a busy
+# serving process, off by default so no training pipeline record is dropped
+log_sample_rate_per_second:float=float(os.getenv("log_sample_rate_per_second",0))
+log_sample_burst:int=int(os.getenv("log_sample_burst",50))
+
 database_name="Vehicle-proj_data"
 collection_name="proj_data"
 mongodb_url_key="mongodb_url" # will get from .env file
@@ -22,6 +32,25 @@ schema_file_path=os.path.join("config","schema.yaml")
 aws_access_key_id_env_key=os.getenv("aws_access_key_id")
 aws_secret_access_key_env_key=os.getenv("aws_secret_access_key")
 region_name="us-east-1"
+# points S3Client at an S3 compatible endpoint (MinIO, a local fake) instead of AWS
+s3_endpoint_url=os.getenv("s3_endpoint_url")
+# an unreachable or slow S3 fails fast, so the cached model can be served instead
+s3_connect_timeout_seconds:float=float(os.getenv("s3_connect_timeout_seconds",5))
+s3_read_timeout_seconds:float=float(os.getenv("s3_read_timeout_seconds",30))
+s3_max_attempts:int=int(os.getenv("s3_max_attempts",3))
+# objects above the threshold are uploaded and downloaded as parts of chunksize, max_concurrency at a time
+s3_multipart_threshold_mb:int=int(os.getenv("s3_multipart_threshold_mb",16))
+s3_multipart_chunksize_mb:int=int(os.getenv("s3_multipart_chunksize_mb",16))
+s3_max_concurrency:int=int(os.getenv("s3_max_concurrency",8))
+# HEAD and prefix listing answers are reused for this long, 0 disables the cache
+s3_metadata_cache_ttl_seconds:float=float(os.getenv("s3_metadata_cache_ttl_seconds",30))
+# the serving process runs s3 calls on async_max_workers threads of their own and stops waiting
+# after the timeouts, the client pools enough connections for them and one parallel transfer.
+# a call that timed out keeps its thread for up to (connect + read timeout) x max_attempts
+s3_async_max_workers:int=int(os.getenv("s3_async_max_workers",4))
+s3_max_pool_connections:int=int(os.getenv("s3_max_pool_connections",s3_max_concurrency+s3_async_max_workers))
+s3_async_timeout_seconds:float=float(os.getenv("s3_async_timeout_seconds",60))
+model_load_timeout_seconds:float=float(os.getenv("model_load_timeout_seconds",600))
 
 data_ingestion_collection_name:str="proj_data"
 data_ingestion_dir_name:str="data_ingestion"
@@ -47,11 +76,55 @@ model_trainer_min_samples_leaf:int=6
 min_samples_split_max_depth:int=10
 min_samples_split_criterion:str="entropy"
 min_samples_split_random_state=101
+model_trainer_compile_forest:bool=True
+# save the model as compact arrays (needs the compiled forest) instead of a dill pickle, loads
+# faster without sklearn but scores large batches about 2x slower, see save_compact_model
+model_trainer_compact_artifact:bool=False
 
 
 model_evaluation_changed_threshold_score:float=0.02
 model_bucket_name="projfirstbucket"
-model_pusher_s3_key="model-registry"
+# prefix of the versioned model registry, "" serves and pushes the single model_file_name object
+model_pusher_s3_key=os.getenv("model_pusher_s3_key","model-registry")
+# servers from before the registry only read model_file_name, the champion is copied there
+# on every promote and rollback until they are all upgraded
+model_registry_update_root_key:bool=os.getenv("model_registry_update_root_key","true").lower()=="true"
+
+prediction_batch_max_records:int=10000
+# rows accepted by one Arrow IPC / msgpack columnar request, and its body size: 11 columns
+# of at most 9 msgpack bytes a value plus room for the framing
+columnar_max_rows:int=int(os.getenv("columnar_max_rows",prediction_batch_max_records))
+columnar_max_bytes:int=int(os.getenv("columnar_max_bytes",columnar_max_rows*11*9+64*1024))
+# uploaded files are parsed and scored this many rows at a time
+bulk_scoring_chunk_rows:int=int(os.getenv("bulk_scoring_chunk_rows",10000))
+upload_spool_max_bytes:int=8*1024*1024 # uploads bigger than this are spooled to disk
+
+bulk_scoring_dir_name:str="bulk_scoring"
+# scores go to their own collection keyed by the scored _id, the training collection keeps its schema
+bulk_scoring_output_collection_name:str=os.getenv("bulk_scoring_output_collection_name",f"{collection_name}_scores")
+bulk_scoring_prediction_field:str="prediction"
+bulk_scoring_probability_field:str="prediction_probability"
+bulk_scoring_workers:int=os.cpu_count() or 1
+# single row requests are coalesced for this many ms or until this many rows are waiting
+prediction_coalesce_window_ms:float=float(os.getenv("prediction_coalesce_window_ms",5))
+prediction_coalesce_max_rows:int=int(os.getenv("prediction_coalesce_max_rows",64))
+# repeated single row predictions are served from an LRU cache with a TTL
+prediction_cache_max_size:int=int(os.getenv("prediction_cache_max_size",10000))
+prediction_cache_ttl_seconds:float=float(os.getenv("prediction_cache_ttl_seconds",300))
+# model calls run in a "thread" or "process" pool, calls beyond max_queue are rejected
+prediction_executor_type:str=os.getenv("prediction_executor_type","thread")
+prediction_executor_workers:int=int(os.getenv("prediction_executor_workers",min(4,os.cpu_count() or 1)))
+prediction_executor_max_queue:int=int(os.getenv("prediction_executor_max_queue",64))
+# serving processes poll the model object in s3 and hot swap a changed model, 0 disables it
+model_reload_poll_seconds:float=float(os.getenv("model_reload_poll_seconds",30))
+# local copies of s3 model objects keyed by bucket, key and ETag, "" disables the cache
+model_cache_dir:str=os.getenv("model_cache_dir",os.path.join(artifact_dir,"model_cache"))
 
-APP_HOST="0.0.0.0"
-APP_PORT=5000
\ No newline at end of file
+APP_HOST=os.getenv("app_host","0.0.0.0")
+APP_PORT=int(os.getenv("app_port",5000))
+# more than one worker forks them from a master that already loaded the model
+APP_WORKERS:int=int(os.getenv("app_workers",1))
+app_memory_report_seconds:float=float(os.getenv("app_memory_report_seconds",60))
+# synthetic rows scored at startup before /readyz reports ready, failed warmups are retried
+app_warmup_rows:int=int(os.getenv("app_warmup_rows",8))
+app_warmup_retry_seconds:float=float(os.getenv("app_warmup_retry_seconds",10))
\ No newline at end of file
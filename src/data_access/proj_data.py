@@ -2,10 +2,12 @@ import sys
 import pandas as pd
 import numpy as np
 from typing import Optional
+from pymongo.collection import Collection
 
 from src.configuration.mongo_db_connection import MongoDBclient
 from src.exception import MyException
-from src.constants import database_name,collection_name
+from src.constants import (database_name,collection_name,bulk_scoring_prediction_field,
+                           bulk_scoring_probability_field)
 
 class ProjData:
     '''
@@ -22,16 +24,21 @@ class ProjData:
         except Exception as e:
             raise MyException(e,sys)
         
+    def get_collection(self,collection_name:str,database_name:Optional[str]=None)->Collection:
+        '''
+        Method to get a MongoDB collection, from the default database unless one is given
+        '''
+        if database_name is None:
+            return self.mongo_client.database[collection_name]
+        return self.mongo_client.client[database_name][collection_name]
+
     def export_collection_as_dataframe(self,collection_name:str,database_name:Optional[str]=None)->pd.DataFrame:
         '''
         Method to export MongoDB records as a pandas DataFrame
         '''
         try:
-            if database_name is None:
-                collection=self.mongo_client.database[collection_name]
-            else:
-                collection=self.mongo_client.client[database_name][collection_name]
-            
+            collection=self.get_collection(collection_name=collection_name,database_name=database_name)
+
             print("Fetching data from MongoDB")
             df=pd.DataFrame(list(collection.find()))
             print(f"Data fetched successfully with len: {len(df)}")
@@ -39,6 +46,9 @@ class ProjData:
             if "id" in df.columns.to_list():
                 df=df.drop(columns=["id"],axis=1)
 
+            # bulk scoring may have written its predictions into these documents, they are no features
+            df=df.drop(columns=[bulk_scoring_prediction_field,bulk_scoring_probability_field],errors="ignore")
+
             # No need as no value is null
             df.replace({"na":np.nan},inplace=True)
             return df
@@ -0,0 +1,167 @@
+import io
+import pickle
+import sys
+from typing import BinaryIO,Callable,Union
+
+import numpy as np
+import pandas as pd
+
+from src.entity.compiled_forest import CompiledForest
+from src.entity.estimator import MyModel
+from src.exception import MyException
+from src.logger import logging
+
+compact_model_format="vehicle-compact-model"
+compact_model_format_version=1
+# a compact model is an npz (zip) archive, pickles start with the PROTO opcode b"\x80" instead
+compact_model_magic=b"PK\x03\x04"
+
+class AffinePreprocessor:
+    '''
+    A fitted StandardScaler/MinMaxScaler/passthrough ColumnTransformer as one affine
+    transform: the input columns are picked in output order, then
+    (x - subtract) / divide * multiply + add. These are the floating point operations
+    sklearn does, so the output is bit for bit identical to the ColumnTransformer
+    '''
+    def __init__(self,feature_names_in:np.ndarray,output_index:np.ndarray,subtract:np.ndarray,
+                 divide:np.ndarray,multiply:np.ndarray,add:np.ndarray):
+        self.feature_names_in_=np.asarray(feature_names_in,dtype=str)
+        self.output_index=np.asarray(output_index,dtype=np.intp)
+        self.subtract=np.asarray(subtract,dtype=np.float64)
+        self.divide=np.asarray(divide,dtype=np.float64)
+        self.multiply=np.asarray(multiply,dtype=np.float64)
+        self.add=np.asarray(add,dtype=np.float64)
+
+    @classmethod
+    def from_preprocessor(cls,preprocessor)->"AffinePreprocessor":
+        '''
+        Reads the affine parameters of a fitted preprocessing pipeline, raises
+        ValueError for transformers that are not affine
+        '''
+        if isinstance(preprocessor,cls):
+            return preprocessor
+
+        # only a pickled model gets here, so sklearn is already loaded
+        from sklearn.compose import ColumnTransformer
+        from sklearn.pipeline import Pipeline
+        from sklearn.preprocessing import FunctionTransformer,StandardScaler,MinMaxScaler
+
+        if isinstance(preprocessor,Pipeline):
+            if len(preprocessor.steps)!=1:
+                raise ValueError("Affine preprocessing supports a pipeline with a single ColumnTransformer step")
+            preprocessor=preprocessor.steps[0][1]
+        if not isinstance(preprocessor,ColumnTransformer):
+            raise ValueError(f"Affine preprocessing does not support {type(preprocessor).__name__}")
+
+        input_columns=list(preprocessor.feature_names_in_)
+        output_index,subtract,divide,multiply,add=[],[],[],[],[]
+        for _,transformer,columns in preprocessor.transformers_:
+            if transformer=="drop":
+                continue
+            column_index=[c if isinstance(c,(int,np.integer)) else input_columns.index(c) for c in columns]
+            n=len(column_index)
+            # identity terms leave a value unchanged: (x - 0) / 1 * 1 + 0 == x
+            sub,div,mul,add_=np.zeros(n),np.ones(n),np.ones(n),np.zeros(n)
+            if isinstance(transformer,StandardScaler):
+                if transformer.with_mean:
+                    sub=transformer.mean_
+                if transformer.with_std:
+                    div=transformer.scale_
+            elif isinstance(transformer,MinMaxScaler):
+                if transformer.clip:
+                    raise ValueError("Affine preprocessing does not support a clipping MinMaxScaler")
+                mul,add_=transformer.scale_,transformer.min_
+            # newer sklearn fits the passthrough remainder as an identity FunctionTransformer
+            elif not (transformer=="passthrough"
+                      or isinstance(transformer,FunctionTransformer) and transformer.func is None):
+                raise ValueError(f"Affine preprocessing does not support {type(transformer).__name__} transformer")
+
+            output_index.extend(column_index)
+            subtract.append(sub)
+            divide.append(div)
+            multiply.append(mul)
+            add.append(add_)
+
+        return cls(feature_names_in=input_columns,output_index=output_index,subtract=np.concatenate(subtract),
+                   divide=np.concatenate(divide),multiply=np.concatenate(multiply),add=np.concatenate(add))
+
+    def transform_array(self,features:np.ndarray)->np.ndarray:
+        '''
+        Transforms a float64 matrix with the input columns in feature_names_in_ order
+        '''
+        # fancy indexing copies, the caller's matrix is left untouched
+        transformed=features[:,self.output_index]
+        transformed-=self.subtract
+        transformed/=self.divide
+        transformed*=self.multiply
+        transformed+=self.add
+        return transformed
+
+    def transform(self,dataframe:Union[pd.DataFrame,np.ndarray])->np.ndarray:
+        if isinstance(dataframe,pd.DataFrame):
+            features=dataframe[list(self.feature_names_in_)].to_numpy(dtype=np.float64)
+        else:
+            features=np.asarray(dataframe,dtype=np.float64)
+        return self.transform_array(features)
+
+def save_compact_model(model:MyModel,file:Union[str,BinaryIO])->None:
+    '''
+    Writes a MyModel as a compressed npz of plain arrays: the affine preprocessing
+    parameters, the input column order and the flattened trees of its compiled forest
+    (compiled here when the model has none). Loading it needs neither pickle nor sklearn,
+    but without sklearn batches above CompiledForest.max_batch_rows are scored by the
+    compiled forest too, about 2x slower than sklearn (100k rows: 3.4s against 1.6s),
+    so compact artifacts suit online serving rather than bulk and large batch scoring
+    '''
+    try:
+        preprocessor=AffinePreprocessor.from_preprocessor(model.preprocessing_object)
+        forest=getattr(model,"compiled_model",None) or CompiledForest.from_forest(model.trained_model_object)
+        forest_arrays=forest.to_arrays()
+        # only leaf values are ever read, zeroed inner nodes compress to almost nothing
+        value=forest.value.copy()
+        value[np.isfinite(forest.threshold)]=0.0
+        forest_arrays["value"]=value
+
+        np.savez_compressed(file,format=compact_model_format,format_version=compact_model_format_version,
+                            feature_names_in=preprocessor.feature_names_in_,output_index=preprocessor.output_index,
+                            subtract=preprocessor.subtract,divide=preprocessor.divide,
+                            multiply=preprocessor.multiply,add=preprocessor.add,
+                            **{f"forest_{name}":array for name,array in forest_arrays.items()})
+
+    except Exception as e:
+        raise MyException(e,sys) from e
+
+def load_compact_model(file:Union[str,BinaryIO])->MyModel:
+    '''
+    Reads a model written by save_compact_model. The compiled forest serves as both
+    the trained model and the compiled model, the affine transform as the preprocessing.
+    Input the compiled forest rejects (e.g. NaN features) fails, there is no sklearn fallback
+    '''
+    try:
+        with np.load(file,allow_pickle=False) as arrays:
+            if str(arrays["format"])!=compact_model_format:
+                raise ValueError(f"Not a compact model: {arrays['format']}")
+            if int(arrays["format_version"])!=compact_model_format_version:
+                raise ValueError(f"Unsupported compact model format version {int(arrays['format_version'])}")
+            preprocessor=AffinePreprocessor(arrays["feature_names_in"],arrays["output_index"],arrays["subtract"],
+                                            arrays["divide"],arrays["multiply"],arrays["add"])
+            forest=CompiledForest.from_arrays({name[len("forest_"):]:arrays[name]
+                                               for name in arrays.files if name.startswith("forest_")})
+        return MyModel(preprocessing_obj=preprocessor,trained_model_object=forest,compiled_model=forest)
+
+    except Exception as e:
+        raise MyException(e,sys) from e
+
+def load_model_file(file_obj:BinaryIO,unpickle:Callable[[BinaryIO],object]=pickle.load)->object:
+    '''
+    Loads a compact model, or unpickles anything else, told apart by the first bytes.
+    file_obj must support peek, like open(..., "rb") or io.BufferedReader
+    '''
+    if file_obj.peek(len(compact_model_magic))[:len(compact_model_magic)]!=compact_model_magic:
+        return unpickle(file_obj)
+
+    # the zip directory sits at the end, a stream that can not seek is read into memory first
+    if not file_obj.seekable():
+        file_obj=io.BytesIO(file_obj.read())
+    logging.info("Loading a compact model artifact")
+    return load_compact_model(file_obj)
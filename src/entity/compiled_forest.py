@@ -0,0 +1,155 @@
+import sys
+
+import numpy as np
+
+from src.exception import MyException
+
+class CompiledForest:
+    '''
+    Array backed copy of a fitted RandomForestClassifier.
+    Every tree is flattened into shared contiguous arrays (feature index, float32
+    threshold, left child, whose sibling right child follows it, and class
+    probabilities of each node) and a batch
+    is evaluated level by level for all trees at once with vectorized numpy ops,
+    avoiding the per tree overhead of sklearn's generic predict
+    '''
+    format_version:int=1
+    # rows evaluated together, bounds the (rows x trees) working arrays
+    max_cells_per_chunk:int=1<<20
+    # above this many rows sklearn's compiled per tree traversal is faster
+    max_batch_rows:int=1024
+
+    def __init__(self,feature:np.ndarray,threshold:np.ndarray,left:np.ndarray,
+                 value:np.ndarray,roots:np.ndarray,max_depth:int,classes:np.ndarray,n_features:int):
+        self.feature=feature
+        self.threshold=threshold
+        self.left=left
+        self.value=value
+        self.roots=roots
+        self.max_depth=int(max_depth)
+        self.classes_=classes
+        self.n_features_in_=int(n_features)
+
+    @classmethod
+    def from_forest(cls,forest)->"CompiledForest":
+        '''
+        Flattens the trees of a fitted RandomForestClassifier
+        '''
+        try:
+            if forest.n_outputs_!=1:
+                raise ValueError("Only single output forests can be compiled")
+
+            features,thresholds,lefts,values,roots=[],[],[],[],[]
+            offset=0
+            max_depth=0
+            for estimator in forest.estimators_:
+                tree=estimator.tree_
+                children_left,children_right=tree.children_left,tree.children_right
+
+                # breadth first renumbering that puts both children of a node next
+                # to each other, so the right child is always left child + 1
+                order=[0]
+                for node in order:
+                    if children_left[node]!=-1:
+                        order.append(children_left[node])
+                        order.append(children_right[node])
+                order=np.asarray(order)
+                new_id=np.empty(tree.node_count,dtype=np.int64)
+                new_id[order]=np.arange(tree.node_count)
+                is_leaf=children_left[order]==-1
+
+                # leaves point to themselves with an infinite threshold, so extra
+                # traversal steps keep finished rows where they are
+                features.append(np.where(is_leaf,0,tree.feature[order]))
+                lefts.append(np.where(is_leaf,np.arange(tree.node_count),new_id[children_left[order]])+offset)
+
+                # X is compared as float32, rounding each threshold down to a float32
+                # keeps x <= threshold exactly as sklearn evaluates it in float64
+                threshold=tree.threshold[order]
+                threshold32=threshold.astype(np.float32)
+                rounded_up=threshold32.astype(np.float64)>threshold
+                threshold32[rounded_up]=np.nextafter(threshold32[rounded_up],np.float32(-np.inf))
+                threshold32[is_leaf]=np.inf
+                thresholds.append(threshold32)
+
+                # normalized like DecisionTreeClassifier.predict_proba
+                value=tree.value[order,0,:forest.n_classes_].astype(np.float64)
+                normalizer=value.sum(axis=1)[:,np.newaxis]
+                normalizer[normalizer==0.0]=1.0
+                values.append(value/normalizer)
+
+                roots.append(offset)
+                offset+=tree.node_count
+                max_depth=max(max_depth,tree.max_depth)
+
+            return cls(
+                feature=np.ascontiguousarray(np.concatenate(features),dtype=np.int32),
+                threshold=np.ascontiguousarray(np.concatenate(thresholds),dtype=np.float32),
+                left=np.ascontiguousarray(np.concatenate(lefts),dtype=np.int32),
+                value=np.ascontiguousarray(np.concatenate(values)),
+                roots=np.asarray(roots,dtype=np.int32),
+                max_depth=max_depth,
+                classes=np.asarray(forest.classes_),
+                n_features=forest.n_features_in_
+            )
+
+        except Exception as e:
+            raise MyException(e,sys) from e
+
+    def _validate(self,x)->np.ndarray:
+        x=np.asarray(x,dtype=np.float32)
+        if x.ndim!=2 or x.shape[1]!=self.n_features_in_:
+            raise ValueError(f"Expected input with {self.n_features_in_} features, got shape {x.shape}")
+        if not np.isfinite(x).all():
+            raise ValueError("Input contains NaN or infinity")
+        return x
+
+    def _predict_proba_chunk(self,x:np.ndarray)->np.ndarray:
+        n_trees=len(self.roots)
+        # cells are laid out tree major so neighbouring cells walk the same tree,
+        # row_start is the flat index of the first feature of each cell's row
+        row_start=np.tile(np.arange(x.shape[0],dtype=np.intp)*x.shape[1],n_trees)
+        x_flat=x.ravel()
+        nodes=np.repeat(self.roots,x.shape[0])
+        for _ in range(self.max_depth):
+            sample=x_flat[row_start+self.feature[nodes]]
+            nodes=self.left[nodes]+(sample>self.threshold[nodes])
+        nodes=nodes.reshape(n_trees,x.shape[0])
+
+        # summed tree by tree in the same order as RandomForestClassifier
+        proba=np.zeros((x.shape[0],self.value.shape[1]),dtype=np.float64)
+        for tree_index in range(n_trees):
+            proba+=self.value[nodes[tree_index]]
+        proba/=n_trees
+        return proba
+
+    def predict_proba(self,x)->np.ndarray:
+        x=self._validate(x)
+        chunk_rows=max(1,self.max_cells_per_chunk//max(1,len(self.roots)))
+        if x.shape[0]<=chunk_rows:
+            return self._predict_proba_chunk(x)
+        return np.concatenate([self._predict_proba_chunk(x[start:start+chunk_rows])
+                               for start in range(0,x.shape[0],chunk_rows)])
+
+    def predict(self,x)->np.ndarray:
+        return self.classes_.take(np.argmax(self.predict_proba(x),axis=1),axis=0)
+
+    def to_arrays(self)->dict:
+        return {"format_version":self.format_version,"feature":self.feature,"threshold":self.threshold,
+                "left":self.left,"value":self.value,"roots":self.roots,"max_depth":self.max_depth,
+                "classes":self.classes_,"n_features":self.n_features_in_}
+
+    @classmethod
+    def from_arrays(cls,arrays)->"CompiledForest":
+        '''
+        Rebuilds the forest from the arrays of to_arrays, e.g. an opened .npz
+        '''
+        if int(arrays["format_version"])!=cls.format_version:
+            raise ValueError(f"Unsupported compiled forest format {int(arrays['format_version'])}")
+        return cls(feature=arrays["feature"],threshold=arrays["threshold"],left=arrays["left"],
+                   value=arrays["value"],roots=arrays["roots"],
+                   max_depth=int(arrays["max_depth"]),classes=arrays["classes"],
+                   n_features=int(arrays["n_features"]))
+
+    def __repr__(self):
+        return f"CompiledForest(n_trees={len(self.roots)}, n_nodes={len(self.feature)})"
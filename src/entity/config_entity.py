@@ -38,6 +38,8 @@ class DataTransformationConfig:
 class ModelTrainerConfig:
     model_trainer_dir:str=os.path.join(training_pipeline_config.artifact_dir,model_trainer_dir_name)
     trained_model_file_path:str=os.path.join(model_trainer_dir,model_trainer_trained_model_dir,model_file_name)
+    compile_forest:bool=model_trainer_compile_forest
+    compact_artifact:bool=model_trainer_compact_artifact
     expected_accuracy:float=model_trainer_expected_score
     model_config_file_path:str=model_trainer_model_config_file_path
     n_estimators=model_trainer_n_estimators
@@ -52,13 +54,31 @@ class ModelEvaluationConfig:
     changed_threshold_score:float=model_evaluation_changed_threshold_score
     bucket_name:str=model_bucket_name
     s3_model_key_path:str=model_file_name # model.pkl
+    model_registry_prefix:str=model_pusher_s3_key
 
 @dataclass
 class ModelPusherConfig:
     bucket_name:str=model_bucket_name
     s3_model_key_path:str=model_file_name # model.pkl
+    model_registry_prefix:str=model_pusher_s3_key
 
 @dataclass 
 class VehiclePredictorConfig:
     model_file_path:str=model_file_name
-    model_bucket_name=model_bucket_name
\ No newline at end of file
+    model_bucket_name=model_bucket_name
+    model_registry_prefix:str=model_pusher_s3_key
+
+@dataclass
+class BulkScoringConfig:
+    collection_name:str=collection_name
+    # the scored collection itself is allowed, ingestion drops the prediction fields again
+    output_collection_name:str=bulk_scoring_output_collection_name
+    prediction_field:str=bulk_scoring_prediction_field
+    probability_field:str=bulk_scoring_probability_field
+    chunk_rows:int=bulk_scoring_chunk_rows
+    workers:int=bulk_scoring_workers
+    # kept outside the timestamped artifact dir so a restarted job finds it
+    checkpoint_dir:str=os.path.join(artifact_dir,bulk_scoring_dir_name)
+    model_file_path:str=model_file_name
+    model_bucket_name:str=model_bucket_name
+    model_registry_prefix:str=model_pusher_s3_key
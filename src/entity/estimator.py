@@ -1,11 +1,18 @@
 import sys
+from time import perf_counter
+from typing import TYPE_CHECKING,Tuple
 
+import numpy as np
 import pandas as pd
 from pandas import DataFrame
-from sklearn.pipeline import Pipeline
 
+from src.entity.compiled_forest import CompiledForest
 from src.exception import MyException
 from src.logger import logging
+from src.utils.metrics import forest_predict_seconds, transform_seconds
+
+if TYPE_CHECKING:
+    from sklearn.pipeline import Pipeline
 
 class TargetValueMapping:
     def __init__(self):
@@ -21,18 +28,54 @@ class TargetValueMapping:
         return dict(zip(mapping_response.values(),mapping_response.keys()))
 
 class MyModel:
-    def __init__(self,preprocessing_obj:Pipeline,trained_model_object:object):
+    def __init__(self,preprocessing_obj:"Pipeline",trained_model_object:object,compiled_model:CompiledForest=None):
         self.preprocessing_object:str=preprocessing_obj
         self.trained_model_object=trained_model_object
+        # optional array backed copy of the forest, used instead of sklearn when present
+        self.compiled_model=compiled_model
+
+    def predict_transformed_proba(self,transformed_feature)->np.ndarray:
+        '''
+        Class probabilities for already preprocessed features, from the compiled
+        forest when the model has one and the batch is small enough to benefit
+        '''
+        # models pickled before the compiled engine existed have no such attribute
+        compiled_model=getattr(self,"compiled_model",None)
+        start=perf_counter()
+        # a compact artifact has no sklearn forest to fall back to, it scores every batch itself
+        if compiled_model is not None and compiled_model is self.trained_model_object:
+            try:
+                probabilities=compiled_model.predict_proba(transformed_feature)
+            except ValueError as e:
+                raise ValueError(f"Compact model cannot score this input: {e}") from e
+            forest_predict_seconds.observe(perf_counter()-start)
+            return probabilities
+        if compiled_model is not None and len(transformed_feature)<=compiled_model.max_batch_rows:
+            try:
+                probabilities=compiled_model.predict_proba(transformed_feature)
+                forest_predict_seconds.observe(perf_counter()-start)
+                return probabilities
+            except ValueError as e:
+                logging.info(f"Compiled forest cannot score this input ({e}), using sklearn")
+        probabilities=self.trained_model_object.predict_proba(transformed_feature)
+        forest_predict_seconds.observe(perf_counter()-start)
+        return probabilities
+
+    def transform(self,dataframe:pd.DataFrame)->np.ndarray:
+        start=perf_counter()
+        transformed_feature=self.preprocessing_object.transform(dataframe)
+        transform_seconds.observe(perf_counter()-start)
+        return transformed_feature
 
     def predict(self,dataframe:pd.DataFrame)->DataFrame:
         try:
             logging.info("Starting prediction process")
 
-            transformed_feature=self.preprocessing_object.transform(dataframe)
+            transformed_feature=self.transform(dataframe)
 
             logging.info("Using the trained model to get predictions")
-            predictions=self.trained_model_object.predict(transformed_feature)
+            probabilities=self.predict_transformed_proba(transformed_feature)
+            predictions=self.trained_model_object.classes_.take(np.argmax(probabilities,axis=1),axis=0)
 
             return predictions
         
@@ -40,6 +83,25 @@ class MyModel:
             logging.error("Error occured in predict method",exc_info=True)
             raise MyException(e,sys) from e
     
+    def predict_with_proba(self,dataframe:pd.DataFrame)->Tuple[np.ndarray,np.ndarray]:
+        '''
+        Runs the preprocessing and the trained model once for the whole dataframe
+        Returns: (predicted labels, probability of each class)
+        '''
+        try:
+            logging.info(f"Starting batch prediction process for {len(dataframe)} rows")
+
+            transformed_feature=self.transform(dataframe)
+            probabilities=self.predict_transformed_proba(transformed_feature)
+            # same rule the classifier uses in its own predict
+            predictions=self.trained_model_object.classes_.take(np.argmax(probabilities,axis=1),axis=0)
+
+            return predictions,probabilities
+
+        except Exception as e:
+            logging.error("Error occured in predict_with_proba method",exc_info=True)
+            raise MyException(e,sys) from e
+
     def __repr__(self):
         return f"{type(self.trained_model_object).__name__}()"
 
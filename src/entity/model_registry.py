@@ -0,0 +1,227 @@
+import argparse
+import hashlib
+import json
+import sys
+import time
+from typing import Callable,List,Optional
+
+from src.cloud_storage.aws_storage import SimpleStorageService
+from src.constants import model_bucket_name,model_file_name,model_pusher_s3_key,model_registry_update_root_key
+from src.exception import MyException
+from src.logger import logging
+
+class ModelRegistry:
+    '''
+    Immutable, content hashed model versions under <prefix>/versions/<sha256>/<model file name>
+    and a small <prefix>/manifest.json naming the champion that servers load:
+    {"champion": sha256, "champion_key": s3 key, "history": [earlier champions, oldest first],
+     "updated_at": epoch seconds}
+    Pushing a version that is already stored uploads nothing, promote and rollback
+    only rewrite the manifest, conditional on the ETag it was read with so concurrent
+    updates never overwrite each other. With a root_key the champion is also copied
+    there, for servers that do not read the registry yet
+    '''
+    manifest_file_name="manifest.json"
+    max_history:int=50
+    max_update_attempts:int=5
+
+    def __init__(self,bucket_name:str,prefix:str,model_file_name:str=model_file_name,
+                 s3:SimpleStorageService=None,root_key:Optional[str]=None):
+        self.bucket_name=bucket_name
+        self.root_key=root_key
+        self.prefix=prefix.strip("/")
+        self.model_file_name=model_file_name
+        self.s3=s3 or SimpleStorageService()
+        self.manifest_key=f"{self.prefix}/{self.manifest_file_name}"
+        # (ETag, manifest) of the last read, polls only download the manifest again when it changed
+        self._last_manifest=(None,None)
+
+    def version_key(self,version:str)->str:
+        return f"{self.prefix}/versions/{version}/{self.model_file_name}"
+
+    @staticmethod
+    def hash_file(file_path:str)->str:
+        digest=hashlib.sha256()
+        with open(file_path,"rb") as model_file:
+            for block in iter(lambda:model_file.read(1024*1024),b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def read_manifest(self)->Optional[dict]:
+        '''
+        Returns the manifest, None when the registry has none yet. The GET is conditional on
+        the ETag of the last read, while s3 is unreachable the last known manifest is used
+        '''
+        from botocore.exceptions import ClientError
+        etag,manifest=self._last_manifest
+        request={"Bucket":self.bucket_name,"Key":self.manifest_key}
+        if etag is not None:
+            request["IfNoneMatch"]=f'"{etag}"'
+        try:
+            response=self.s3.s3_resource.meta.client.get_object(**request)
+
+        except Exception as e:
+            status=e.response.get("ResponseMetadata",{}).get("HTTPStatusCode") if isinstance(e,ClientError) else None
+            if status==304:
+                return manifest
+            if status==404:
+                self._last_manifest=(None,None)
+                return None
+            return self._last_known_manifest(e)
+
+        manifest=json.loads(response["Body"].read())
+        self._last_manifest=(response["ETag"].strip('"'),manifest)
+        if self.s3.model_cache is not None:
+            self.s3.model_cache.store_document(self.bucket_name,self.manifest_key,manifest)
+        return manifest
+
+    def _last_known_manifest(self,error:Exception)->dict:
+        manifest=self._last_manifest[1]
+        if manifest is None and self.s3.model_cache is not None:
+            # a restart during an s3 outage still knows which version it served
+            manifest=self.s3.model_cache.load_document(self.bucket_name,self.manifest_key)
+        if manifest is None:
+            raise error
+        logging.warning(f"S3 unavailable for s3://{self.bucket_name}/{self.manifest_key} ({error}), "
+                        f"using the last known manifest with champion {manifest['champion']}")
+        return manifest
+
+    def write_manifest(self,manifest:dict,etag:Optional[str])->None:
+        '''
+        Replaces the manifest read with ETag etag, None when there was none yet.
+        A manifest changed meanwhile fails with 412 PreconditionFailed
+        '''
+        client=self.s3.s3_resource.meta.client
+        condition={"IfMatch":f'"{etag}"'} if etag is not None else {"IfNoneMatch":"*"}
+        response=client.put_object(Bucket=self.bucket_name,Key=self.manifest_key,
+                                   Body=json.dumps(manifest,indent=2).encode(),
+                                   ContentType="application/json",**condition)
+        self._last_manifest=(response["ETag"].strip('"'),manifest)
+        self.s3.metadata_cache.invalidate(self.bucket_name,self.manifest_key)
+        logging.info(f"Model registry manifest s3://{self.bucket_name}/{self.manifest_key} "
+                     f"now names champion {manifest['champion']}")
+        if self.root_key:
+            client.copy_object(Bucket=self.bucket_name,Key=self.root_key,
+                               CopySource={"Bucket":self.bucket_name,"Key":manifest["champion_key"]})
+            self.s3.metadata_cache.invalidate(self.bucket_name,self.root_key)
+            logging.info(f"Copied champion {manifest['champion']} to s3://{self.bucket_name}/{self.root_key}")
+
+    def update_manifest(self,change:Callable[[Optional[dict]],Optional[dict]])->dict:
+        '''
+        Read, change and conditionally write the manifest, again from a fresh read when
+        another writer got there first. change returns the new manifest, None to keep it
+        '''
+        from botocore.exceptions import ClientError
+        for attempt in range(1,self.max_update_attempts+1):
+            manifest=self.read_manifest()
+            etag=self._last_manifest[0] if manifest is not None else None
+            new_manifest=change(manifest)
+            if new_manifest is None:
+                return manifest
+            try:
+                self.write_manifest(new_manifest,etag)
+                return new_manifest
+            except ClientError as e:
+                # 409 when S3 is still applying a concurrent conditional write
+                if e.response.get("ResponseMetadata",{}).get("HTTPStatusCode") not in (409,412):
+                    raise
+                logging.info(f"Model registry manifest changed during the update (attempt {attempt}), retrying")
+        raise RuntimeError(f"Model registry manifest kept changing, gave up after {self.max_update_attempts} attempts")
+
+    def push(self,from_file:str,promote:bool=True)->str:
+        '''
+        Stores a model file as the version named by its sha256, uploading it only if that
+        version is not stored yet, and optionally promotes it
+        Returns: the version
+        '''
+        try:
+            version=self.hash_file(from_file)
+            version_key=self.version_key(version)
+            if self.s3.head_object(self.bucket_name,version_key,use_cache=False) is not None:
+                logging.info(f"Model version {version} is already in the registry, skipping the upload")
+            else:
+                self.s3.upload_file(from_file,to_filename=version_key,bucket_name=self.bucket_name,remove=False)
+            if promote:
+                self.promote(version)
+            return version
+
+        except Exception as e:
+            raise MyException(e,sys) from e
+
+    def promote(self,version:str)->dict:
+        '''
+        Makes a stored version the champion, the previous champion goes on the history
+        '''
+        try:
+            version_key=self.version_key(version)
+            if self.s3.head_object(self.bucket_name,version_key,use_cache=False) is None:
+                raise ValueError(f"Model version {version} is not in the registry")
+
+            def change(manifest:Optional[dict])->Optional[dict]:
+                manifest=manifest or {}
+                if manifest.get("champion")==version:
+                    logging.info(f"Model version {version} already is the champion")
+                    return None
+                history=manifest.get("history",[])+([manifest["champion"]] if manifest.get("champion") else [])
+                return {"champion":version,"champion_key":version_key,
+                        "history":history[-self.max_history:],"updated_at":time.time()}
+
+            return self.update_manifest(change)
+
+        except Exception as e:
+            raise MyException(e,sys) from e
+
+    def rollback(self)->dict:
+        '''
+        Makes the previous champion the champion again
+        '''
+        try:
+            def change(manifest:Optional[dict])->dict:
+                if not manifest or not manifest.get("history"):
+                    raise ValueError("The model registry has no previous champion to roll back to")
+                version=manifest["history"][-1]
+                return {"champion":version,"champion_key":self.version_key(version),
+                        "history":manifest["history"][:-1],"updated_at":time.time()}
+
+            return self.update_manifest(change)
+
+        except Exception as e:
+            raise MyException(e,sys) from e
+
+    def list_versions(self)->List[dict]:
+        try:
+            versions=[]
+            for file_object in self.s3.iter_objects(self.bucket_name,f"{self.prefix}/versions/"):
+                if file_object.key.endswith("/"+self.model_file_name):
+                    versions.append({"version":file_object.key.split("/")[-2],"key":file_object.key,
+                                     "size":file_object.size,"last_modified":file_object.last_modified.isoformat()})
+            return sorted(versions,key=lambda version:version["last_modified"])
+
+        except Exception as e:
+            raise MyException(e,sys) from e
+
+def main():
+    '''
+    python -m src.entity.model_registry list | promote <version> | rollback
+    '''
+    parser=argparse.ArgumentParser(description="Inspect the model registry and move its champion")
+    parser.add_argument("command",choices=("list","promote","rollback"))
+    parser.add_argument("version",nargs="?")
+    parser.add_argument("--bucket",default=model_bucket_name)
+    parser.add_argument("--prefix",default=model_pusher_s3_key)
+    args=parser.parse_args()
+
+    registry=ModelRegistry(bucket_name=args.bucket,prefix=args.prefix,
+                           root_key=model_file_name if model_registry_update_root_key else None)
+    if args.command=="list":
+        result={"manifest":registry.read_manifest(),"versions":registry.list_versions()}
+    elif args.command=="promote":
+        if not args.version:
+            parser.error("promote needs a version")
+        result=registry.promote(args.version)
+    else:
+        result=registry.rollback()
+    print(json.dumps(result,indent=2))
+
+if __name__=="__main__":
+    main()
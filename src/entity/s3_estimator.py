@@ -1,60 +1,231 @@
+from src.cloud_storage.async_aws_storage import AsyncSimpleStorageService
 from src.cloud_storage.aws_storage import SimpleStorageService
 from src.exception import MyException
 from src.entity.estimator import MyModel
+from src.entity.model_registry import ModelRegistry
+from src.constants import model_registry_update_root_key
+from src.logger import logging
+import os
 import sys
+import threading
+import time
+from typing import Callable,Optional,Tuple,Union
 from pandas import DataFrame
 
+def describe_model(metadata:dict)->str:
+    if metadata.get("version"):
+        return f"registry version {metadata['version'][:12]}"
+    return f"ETag {metadata.get('etag')}"
+
+class ModelHolder:
+    '''
+    Process wide holder of a loaded model, one per (bucket_name,model_path).
+    Only one thread loads the model, concurrent callers wait for that load
+    and then share the same object. version changes whenever the held model does
+    '''
+    _holders:dict={} # shared across the application
+    _holders_lock=threading.Lock()
+
+    def __init__(self,bucket_name:str,model_path:str):
+        self.bucket_name=bucket_name
+        self.model_path=model_path
+        self.model:MyModel=None
+        self.version:int=0
+        # registry version or S3 ETag/LastModified of the held model, when and how fast it was loaded
+        self.metadata:dict={}
+        self.loaded_at:float=None
+        self.load_seconds:float=None
+        self._load_lock=threading.Lock()
+
+    @classmethod
+    def get_holder(cls,bucket_name:str,model_path:str)->"ModelHolder":
+        key=(bucket_name,model_path)
+        holder=cls._holders.get(key)
+        if holder is None:
+            with cls._holders_lock:
+                holder=cls._holders.get(key)
+                if holder is None:
+                    holder=cls(bucket_name=bucket_name,model_path=model_path)
+                    cls._holders[key]=holder
+        return holder
+
+    def get_model(self,loader:Callable[[],MyModel])->MyModel:
+        '''
+        Returns the loaded model, calling loader only if no model is held yet
+        '''
+        model=self.model
+        if model is not None:
+            return model
+
+        with self._load_lock:
+            # another thread may have finished the load while we waited
+            if self.model is None:
+                logging.info(f"Loading model {self.model_path} from bucket {self.bucket_name} into process cache")
+                start=time.perf_counter()
+                self.model=loader()
+                self.load_seconds=time.perf_counter()-start
+                self.loaded_at=time.time()
+                self.version+=1
+            return self.model
+
+    def swap(self,model:MyModel,metadata:dict,load_seconds:float)->None:
+        '''
+        Replaces the held model in one reference assignment. Callers that already
+        got the old model finish with it, later get_model calls see the new one
+        '''
+        with self._load_lock:
+            self.model=model
+            self.metadata=metadata
+            self.load_seconds=load_seconds
+            self.loaded_at=time.time()
+            self.version+=1
+        logging.info(f"Swapped in model {self.model_path} version {self.version} ({describe_model(metadata)})")
+
+    def clear(self)->None:
+        with self._load_lock:
+            self.model=None
+            self.metadata={}
+            self.version+=1
+
+    def get_status(self)->dict:
+        return {"bucket_name":self.bucket_name,"model_path":self.model_path,"loaded":self.model is not None,
+                "version":self.version,"registry_version":self.metadata.get("version"),
+                "model_key":self.metadata.get("key"),"etag":self.metadata.get("etag"),
+                "last_modified":self.metadata.get("last_modified"),
+                "loaded_at":self.loaded_at,"load_seconds":self.load_seconds}
+
 class ProjEstimator:
     '''
-    This class is used to save and retrieve our model 
+    This class is used to save and retrieve our model
     from s3 bucket and do prediction
     '''
 
-    def __init__(self,bucket_name,model_path):
+    def __init__(self,bucket_name,model_path,registry_prefix:str=None):
         '''
-        model_path is location of model in bucket
+        model_path is location of model in bucket. With a registry_prefix the champion
+        named by the registry manifest is served, model_path only until a first version is pushed
         '''
         self.bucket_name=bucket_name
         self.s3=SimpleStorageService()
+        self.async_s3=AsyncSimpleStorageService(storage=self.s3)
         self.model_path=model_path
-        self.loaded_model:MyModel=None
-    
+        self.registry=ModelRegistry(bucket_name=bucket_name,prefix=registry_prefix,
+                                    model_file_name=os.path.basename(model_path),s3=self.s3,
+                                    root_key=model_path if model_registry_update_root_key else None) if registry_prefix else None
+        self.model_holder=ModelHolder.get_holder(bucket_name=bucket_name,model_path=model_path)
+
+    @property
+    def loaded_model(self)->MyModel:
+        return self.model_holder.model
+
+    def _resolve_model(self)->Tuple[str,Optional[dict]]:
+        '''
+        s3 key of the model to serve and, for a registry champion, its version and key
+        '''
+        manifest=self.registry.read_manifest() if self.registry is not None else None
+        if manifest is None:
+            return self.model_path,None
+        return manifest["champion_key"],{"version":manifest["champion"],"key":manifest["champion_key"]}
+
+    def get_model_key(self)->str:
+        return self._resolve_model()[0]
+
     def is_model_present(self,model_path):
         try:
+            if self.registry is not None and self.registry.read_manifest() is not None:
+                return True
             return self.s3.s3_key_path_available(bucket_name=self.bucket_name,s3_key=model_path)
-        
+
         except MyException as e:
             print(e)
             return False
-    
-    def load_model(self)->MyModel:
+
+    def load_model(self,with_metadata:bool=False)->Union[MyModel,Tuple[MyModel,dict]]:
+        '''
+        load the registry champion or the model at model_path, with_metadata also returns
+        its identity (see get_model_metadata)
+        '''
+        model_key,version_metadata=self._resolve_model()
+        model,metadata=self.s3.load_model(model_key,bucket_name=self.bucket_name,with_metadata=True)
+        metadata=version_metadata or metadata
+        return (model,metadata) if with_metadata else model
+
+    def get_model_metadata(self)->dict:
+        '''
+        Identity of the model to serve: the champion version from the registry manifest,
+        a tiny conditional GET, else the ETag and LastModified of the model object in s3
+        '''
+        model_key,version_metadata=self._resolve_model()
+        return version_metadata or self.s3.get_object_metadata(bucket_name=self.bucket_name,s3_key=model_key)
+
+    async def load_model_async(self,with_metadata:bool=False)->Union[MyModel,Tuple[MyModel,dict]]:
+        '''
+        load_model for the event loop, the manifest read, download and unpickling run on the S3 threads
+        '''
+        model_key,version_metadata=await self.async_s3.run(self._resolve_model)
+        model,metadata=await self.async_s3.load_model(model_key,bucket_name=self.bucket_name,with_metadata=True)
+        metadata=version_metadata or metadata
+        return (model,metadata) if with_metadata else model
+
+    async def get_model_metadata_async(self)->dict:
+        model_key,version_metadata=await self.async_s3.run(self._resolve_model)
+        return version_metadata or await self.async_s3.get_object_metadata(bucket_name=self.bucket_name,s3_key=model_key)
+
+    async def get_model_async(self)->MyModel:
         '''
-        load the model from model_path
+        get_model for the event loop, a first load waits on the S3 threads
         '''
+        model=self.model_holder.model
+        if model is not None:
+            return model
+        return await self.async_s3.run(self.get_model,timeout=self.async_s3.load_timeout)
+
+    def _load_current_model(self)->MyModel:
+        # metadata names the model actually loaded, also when a cached copy was
+        # served while s3 is unreachable, so a later poll sees any change
+        model,self.model_holder.metadata=self.load_model(with_metadata=True)
+        return model
+
+    def get_model(self)->MyModel:
+        '''
+        returns the process wide cached model, loading it from s3 once
+        '''
+        return self.model_holder.get_model(self._load_current_model)
 
-        return self.s3.load_model(self.model_path,bucket_name=self.bucket_name)
-    
     def save_model(self,from_file,remove:bool=False)->None:
         '''
-        save the model to model_path to s3 bucket
+        save the model to model_path to s3 bucket, or push it to the registry as
+        a new content hashed version and promote it
         :param from_file: your local system model path
         :param_remove: by default it is false that mean you will have your model locallly available in your system folder
         '''
 
         try:
-            self.s3.upload_file(from_file,
-                                to_filename=self.model_path,
-                                bucket_name=self.bucket_name,
-                                remove=remove)
-        
+            if self.registry is not None:
+                self.registry.push(from_file,promote=True)
+                if remove:
+                    os.remove(from_file)
+            else:
+                self.s3.upload_file(from_file,
+                                    to_filename=self.model_path,
+                                    bucket_name=self.bucket_name,
+                                    remove=remove)
+            # the cached copy is stale now
+            self.model_holder.clear()
+
         except Exception as e:
             raise MyException(e,sys) from e
 
     def predict(self,dataframe:DataFrame):
         try:
-            if self.loaded_model is None:
-                self.loaded_model=self.load_model()
-            return self.loaded_model.predict(dataframe=dataframe)
+            return self.get_model().predict(dataframe=dataframe)
 
         except Exception as e:
-            raise MyException(e,sys) from e
\ No newline at end of file
+            raise MyException(e,sys) from e
+
+    def predict_with_proba(self,dataframe:DataFrame):
+        try:
+            return self.get_model().predict_with_proba(dataframe=dataframe)
+
+        except Exception as e:
+            raise MyException(e,sys) from e
@@ -1,9 +1,16 @@
+import atexit
+import copy
 import logging
 import os
-from logging.handlers import RotatingFileHandler
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from from_root import from_root
 from datetime import datetime
 
+from src.constants import log_levels, log_mode, log_queue_max_size, log_sample_burst, log_sample_rate_per_second
+
 log_dir='logs'
 log_file=f"{datetime.now().strftime('%m_%d_%Y_%H_%M_%S')}.log"
 max_log_size=5*1024*1024 # 5MB
@@ -13,16 +20,153 @@ log_dir_path=os.path.join(from_root(),log_dir)
 os.makedirs(log_dir_path, exist_ok=True)
 log_file_path=os.path.join(log_dir_path,log_file)
 
+def parse_log_levels(levels:str)->dict:
+    '''
+    Parses "httpx=WARNING,src.entity=INFO" into {"httpx": 30, "src.entity": 20}
+    '''
+    parsed={}
+    for item in filter(None,(part.strip() for part in levels.split(","))):
+        name,_,level=item.partition("=")
+        parsed[name.strip()]=logging.getLevelName(level.strip().upper())
+        if not isinstance(parsed[name.strip()],int):
+            raise ValueError(f"Unknown log level in log_levels: {item}")
+    return parsed
+
+# the directory holding the src package, module names of records are relative to it
+package_root=os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+class ModuleLevelFilter(logging.Filter):
+    '''
+    Applies per module levels to records of the root logger, which all of
+    src logs through. A record's module is its dotted path under package_root,
+    the longest configured prefix decides its minimum level
+    '''
+    def __init__(self,levels:dict):
+        super().__init__()
+        self.levels=levels
+        self._level_by_path={}
+
+    def _level_for(self,pathname:str)->int:
+        level=self._level_by_path.get(pathname)
+        if level is None:
+            module=os.path.splitext(os.path.relpath(pathname,package_root))[0].replace(os.sep,".")
+            matches=[name for name in self.levels if module==name or module.startswith(name+".")]
+            level=self.levels[max(matches,key=len)] if matches else logging.NOTSET
+            self._level_by_path[pathname]=level
+        return level
+
+    def filter(self,record:logging.LogRecord)->bool:
+        return record.levelno>=self._level_for(record.pathname)
+
+class SamplingFilter(logging.Filter):
+    '''
+    Rate limits records below WARNING per call site with a token bucket of
+    rate_per_second tokens and burst capacity. The next record let through
+    from a call site tells how many of its records were dropped meanwhile
+    '''
+    def __init__(self,rate_per_second:float,burst:int):
+        super().__init__()
+        self.rate_per_second=rate_per_second
+        self.burst=burst
+        self.dropped=0
+        # (pathname, lineno) -> [tokens, last refill time, dropped since last record]
+        self._buckets={}
+        self._lock=threading.Lock()
+
+    def filter(self,record:logging.LogRecord)->bool:
+        if record.levelno>=logging.WARNING:
+            return True
+
+        now=time.monotonic()
+        key=(record.pathname,record.lineno)
+        with self._lock:
+            bucket=self._buckets.get(key)
+            if bucket is None:
+                bucket=self._buckets[key]=[float(self.burst),now,0]
+            else:
+                bucket[0]=min(self.burst,bucket[0]+(now-bucket[1])*self.rate_per_second)
+                bucket[1]=now
+            if bucket[0]<1:
+                bucket[2]+=1
+                self.dropped+=1
+                return False
+            bucket[0]-=1
+            suppressed,bucket[2]=bucket[2],0
+
+        if suppressed:
+            record.msg=f"{record.getMessage()} ({suppressed} similar messages suppressed)"
+            record.args=None
+        return True
+
+class NonBlockingQueueHandler(QueueHandler):
+    '''
+    Hands records to the background writer without formatting them, formatting
+    happens in the writer thread. A full queue drops the record instead of blocking
+    '''
+    def __init__(self,log_queue:queue.Queue):
+        super().__init__(log_queue)
+        self.dropped=0
+
+    def prepare(self,record:logging.LogRecord)->logging.LogRecord:
+        # a copy like QueueHandler.prepare, other handlers of the record still see the original.
+        # the arguments are merged now, they may change before the writer gets to the record
+        record=copy.copy(record)
+        record.msg=record.getMessage()
+        record.args=None
+        if record.exc_info:
+            record.exc_text=logging.Formatter().formatException(record.exc_info)
+            record.exc_info=None
+        return record
+
+    def enqueue(self,record:logging.LogRecord)->None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped+=1
+
+class BlockingStopQueueListener(QueueListener):
+    def enqueue_sentinel(self)->None:
+        # waits for room in a full queue instead of failing, so stop always drains it
+        self.queue.put(self._sentinel)
+
+log_listener:QueueListener=None
+
+def _start_listener(handler:NonBlockingQueueHandler,output_handlers:list)->None:
+    global log_listener
+    handler.queue=queue.Queue(maxsize=log_queue_max_size)
+    log_listener=BlockingStopQueueListener(handler.queue,*output_handlers,respect_handler_level=True)
+    log_listener.start()
+
+def stop_logging()->None:
+    '''
+    Writes out every queued record and stops the writer thread of the async mode
+    '''
+    global log_listener
+    if log_listener is not None:
+        log_listener.stop()
+        log_listener=None
+
 def configure_logger():
     '''
-    Configures the logger with a RotatingFileHandler and Console handler
+    Configures the logger with a RotatingFileHandler and Console handler.
+    With log_mode "async" (the default) both run in a background writer thread
+    fed through a bounded queue, so logging never blocks the caller on I/O.
+    Records can be filtered per module (log_levels) and sampled per call site
+    (log_sample_rate_per_second, off by default). In "sync" mode the
+    handlers write in the calling thread and only records of the root logger,
+    the one src logs through, are filtered
     '''
     logger=logging.getLogger()
     logger.setLevel(logging.DEBUG)
+    # the format below uses none of these, skip collecting them for every record
+    logging.logThreads=False
+    logging.logProcesses=False
+    logging.logMultiprocessing=False
 
     formatter=logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
-    file_handler=RotatingFileHandler(log_file_path,maxBytes=max_log_size,backupCount=backup_count)
+    # delay: the timestamped file is only created once the first record is written
+    file_handler=RotatingFileHandler(log_file_path,maxBytes=max_log_size,backupCount=backup_count,delay=True)
     file_handler.setLevel(logging.DEBUG)
     file_handler.setFormatter(formatter)
 
@@ -30,7 +174,37 @@ def configure_logger():
     console_handler.setFormatter(formatter)
     console_handler.setLevel(logging.INFO)
 
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    levels=parse_log_levels(log_levels)
+    # named third party loggers are cut at the logger, before any record is built
+    for name,level in levels.items():
+        if not name.startswith("src"):
+            logging.getLogger(name).setLevel(level)
+
+    filters=[ModuleLevelFilter(levels)] if levels else []
+    if log_sample_rate_per_second>0:
+        filters.append(SamplingFilter(log_sample_rate_per_second,log_sample_burst))
+
+    if log_mode=="async":
+        queue_handler=NonBlockingQueueHandler(queue.Queue(maxsize=log_queue_max_size))
+        for log_filter in filters:
+            queue_handler.addFilter(log_filter)
+        _start_listener(queue_handler,[file_handler,console_handler])
+        logger.addHandler(queue_handler)
+
+        def restart_after_fork():
+            # the writer thread does not survive a fork and locks held by other
+            # threads at that moment stay held, children get fresh ones
+            for log_filter in filters:
+                if isinstance(log_filter,SamplingFilter):
+                    log_filter._lock=threading.Lock()
+            _start_listener(queue_handler,[file_handler,console_handler])
+        os.register_at_fork(after_in_child=restart_after_fork)
+        atexit.register(stop_logging)
+    else:
+        # on the logger so every record is sampled once, whatever the number of handlers
+        for log_filter in filters:
+            logger.addFilter(log_filter)
+        logger.addHandler(file_handler)
+        logger.addHandler(console_handler)
 
-configure_logger()
\ No newline at end of file
+configure_logger()
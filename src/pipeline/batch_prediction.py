@@ -0,0 +1,132 @@
+import asyncio
+import json
+import sys
+from itertools import islice
+from typing import IO, AsyncIterator, Iterator, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from src.constants import schema_file_path
+from src.exception import MyException
+from src.logger import logging
+from src.pipeline.prediction_executor import PredictionExecutor
+from src.pipeline.prediction_pipeline import VehicleData
+from src.utils.main_utils import get_schema_dtypes, read_yaml_file
+
+
+class RawVehicleDataTransformer:
+    """
+    Maps rows in the raw schema of config/schema.yaml (Gender, Vehicle_Age and
+    Vehicle_Damage as strings) onto the model input columns, the same way
+    DataTransformation does for training. Categories are mapped explicitly so
+    every chunk gets the same columns whatever values it happens to contain.
+    """
+    gender_mapping = {"Female": 0, "Male": 1}
+    vehicle_age_lt_1_year = "< 1 Year"
+    vehicle_age_gt_2_years = "> 2 Years"
+    vehicle_damage_yes = "Yes"
+
+    def __init__(self):
+        try:
+            self._schema_config = read_yaml_file(file_path=schema_file_path)
+            self.schema_dtypes = get_schema_dtypes(self._schema_config)
+        except Exception as e:
+            raise MyException(e, sys) from e
+
+    def get_input_dtypes(self) -> dict:
+        """
+        dtypes used when parsing raw input, categorical columns are read as strings
+        """
+        return {column: ("string" if dtype == "category" else dtype)
+                for column, dtype in self.schema_dtypes.items()}
+
+    def transform(self, dataframe: DataFrame) -> DataFrame:
+        try:
+            gender = dataframe["Gender"].map(self.gender_mapping)
+            if gender.isna().any():
+                unknown = dataframe.loc[gender.isna(), "Gender"].unique().tolist()
+                raise ValueError(f"Unknown Gender values: {unknown}")
+
+            vehicle_age = dataframe["Vehicle_Age"]
+            model_input = DataFrame({
+                "Gender": gender,
+                "Age": dataframe["Age"],
+                "Driving_License": dataframe["Driving_License"],
+                "Region_Code": dataframe["Region_Code"],
+                "Previously_Insured": dataframe["Previously_Insured"],
+                "Annual_Premium": dataframe["Annual_Premium"],
+                "Policy_Sales_Channel": dataframe["Policy_Sales_Channel"],
+                "Vintage": dataframe["Vintage"],
+                "Vehicle_Age_lt_1_Year": vehicle_age == self.vehicle_age_lt_1_year,
+                "Vehicle_Age_gt_2_Years": vehicle_age == self.vehicle_age_gt_2_years,
+                "Vehicle_Damage_Yes": dataframe["Vehicle_Damage"] == self.vehicle_damage_yes,
+            })
+            return model_input.astype(VehicleData.feature_dtypes)
+
+        except Exception as e:
+            raise MyException(e, sys) from e
+
+
+def read_csv_chunks(file: IO, chunk_rows: int, dtype: dict = None) -> Iterator[DataFrame]:
+    """
+    Yields DataFrames of at most chunk_rows rows from a CSV file object
+    """
+    columns = pd.read_csv(file, nrows=0).columns
+    file.seek(0)
+    dtype = {column: column_dtype for column, column_dtype in (dtype or {}).items() if column in columns}
+    with pd.read_csv(file, chunksize=chunk_rows, dtype=dtype, na_values="na") as reader:
+        yield from reader
+
+
+def read_ndjson_chunks(file: IO, chunk_rows: int, dtype: dict = None) -> Iterator[DataFrame]:
+    """
+    Yields DataFrames of at most chunk_rows rows from a newline delimited JSON file object
+    """
+    lines = (line for line in file if line.strip())
+    while True:
+        records = [json.loads(line) for line in islice(lines, chunk_rows)]
+        if not records:
+            return
+        chunk = DataFrame.from_records(records)
+        yield chunk.astype({column: column_dtype for column, column_dtype in (dtype or {}).items()
+                            if column in chunk.columns})
+
+
+async def score_raw_chunks(chunks: Iterator[DataFrame],
+                           executor: PredictionExecutor,
+                           transformer: RawVehicleDataTransformer) -> AsyncIterator[Tuple[DataFrame, DataFrame, np.ndarray, np.ndarray]]:
+    """
+    Scores chunks of rows in the raw schema one at a time. Parsing and mapping run in the
+    default executor, scoring goes through the bounded PredictionExecutor like every other
+    prediction, so its pool type and max_queue apply to uploads too
+    Yields: the raw chunk, its model input, predicted labels and probability of a positive response
+    """
+    loop = asyncio.get_running_loop()
+
+    def next_chunk():
+        chunk = next(chunks, None)
+        return (None, None) if chunk is None else (chunk, transformer.transform(chunk))
+
+    while True:
+        chunk, model_input = await loop.run_in_executor(None, next_chunk)
+        if chunk is None:
+            return
+        predictions, probabilities = await executor.predict_features(model_input.to_numpy(dtype=np.float64))
+        yield chunk, model_input, predictions, probabilities
+
+
+def get_scored_chunk(chunk: DataFrame, predictions: np.ndarray, probabilities: np.ndarray,
+                     first_row: int = 0) -> DataFrame:
+    """
+    Returns: DataFrame with the id (or row number), prediction and probability of each row of a scored chunk
+    """
+    try:
+        ids = chunk["id"].to_numpy() if "id" in chunk.columns else range(first_row, first_row + len(chunk))
+        logging.info(f"Scored rows {first_row} to {first_row + len(chunk)}")
+
+        return DataFrame({"id": ids, "prediction": predictions.astype(int), "probability": probabilities})
+
+    except Exception as e:
+        raise MyException(e, sys) from e
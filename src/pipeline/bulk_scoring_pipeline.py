@@ -0,0 +1,178 @@
+import json
+import os
+import sys
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from src.data_access.proj_data import ProjData
+from src.entity.config_entity import BulkScoringConfig
+from src.entity.estimator import MyModel
+from src.entity.s3_estimator import ProjEstimator
+from src.exception import MyException
+from src.logger import logging
+from src.pipeline.batch_prediction import RawVehicleDataTransformer
+
+# set once per worker process by _init_worker
+_worker_model: MyModel = None
+_worker_transformer: RawVehicleDataTransformer = None
+
+
+def _init_worker(model_bucket_name: str, model_file_path: str, model_registry_prefix: str) -> None:
+    '''
+    Loads one copy of the production model into each worker process
+    '''
+    global _worker_model, _worker_transformer
+    _worker_model = ProjEstimator(bucket_name=model_bucket_name, model_path=model_file_path,
+                                  registry_prefix=model_registry_prefix).get_model()
+    _worker_transformer = RawVehicleDataTransformer()
+
+
+def _score_chunk(chunk: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    model_input = _worker_transformer.transform(chunk)
+    predictions, probabilities = _worker_model.predict_with_proba(model_input)
+    positive_index = list(_worker_model.trained_model_object.classes_).index(1)
+    return predictions, probabilities[:, positive_index]
+
+
+class BulkScoringPipeline:
+    '''
+    Scores a whole MongoDB collection with the production model and writes the
+    predictions back into MongoDB.
+    Documents are read in _id order with a batched cursor, chunks are scored in
+    parallel by a process pool holding one model copy per worker and written
+    with unordered bulk writes. The last _id up to which every chunk is written
+    is checkpointed, so a killed job resumes where it stopped.
+    '''
+
+    def __init__(self, bulk_scoring_config: BulkScoringConfig = BulkScoringConfig()):
+        try:
+            self.bulk_scoring_config = bulk_scoring_config
+            self.proj_data = ProjData()
+            self.collection = self.proj_data.get_collection(bulk_scoring_config.collection_name)
+            # never the scored collection unless named explicitly, it feeds training
+            self.output_collection = self.proj_data.get_collection(
+                bulk_scoring_config.output_collection_name or f"{bulk_scoring_config.collection_name}_scores")
+            self.checkpoint_file_path = os.path.join(bulk_scoring_config.checkpoint_dir,
+                                                     f"{bulk_scoring_config.collection_name}_checkpoint.json")
+        except Exception as e:
+            raise MyException(e, sys) from e
+
+    def read_checkpoint(self) -> Optional[ObjectId]:
+        if not os.path.exists(self.checkpoint_file_path):
+            return None
+        with open(self.checkpoint_file_path) as checkpoint_file:
+            return ObjectId(json.load(checkpoint_file)["last_id"])
+
+    def write_checkpoint(self, last_id: ObjectId, rows_scored: int) -> None:
+        '''
+        Writes the checkpoint atomically so a kill never leaves a torn file
+        '''
+        os.makedirs(os.path.dirname(self.checkpoint_file_path), exist_ok=True)
+        tmp_file_path = self.checkpoint_file_path + ".tmp"
+        with open(tmp_file_path, "w") as checkpoint_file:
+            json.dump({"last_id": str(last_id), "rows_scored": rows_scored}, checkpoint_file)
+        os.replace(tmp_file_path, self.checkpoint_file_path)
+
+    def clear_checkpoint(self) -> None:
+        if os.path.exists(self.checkpoint_file_path):
+            os.remove(self.checkpoint_file_path)
+
+    def iter_chunks(self, after_id: Optional[ObjectId]) -> Iterator[Tuple[List[ObjectId], pd.DataFrame]]:
+        '''
+        Yields (document ids, raw feature DataFrame) chunks in _id order
+        '''
+        chunk_rows = self.bulk_scoring_config.chunk_rows
+        query = {} if after_id is None else {"_id": {"$gt": after_id}}
+        cursor = self.collection.find(query).sort("_id", 1).batch_size(chunk_rows)
+
+        documents = []
+        for document in cursor:
+            documents.append(document)
+            if len(documents) == chunk_rows:
+                yield self._to_chunk(documents)
+                documents = []
+        if documents:
+            yield self._to_chunk(documents)
+
+    @staticmethod
+    def _to_chunk(documents: List[dict]) -> Tuple[List[ObjectId], pd.DataFrame]:
+        chunk = pd.DataFrame(documents)
+        ids = chunk.pop("_id").tolist()
+        chunk.replace({"na": np.nan}, inplace=True)
+        return ids, chunk
+
+    def write_predictions(self, ids: List[ObjectId], predictions: np.ndarray, probabilities: np.ndarray) -> None:
+        upsert = self.output_collection.name != self.collection.name
+        requests = [
+            UpdateOne({"_id": _id},
+                      {"$set": {self.bulk_scoring_config.prediction_field: int(prediction),
+                                self.bulk_scoring_config.probability_field: float(probability)}},
+                      upsert=upsert)
+            for _id, prediction, probability in zip(ids, predictions, probabilities)
+        ]
+        self.output_collection.bulk_write(requests, ordered=False)
+
+    def run_pipeline(self, restart: bool = False) -> int:
+        '''
+        Scores every document after the checkpoint
+        Returns: number of documents scored by this run
+        '''
+        try:
+            if restart:
+                self.clear_checkpoint()
+            after_id = self.read_checkpoint()
+            logging.info(f"Bulk scoring collection {self.bulk_scoring_config.collection_name} "
+                         f"{'from the start' if after_id is None else f'after _id {after_id}'}")
+
+            workers = self.bulk_scoring_config.workers
+            chunks = self.iter_chunks(after_id)
+            # chunk number -> last _id of the chunk, for chunks written out of order
+            written: Dict[int, ObjectId] = {}
+            pending: Dict[Future, Tuple[int, List[ObjectId]]] = {}
+            next_chunk, next_checkpoint, rows_scored = 0, 0, 0
+
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(self.bulk_scoring_config.model_bucket_name,
+                                               self.bulk_scoring_config.model_file_path,
+                                               self.bulk_scoring_config.model_registry_prefix)) as executor:
+                exhausted = False
+                while pending or not exhausted:
+                    # keep every worker busy with one chunk queued behind it
+                    while not exhausted and len(pending) < 2 * workers:
+                        chunk = next(chunks, None)
+                        if chunk is None:
+                            exhausted = True
+                            break
+                        ids, dataframe = chunk
+                        pending[executor.submit(_score_chunk, dataframe)] = (next_chunk, ids)
+                        next_chunk += 1
+
+                    if not pending:
+                        break
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        chunk_number, ids = pending.pop(future)
+                        predictions, probabilities = future.result()
+                        self.write_predictions(ids, predictions, probabilities)
+                        written[chunk_number] = ids[-1]
+                        rows_scored += len(ids)
+
+                    # the checkpoint only moves past chunks with nothing unwritten before them
+                    last_id = None
+                    while next_checkpoint in written:
+                        last_id = written.pop(next_checkpoint)
+                        next_checkpoint += 1
+                    if last_id is not None:
+                        self.write_checkpoint(last_id, rows_scored)
+                        logging.info(f"Scored {rows_scored} documents, checkpoint at _id {last_id}")
+
+            logging.info(f"Bulk scoring finished, {rows_scored} documents scored")
+            return rows_scored
+
+        except Exception as e:
+            raise MyException(e, sys) from e
@@ -0,0 +1,125 @@
+import importlib.util
+import sys
+from typing import Optional, Tuple
+
+import numpy as np
+
+from src.exception import MyException
+from src.pipeline.prediction_pipeline import VehicleData
+
+arrow_media_type = "application/vnd.apache.arrow.stream"
+msgpack_media_types = ("application/msgpack", "application/x-msgpack")
+
+
+def get_missing_library(content_type: str) -> Optional[str]:
+    """
+    Returns the name of the library the content type needs when it is not installed, else None
+    """
+    library = "pyarrow" if content_type == arrow_media_type else "msgpack"
+    return None if importlib.util.find_spec(library) is not None else library
+
+
+def _column_to_feature(name: str, values) -> np.ndarray:
+    # kept as float64, VehicleData.check_features rejects what an int64 cast would change
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim != 1:
+        raise ValueError(f"Column {name} must be one dimensional")
+    return values
+
+
+def _stack_features(columns: dict) -> np.ndarray:
+    """
+    Builds the float64 (rows x 11) feature matrix in model column order
+    """
+    missing = [name for name in VehicleData.feature_dtypes if name not in columns]
+    if missing:
+        raise ValueError(f"Missing feature columns: {missing}")
+
+    n_rows = len(columns[next(iter(VehicleData.feature_dtypes))])
+    features = np.empty((n_rows, len(VehicleData.feature_dtypes)), dtype=np.float64)
+    for i, name in enumerate(VehicleData.feature_dtypes):
+        values = columns[name]
+        if len(values) != n_rows:
+            raise ValueError(f"Column {name} has {len(values)} values, expected {n_rows}")
+        features[:, i] = values
+    VehicleData.check_features(features)
+    return features
+
+
+def read_arrow_features(body: bytes) -> np.ndarray:
+    """
+    Reads an Arrow IPC stream with the 11 model feature columns into a feature matrix,
+    the numeric columns are viewed as numpy arrays without per row objects
+    """
+    try:
+        import pyarrow as pa
+
+        table = pa.ipc.open_stream(body).read_all()
+        columns = {}
+        for name in VehicleData.feature_dtypes:
+            if name not in table.column_names:
+                continue
+            column = table.column(name)
+            if column.null_count:
+                raise ValueError(f"Column {name} contains nulls")
+            columns[name] = _column_to_feature(name, column.to_numpy())
+        return _stack_features(columns)
+
+    except Exception as e:
+        raise MyException(e, sys) from e
+
+
+def write_arrow_predictions(predictions: np.ndarray, probabilities: np.ndarray) -> bytes:
+    import pyarrow as pa
+
+    table = pa.table({"prediction": pa.array(predictions.astype(np.int64)),
+                      "probability": pa.array(probabilities.astype(np.float64))})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def read_msgpack_features(body: bytes) -> Tuple[np.ndarray, bool]:
+    """
+    Reads a msgpack map of column name -> values. Values are either an array of
+    numbers or, without any per row objects, {"dtype": numpy dtype string,
+    "data": raw bytes of the typed array}
+    Returns: feature matrix and whether the columns were sent as typed binary arrays
+    """
+    try:
+        import msgpack
+
+        payload = msgpack.unpackb(body, raw=False)
+        if not isinstance(payload, dict):
+            raise ValueError("Expected a msgpack map of column name to values")
+
+        columns, binary = {}, False
+        for name in VehicleData.feature_dtypes:
+            if name not in payload:
+                continue
+            values = payload[name]
+            if isinstance(values, dict):
+                values = np.frombuffer(values["data"], dtype=np.dtype(values["dtype"]))
+                binary = True
+            columns[name] = _column_to_feature(name, values)
+        return _stack_features(columns), binary
+
+    except Exception as e:
+        raise MyException(e, sys) from e
+
+
+def write_msgpack_predictions(predictions: np.ndarray, probabilities: np.ndarray, binary: bool) -> bytes:
+    """
+    Answers in the shape the columns came in, typed binary arrays or arrays of numbers
+    """
+    import msgpack
+
+    predictions = predictions.astype("<i8")
+    probabilities = probabilities.astype("<f8")
+    if binary:
+        payload = {"prediction": {"dtype": "<i8", "data": predictions.tobytes()},
+                   "probability": {"dtype": "<f8", "data": probabilities.tobytes()}}
+    else:
+        payload = {"prediction": predictions.tolist(), "probability": probabilities.tolist()}
+    return msgpack.packb(payload, use_bin_type=True)
@@ -0,0 +1,99 @@
+import heapq
+import sys
+from itertools import count
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+from pandas import DataFrame
+
+from src.exception import MyException
+from src.logger import logging
+from src.pipeline.batch_prediction import RawVehicleDataTransformer, score_raw_chunks
+from src.pipeline.prediction_executor import PredictionExecutor
+
+
+class LeadRanker:
+    """
+    Keeps the k highest scoring leads seen so far, overall or per group, in
+    bounded min heaps. Memory is O(k x groups) however many rows are streamed.
+    """
+    group_columns = ("Region_Code", "Policy_Sales_Channel")
+
+    def __init__(self, k: int, group_by: Optional[str] = None) -> None:
+        if k < 1:
+            raise ValueError(f"k must be at least 1, got {k}")
+        if group_by is not None and group_by not in self.group_columns:
+            raise ValueError(f"Cannot rank per {group_by}, expected one of {self.group_columns}")
+
+        self.k = k
+        self.group_by = group_by
+        self.rows_seen = 0
+        self._heaps: Dict[object, list] = {}
+        # tie breaker so heap entries never compare ids
+        self._sequence = count()
+
+    def update(self, ids, scores: np.ndarray, groups=None) -> None:
+        """
+        Offers one chunk of scored rows to the ranking
+        """
+        scores = np.asarray(scores)
+        ids = np.asarray(ids)
+        self.rows_seen += len(scores)
+
+        if self.group_by is None:
+            self._push(None, ids, scores)
+            return
+
+        chunk = DataFrame({"group": np.asarray(groups), "score": scores})
+        for group, group_rows in chunk.groupby("group", sort=False).indices.items():
+            self._push(group, ids[group_rows], scores[group_rows])
+
+    def _push(self, group, ids: np.ndarray, scores: np.ndarray) -> None:
+        # only the chunk's own top k can make it into the heap
+        if len(scores) > self.k:
+            top = np.argpartition(scores, -self.k)[-self.k:]
+            ids, scores = ids[top], scores[top]
+
+        heap = self._heaps.setdefault(group, [])
+        for _id, score in zip(ids.tolist(), scores.tolist()):
+            entry = (score, next(self._sequence), _id)
+            if len(heap) < self.k:
+                heapq.heappush(heap, entry)
+            elif score > heap[0][0]:
+                heapq.heapreplace(heap, entry)
+
+    def ranked(self) -> List[dict]:
+        """
+        Returns the kept leads, best first (grouped by group when ranking per group)
+        """
+        ranked = []
+        for group in sorted(self._heaps, key=lambda group: (group is None, group)):
+            for rank, (score, _, _id) in enumerate(sorted(self._heaps[group], key=lambda entry: (-entry[0], entry[1])), start=1):
+                lead = {"id": _id, "probability": score, "rank": rank}
+                if self.group_by is not None:
+                    lead[self.group_by] = group.item() if isinstance(group, np.generic) else group
+                ranked.append(lead)
+        return ranked
+
+
+async def rank_raw_chunks(chunks: Iterator[DataFrame],
+                          executor: PredictionExecutor,
+                          transformer: RawVehicleDataTransformer,
+                          k: int,
+                          group_by: Optional[str] = None) -> List[dict]:
+    """
+    Scores raw schema chunks through the PredictionExecutor and returns the top k leads,
+    holding only the current chunk and the heaps in memory
+    """
+    try:
+        ranker = LeadRanker(k=k, group_by=group_by)
+        async for chunk, model_input, _, probabilities in score_raw_chunks(chunks, executor, transformer):
+            ids = (chunk["id"].to_numpy() if "id" in chunk.columns
+                   else np.arange(ranker.rows_seen, ranker.rows_seen + len(chunk)))
+            ranker.update(ids, probabilities, groups=model_input[group_by].to_numpy() if group_by else None)
+
+        logging.info(f"Ranked {ranker.rows_seen} rows, kept the top {k}{f' per {group_by}' if group_by else ''}")
+        return ranker.ranked()
+
+    except Exception as e:
+        raise MyException(e, sys) from e
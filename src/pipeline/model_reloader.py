@@ -0,0 +1,73 @@
+import asyncio
+import time
+
+from src.constants import model_reload_poll_seconds
+from src.logger import logging
+from src.pipeline.prediction_pipeline import VehicleDataClassifier
+
+
+class ModelReloader:
+    """
+    Polls the model registry manifest (or, without a registry, the ETag/LastModified of
+    the production model object) in S3 and hot swaps a changed model into the process.
+    The S3 calls, unpickling and validation run in worker threads with timeouts,
+    requests keep being served by the old model until the swap.
+    """
+    def __init__(self,
+                 classifier: VehicleDataClassifier,
+                 poll_seconds: float = model_reload_poll_seconds) -> None:
+        self.classifier = classifier
+        self.poll_seconds = poll_seconds
+        self.checks = 0
+        self.reloads = 0
+        self.failures = 0
+        self.last_checked: float = None
+        self.last_error: str = None
+        self._worker: asyncio.Task = None
+
+    def start(self) -> None:
+        """
+        Starts polling in the running event loop, a poll_seconds of 0 disables hot reload
+        """
+        if self.poll_seconds <= 0:
+            logging.info("Model hot reload is disabled")
+            return
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.get_running_loop().create_task(self._poll())
+            logging.info(f"Polling the production model for changes every {self.poll_seconds}s")
+
+    async def stop(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    async def _poll(self) -> None:
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            try:
+                reloaded = await self.classifier.reload_model()
+                self.checks += 1
+                self.last_checked = time.time()
+                if reloaded:
+                    self.reloads += 1
+                    self.last_error = None
+            except Exception as e:
+                # a bad upload or an S3 outage keeps the current model serving
+                self.failures += 1
+                self.last_error = f"{e}"
+                logging.error(f"Model reload failed, keeping the current model: {e}")
+
+    def stats(self) -> dict:
+        return {
+            **self.classifier.get_estimator().model_holder.get_status(),
+            "poll_seconds": self.poll_seconds,
+            "checks": self.checks,
+            "reloads": self.reloads,
+            "failures": self.failures,
+            "last_checked": self.last_checked,
+            "last_error": self.last_error,
+        }
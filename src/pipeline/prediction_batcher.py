@@ -0,0 +1,113 @@
+import asyncio
+from typing import List, Tuple
+
+from src.constants import prediction_coalesce_max_rows, prediction_coalesce_window_ms
+from src.logger import logging
+from src.pipeline.prediction_executor import PredictionExecutor, PredictionQueueFullError
+
+
+class PredictionBatcher:
+    """
+    Coalesces single row predictions that arrive close together into one
+    VehicleDataClassifier.predict_batch call and hands every caller back its own row.
+    A batch is scored once max_batch_size rows are waiting or max_wait_ms passed
+    since its first row arrived, batches run in the PredictionExecutor pool so
+    the next one is collected while earlier ones are scored.
+    At most the executor's max_queue batches are scored at once, rows arriving
+    meanwhile wait to form the next batches and beyond max_queue full batches
+    of waiting rows further rows are rejected.
+    """
+    def __init__(self,
+                 executor: PredictionExecutor,
+                 max_batch_size: int = prediction_coalesce_max_rows,
+                 max_wait_ms: float = prediction_coalesce_window_ms) -> None:
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue: asyncio.Queue = None
+        self._scoring_slots: asyncio.Semaphore = None
+        self._worker: asyncio.Task = None
+        self._loop: asyncio.AbstractEventLoop = None
+        self._scoring: set = set()
+
+    async def start(self) -> None:
+        """
+        Starts the background task collecting the batches, must run inside the event loop
+        """
+        loop = asyncio.get_running_loop()
+        # a worker bound to another (closed) event loop can never wake up again
+        if self._worker is None or self._worker.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._scoring_slots = asyncio.Semaphore(self.executor.max_queue)
+            self._worker = loop.create_task(self._collect_batches())
+            logging.info(f"Prediction batcher started with max_batch_size={self.max_batch_size}, max_wait_ms={self.max_wait * 1000}")
+
+    async def stop(self) -> None:
+        if self._worker is not None and self._loop is asyncio.get_running_loop():
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+            logging.info("Prediction batcher stopped")
+
+    async def predict(self, record: dict) -> Tuple[int, float]:
+        """
+        Queues one VehicleData shaped record and waits for its batch to be scored
+        Returns: predicted label and probability of a positive response
+        """
+        await self.start()
+        if self._queue.qsize() >= self.executor.max_queue * self.max_batch_size:
+            raise PredictionQueueFullError(f"Prediction queue is full ({self._queue.qsize()} rows waiting), try again later")
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((record, future))
+        return await future
+
+    async def _collect_batches(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            # wait for a free slot first, rows arriving meanwhile fill up the next batch
+            await self._scoring_slots.acquire()
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            task = loop.create_task(self._score_batch(batch))
+            # keep a reference until done, the loop only holds weak ones
+            self._scoring.add(task)
+            task.add_done_callback(self._scoring.discard)
+            task.add_done_callback(lambda _, slots=self._scoring_slots: slots.release())
+
+    async def _score_batch(self, batch: List[tuple]) -> None:
+        futures = [future for _, future in batch]
+        try:
+            predictions, probabilities = await self.executor.predict_records([record for record, _ in batch])
+
+        except Exception as e:
+            if len(batch) > 1 and not isinstance(e, PredictionQueueFullError):
+                # one bad record must not fail the others coalesced with it, each gets its own answer
+                logging.warning(f"Batch of {len(batch)} records failed ({e}), scoring them one by one")
+                # one at a time, the retries hold this batch's slot and do not crowd the executor queue
+                for item in batch:
+                    await self._score_batch([item])
+                return
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for future, prediction, probability in zip(futures, predictions, probabilities):
+            # the caller may have gone away while its batch was scored
+            if not future.done():
+                future.set_result((int(prediction), float(probability)))
@@ -0,0 +1,81 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+from src.constants import prediction_cache_max_size, prediction_cache_ttl_seconds
+from src.logger import logging
+
+
+class PredictionCache:
+    """
+    In-process cache of single row predictions keyed by the canonical feature tuple
+    built by VehicleData. Entries are evicted least recently used first once
+    max_size is reached and expire after ttl_seconds. Every entry belongs to a model
+    version (ModelHolder.version), the whole cache is dropped as soon as a newer
+    version is seen and results of an older one are never stored.
+    """
+    def __init__(self,
+                 max_size: int = prediction_cache_max_size,
+                 ttl_seconds: float = prediction_cache_ttl_seconds) -> None:
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._model_version = None
+        self._lock = threading.Lock()
+
+    def _is_current(self, model_version: int) -> bool:
+        """
+        Moves the cache to a newer model version, False for a version older than the cached one
+        """
+        if self._model_version is not None and model_version < self._model_version:
+            return False
+        if model_version != self._model_version:
+            if self._entries:
+                self.invalidations += 1
+                logging.info(f"Model version changed to {model_version}, dropping {len(self._entries)} cached predictions")
+            self._entries.clear()
+            self._model_version = model_version
+        return True
+
+    def get(self, key: Hashable, model_version: int) -> Optional[object]:
+        with self._lock:
+            entry = self._entries.get(key) if self._is_current(model_version) else None
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value: object, model_version: int) -> None:
+        """
+        Stores a prediction made with model_version, dropped if the model changed meanwhile
+        """
+        with self._lock:
+            if not self._is_current(model_version):
+                return
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "model_version": self._model_version,
+            }
@@ -0,0 +1,186 @@
+import asyncio
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, List, Tuple
+
+import numpy as np
+
+from src.constants import prediction_executor_max_queue, prediction_executor_type, prediction_executor_workers
+from src.entity.config_entity import VehiclePredictorConfig
+from src.logger import logging
+from src.pipeline.prediction_pipeline import VehicleData, VehicleDataClassifier
+
+
+class PredictionQueueFullError(Exception):
+    """
+    Raised when more model calls are waiting than the executor allows
+    """
+
+
+# one classifier per worker process, the model itself is cached by ModelHolder
+_process_classifier: VehicleDataClassifier = None
+# metadata of the parent's model the worker last synced with
+_process_parent_metadata: dict = None
+_process_warmed_up: bool = False
+
+
+def _sync_process_model(prediction_pipeline_config: VehiclePredictorConfig, parent_metadata: dict) -> None:
+    """
+    Loads the model into this worker, and again whenever the parent hot reloaded
+    another one, so the worker scores with the model the parent's version names
+    """
+    global _process_classifier, _process_parent_metadata
+    if _process_classifier is None:
+        _process_classifier = VehicleDataClassifier(prediction_pipeline_config=prediction_pipeline_config)
+    if parent_metadata == _process_parent_metadata:
+        return
+
+    estimator = _process_classifier.get_estimator()
+    holder = estimator.model_holder
+    if holder.model is None:
+        estimator.get_model()
+    elif holder.metadata != parent_metadata:
+        start = time.perf_counter()
+        model, metadata = estimator.load_model(with_metadata=True)
+        holder.swap(model, metadata, load_seconds=time.perf_counter() - start)
+    # remembered even if S3 gave another model than the parent's, it is not loaded again until the parent changes
+    _process_parent_metadata = parent_metadata
+
+
+def _warmup_process(prediction_pipeline_config: VehiclePredictorConfig, parent_metadata: dict, n_rows: int) -> int:
+    """
+    Loads the model into this worker and runs it through every prediction path
+    Returns: the worker's pid
+    """
+    global _process_warmed_up
+    _sync_process_model(prediction_pipeline_config, parent_metadata)
+    if not _process_warmed_up:
+        _process_classifier.warmup(n_rows)
+        _process_warmed_up = True
+    return os.getpid()
+
+
+def _init_process_worker(prediction_pipeline_config: VehiclePredictorConfig, parent_metadata: dict,
+                         n_rows: int) -> None:
+    # a worker started later, e.g. to replace one that died, is warm before its first call
+    try:
+        _warmup_process(prediction_pipeline_config, parent_metadata, n_rows)
+    except Exception as e:
+        # an initializer error would break the whole pool, the worker loads on its first call instead
+        logging.error(f"Prediction worker {os.getpid()} failed to warm up: {e}")
+
+
+def _predict_records_in_process(prediction_pipeline_config: VehiclePredictorConfig, parent_metadata: dict,
+                                records: List[dict]) -> Tuple[np.ndarray, np.ndarray]:
+    _sync_process_model(prediction_pipeline_config, parent_metadata)
+    if len(records) == 1:
+        return _process_classifier.predict_record(records[0])
+    dataframe = VehicleData.get_batch_input_data_frame(records)
+    return _process_classifier.predict_batch(dataframe=dataframe)
+
+
+def _predict_features_in_process(prediction_pipeline_config: VehiclePredictorConfig, parent_metadata: dict,
+                                 features: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    _sync_process_model(prediction_pipeline_config, parent_metadata)
+    return _process_classifier.predict_features(features)
+
+
+class PredictionExecutor:
+    """
+    Runs the CPU bound part of a prediction (DataFrame building, preprocessing,
+    forest predict and the first model load) in a thread or process pool so the
+    event loop keeps serving other requests.
+    At most max_queue calls may be waiting or running, further calls are rejected.
+    Process workers hold their own model, each call tells them which model the
+    parent holds so a hot reload reaches them too.
+    """
+    def __init__(self,
+                 classifier: VehicleDataClassifier,
+                 executor_type: str = prediction_executor_type,
+                 max_workers: int = prediction_executor_workers,
+                 max_queue: int = prediction_executor_max_queue) -> None:
+        if executor_type not in ("thread", "process"):
+            raise ValueError(f"Unknown prediction executor type: {executor_type}, expected 'thread' or 'process'")
+
+        self.classifier = classifier
+        self.executor_type = executor_type
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.pending = 0
+        self.warmup_rows = 8
+        self._pool: Executor = None
+
+    def _get_pool(self) -> Executor:
+        if self._pool is None:
+            if self.executor_type == "thread":
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_process_worker,
+                                                 initargs=(self.classifier.prediction_pipeline_config,
+                                                           self.classifier.get_estimator().model_holder.metadata,
+                                                           self.warmup_rows))
+            logging.info(f"Started {self.executor_type} pool for predictions with {self.max_workers} workers")
+        return self._pool
+
+    def _predict_records(self, records: List[dict]) -> Tuple[np.ndarray, np.ndarray]:
+        # a lone row skips pandas entirely
+        if len(records) == 1:
+            return self.classifier.predict_record(records[0])
+        dataframe = VehicleData.get_batch_input_data_frame(records)
+        return self.classifier.predict_batch(dataframe=dataframe)
+
+    async def _run(self, thread_func: Callable, process_func: Callable, argument) -> Tuple[np.ndarray, np.ndarray]:
+        if self.pending >= self.max_queue:
+            raise PredictionQueueFullError(f"Prediction queue is full ({self.max_queue} calls waiting), try again later")
+
+        loop = asyncio.get_running_loop()
+        self.pending += 1
+        try:
+            if self.executor_type == "thread":
+                return await loop.run_in_executor(self._get_pool(), thread_func, argument)
+            return await loop.run_in_executor(self._get_pool(), process_func,
+                                              self.classifier.prediction_pipeline_config,
+                                              self.classifier.get_estimator().model_holder.metadata, argument)
+        finally:
+            self.pending -= 1
+
+    async def predict_records(self, records: List[dict]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Scores VehicleData shaped records inside the pool
+        Returns: predicted labels and the probability of a positive response
+        """
+        return await self._run(self._predict_records, _predict_records_in_process, records)
+
+    async def predict_features(self, features: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Scores a float64 feature matrix in model column order inside the pool
+        Returns: predicted labels and the probability of a positive response
+        """
+        return await self._run(self.classifier.predict_features, _predict_features_in_process, features)
+
+    async def warmup(self, n_rows: int = 8) -> None:
+        """
+        Loads the model into every process worker and scores synthetic rows there, so
+        the first real requests do not pay for it. Thread workers share the parent's
+        model, which VehicleDataClassifier.warmup already warms
+        """
+        if self.executor_type == "thread":
+            return
+        self.warmup_rows = n_rows
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+        # submitting one call per worker before any finishes starts every worker, each
+        # runs the warming initializer first, the calls warm any worker whose initializer failed
+        pids = await asyncio.gather(*(loop.run_in_executor(pool, _warmup_process,
+                                                           self.classifier.prediction_pipeline_config,
+                                                           self.classifier.get_estimator().model_holder.metadata,
+                                                           n_rows)
+                                      for _ in range(self.max_workers)))
+        logging.info(f"Warmed up {len(set(pids))} of {self.max_workers} prediction worker processes")
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+            logging.info(f"Stopped {self.executor_type} pool for predictions")
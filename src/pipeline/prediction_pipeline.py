@@ -1,12 +1,36 @@
+import asyncio
 import sys
+import time
 from src.entity.config_entity import VehiclePredictorConfig
-from src.entity.s3_estimator import ProjEstimator
+from src.entity.s3_estimator import ProjEstimator, describe_model
+from src.entity.compact_model import AffinePreprocessor
+from src.entity.estimator import MyModel
 from src.exception import MyException
 from src.logger import logging
+from src.utils.metrics import dataframe_seconds, fast_transform_seconds
 from pandas import DataFrame
+from typing import List, Tuple
+import numpy as np
 
 
 class VehicleData:
+    # model input columns in training order with the dtype each is cast to
+    feature_dtypes = {
+        "Gender": "int64",
+        "Age": "int64",
+        "Driving_License": "int64",
+        "Region_Code": "float64",
+        "Previously_Insured": "int64",
+        "Annual_Premium": "float64",
+        "Policy_Sales_Channel": "float64",
+        "Vintage": "int64",
+        "Vehicle_Age_lt_1_Year": "int64",
+        "Vehicle_Age_gt_2_Years": "int64",
+        "Vehicle_Damage_Yes": "int64",
+    }
+    # columns that only take whole numbers, e.g. Age=30.9 is rejected rather than truncated
+    integer_columns = np.array(list(feature_dtypes.values())) == "int64"
+
     def __init__(self,
                 Gender,
                 Age,
@@ -46,13 +70,105 @@ class VehicleData:
         """
         try:
             
+            start = time.perf_counter()
             vehicle_input_dict = self.get_vehicle_data_as_dict()
-            return DataFrame(vehicle_input_dict)
+            dataframe = DataFrame(vehicle_input_dict)
+            dataframe_seconds.observe(time.perf_counter() - start)
+            return dataframe
         
         except Exception as e:
             raise MyException(e, sys) from e
 
 
+    def get_vehicle_data_as_record(self) -> dict:
+        """
+        This function returns one flat record in model column order
+        """
+        return {column: getattr(self, column) for column in VehicleData.feature_dtypes}
+
+    def get_vehicle_feature_key(self) -> tuple:
+        """
+        This function returns the canonical feature tuple of this vehicle, see get_feature_key
+        """
+        return VehicleData.get_feature_key(self.get_vehicle_data_as_record())
+
+    @staticmethod
+    def check_features(features: np.ndarray) -> None:
+        """
+        Raises ValueError unless every value of the float64 feature matrix is finite
+        and every value of an int64 column is a whole number. Every prediction path
+        applies this one rule, so a record is scored the same alone or in a batch
+        """
+        columns = list(VehicleData.feature_dtypes)
+        not_finite = np.argwhere(~np.isfinite(features))
+        if len(not_finite):
+            row, column = not_finite[0]
+            raise ValueError(f"{columns[column]} of row {row} must be a finite number, got {features[row, column]}")
+        integer_features = features[:, VehicleData.integer_columns]
+        not_whole = np.argwhere(integer_features != np.trunc(integer_features))
+        if len(not_whole):
+            row, column = not_whole[0]
+            column = np.flatnonzero(VehicleData.integer_columns)[column]
+            raise ValueError(f"{columns[column]} of row {row} must be a whole number, got {features[row, column]}")
+
+    @staticmethod
+    def parse_record(record: dict) -> np.ndarray:
+        """
+        Parses one VehicleData shaped record into its (1, 11) float64 feature row, see check_features
+        """
+        row = np.array([[float(record[column]) for column in VehicleData.feature_dtypes]])
+        VehicleData.check_features(row)
+        return row
+
+    @staticmethod
+    def get_feature_key(record: dict) -> tuple:
+        """
+        Canonical 11 feature tuple of a record, "35", 35 and 35.0 give the same key
+        """
+        return tuple(VehicleData.parse_record(record)[0].tolist())
+
+    @staticmethod
+    def get_batch_input_data_frame(records: List[dict]) -> DataFrame:
+        """
+        This function returns one typed DataFrame from many VehicleData shaped records
+        """
+        try:
+            start = time.perf_counter()
+            # parsed and checked like parse_record, so the int64 cast below never changes a value
+            features = np.column_stack([
+                np.asarray([record[column] for record in records], dtype=np.float64)
+                for column in VehicleData.feature_dtypes
+            ])
+            VehicleData.check_features(features)
+            dataframe = DataFrame(features, columns=list(VehicleData.feature_dtypes)).astype(VehicleData.feature_dtypes)
+            dataframe_seconds.observe(time.perf_counter() - start)
+            return dataframe
+
+        except Exception as e:
+            raise MyException(e, sys) from e
+
+    @staticmethod
+    def get_synthetic_vehicles(n_rows: int) -> List["VehicleData"]:
+        """
+        This function returns reproducible made up vehicles within the training value ranges
+        """
+        rng = np.random.default_rng(0)
+        vehicle_age = rng.integers(0, 3, n_rows)
+        return [
+            VehicleData(Gender=int(rng.integers(0, 2)),
+                        Age=int(rng.integers(20, 80)),
+                        Driving_License=1,
+                        Region_Code=float(rng.integers(0, 53)),
+                        Previously_Insured=int(rng.integers(0, 2)),
+                        Annual_Premium=float(rng.uniform(2630, 60000)),
+                        Policy_Sales_Channel=float(rng.integers(1, 164)),
+                        Vintage=int(rng.integers(10, 300)),
+                        Vehicle_Age_lt_1_Year=int(vehicle_age[row] == 0),
+                        Vehicle_Age_gt_2_Years=int(vehicle_age[row] == 2),
+                        Vehicle_Damage_Yes=int(rng.integers(0, 2)))
+            for row in range(n_rows)
+        ]
+
     def get_vehicle_data_as_dict(self):
         """
         This function returns a dictionary from VehicleData class input
@@ -81,6 +197,67 @@ class VehicleData:
         except Exception as e:
             raise MyException(e, sys) from e
 
+class VehicleFastPredictor:
+    """
+    Pandas free prediction path for single rows and columnar feature matrices.
+    The fitted StandardScaler/MinMaxScaler of the preprocessing pipeline are applied
+    as one vectorized affine transform over a float array in model column order,
+    doing the same floating point operations as sklearn so results are bit for bit
+    identical to MyModel.predict
+    """
+    def __init__(self, model: MyModel) -> None:
+        try:
+            self.model = model
+            self.trained_model_object = model.trained_model_object
+            self.preprocessor = AffinePreprocessor.from_preprocessor(model.preprocessing_object)
+
+            input_columns = list(self.preprocessor.feature_names_in_)
+            if input_columns != list(VehicleData.feature_dtypes):
+                raise ValueError(f"Model was trained on columns {input_columns}")
+
+        except Exception as e:
+            raise MyException(e, sys) from e
+
+    def transform_record(self, record: dict) -> np.ndarray:
+        """
+        Parses one VehicleData shaped record straight into the transformed feature row
+        """
+        return self.transform_features(VehicleData.parse_record(record))
+
+    def transform_features(self, features: np.ndarray) -> np.ndarray:
+        """
+        Transforms a float64 matrix with one row per vehicle in model column order
+        """
+        start = time.perf_counter()
+        # the forest evaluates its splits on float32 input
+        transformed = self.preprocessor.transform_array(features).astype(np.float32)
+        fast_transform_seconds.observe(time.perf_counter() - start)
+        return transformed
+
+    def predict_with_proba(self, record: dict) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns: predicted label and probability of each class for one record
+        """
+        try:
+            probabilities = self.model.predict_transformed_proba(self.transform_record(record))
+            predictions = self.trained_model_object.classes_.take(np.argmax(probabilities, axis=1), axis=0)
+            return predictions, probabilities
+
+        except Exception as e:
+            raise MyException(e, sys) from e
+
+    def predict_features_with_proba(self, features: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns: predicted labels and probability of each class for a feature matrix
+        """
+        try:
+            probabilities = self.model.predict_transformed_proba(self.transform_features(features))
+            predictions = self.trained_model_object.classes_.take(np.argmax(probabilities, axis=1), axis=0)
+            return predictions, probabilities
+
+        except Exception as e:
+            raise MyException(e, sys) from e
+
 class VehicleDataClassifier:
     def __init__(self,prediction_pipeline_config: VehiclePredictorConfig = VehiclePredictorConfig(),) -> None:
         """
@@ -88,9 +265,25 @@ class VehicleDataClassifier:
         """
         try:
             self.prediction_pipeline_config = prediction_pipeline_config
+            self._estimator: ProjEstimator = None
+            self._fast_predictor: VehicleFastPredictor = None
+            self._rejected_metadata: dict = None
         except Exception as e:
             raise MyException(e, sys)
 
+    def get_estimator(self) -> ProjEstimator:
+        """
+        Returns the estimator of this classifier, the model itself is
+        shared process wide through ModelHolder and loaded only once
+        """
+        if self._estimator is None:
+            self._estimator = ProjEstimator(
+                bucket_name=self.prediction_pipeline_config.model_bucket_name,
+                model_path=self.prediction_pipeline_config.model_file_path,
+                registry_prefix=self.prediction_pipeline_config.model_registry_prefix,
+            )
+        return self._estimator
+
     def predict(self, dataframe) -> str:
         """
         This is the method of VehicleDataClassifier
@@ -98,13 +291,152 @@ class VehicleDataClassifier:
         """
         try:
             logging.info("Entered predict method of VehicleDataClassifier class")
-            model = ProjEstimator(
-                bucket_name=self.prediction_pipeline_config.model_bucket_name,
-                model_path=self.prediction_pipeline_config.model_file_path,
-            )
+            model = self.get_estimator()
             result =  model.predict(dataframe)
             
             return result
         
         except Exception as e:
-            raise MyException(e, sys)
\ No newline at end of file
+            raise MyException(e, sys)
+
+    def predict_batch(self, dataframe: DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Scores a whole batch with a single call to the model
+        Returns: predicted labels and the probability of a positive response
+        """
+        try:
+            logging.info(f"Entered predict_batch method of VehicleDataClassifier class with {len(dataframe)} rows")
+            # one model reference for the whole call, a hot reload may swap it meanwhile
+            model = self.get_estimator().get_model()
+            predictions, probabilities = model.predict_with_proba(dataframe)
+            positive_index = list(model.trained_model_object.classes_).index(1)
+
+            return predictions, probabilities[:, positive_index]
+
+        except Exception as e:
+            raise MyException(e, sys) from e
+
+    def get_model_version(self) -> int:
+        """
+        Returns a number that changes whenever the process wide model is loaded or replaced
+        """
+        return self.get_estimator().model_holder.version
+
+    def get_fast_predictor(self) -> VehicleFastPredictor:
+        """
+        Returns the fast path predictor built for the currently loaded model
+        """
+        model = self.get_estimator().get_model()
+        fast_predictor = self._fast_predictor
+        if fast_predictor is None or fast_predictor.model is not model:
+            fast_predictor = VehicleFastPredictor(model)
+            self._fast_predictor = fast_predictor
+        return fast_predictor
+
+    def warmup(self, n_rows: int = 8) -> None:
+        """
+        Loads the model and runs synthetic VehicleData rows through every prediction
+        path (single row DataFrame, batch and fast path), so the first real request
+        does not pay for the S3 download, unpickling or first call overheads
+        """
+        try:
+            vehicles = VehicleData.get_synthetic_vehicles(n_rows)
+            records = [vehicle.get_vehicle_data_as_record() for vehicle in vehicles]
+
+            self.predict(dataframe=vehicles[0].get_vehicle_input_data_frame())
+            self.predict_batch(dataframe=VehicleData.get_batch_input_data_frame(records))
+            for record in records:
+                self.predict_record(record)
+
+            logging.info(f"Warmed up the prediction pipeline with {n_rows} synthetic rows")
+
+        except Exception as e:
+            raise MyException(e, sys) from e
+
+    @staticmethod
+    def validate_model(model: MyModel, n_rows: int = 8) -> None:
+        """
+        Raises if a freshly downloaded model cannot score synthetic rows through
+        the batch and fast paths or gives unusable probabilities
+        """
+        if not isinstance(model, MyModel):
+            raise ValueError(f"Expected a MyModel, got {type(model).__name__}")
+        if 1 not in list(model.trained_model_object.classes_):
+            raise ValueError(f"Model classes {model.trained_model_object.classes_} have no positive class")
+
+        records = [vehicle.get_vehicle_data_as_record() for vehicle in VehicleData.get_synthetic_vehicles(n_rows)]
+        _, probabilities = model.predict_with_proba(VehicleData.get_batch_input_data_frame(records))
+        _, fast_probabilities = VehicleFastPredictor(model).predict_with_proba(records[0])
+        if probabilities.shape[0] != n_rows or not np.isfinite(probabilities).all():
+            raise ValueError("Model returned malformed probabilities for the validation rows")
+        if not np.allclose(fast_probabilities[0], probabilities[0]):
+            raise ValueError("Fast path and batch path of the model disagree")
+
+    async def reload_model(self, n_rows: int = 8) -> bool:
+        """
+        Checks the registry champion (or the model object's ETag and LastModified)
+        in S3 and, if it changed, downloads and validates the new model and swaps it in.
+        S3 calls run on the S3 threads and validation in the default executor,
+        the event loop keeps serving requests meanwhile
+        Returns: True if a new model was swapped in
+        """
+        try:
+            estimator = self.get_estimator()
+            holder = estimator.model_holder
+            # nothing loaded yet, the first get_model call loads the current object
+            if holder.model is None:
+                return False
+
+            metadata = await estimator.get_model_metadata_async()
+            # an object that failed validation is not downloaded again until it changes
+            if metadata == holder.metadata or metadata == self._rejected_metadata:
+                return False
+
+            logging.info(f"Production model changed ({describe_model(holder.metadata)} -> {describe_model(metadata)}), "
+                         f"reloading")
+            start = time.perf_counter()
+            model, metadata = await estimator.load_model_async(with_metadata=True)
+            # s3 failed after the HEAD and the cached copy of the held model was served
+            if metadata == holder.metadata:
+                return False
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self.validate_model, model, n_rows)
+            except Exception:
+                self._rejected_metadata = metadata
+                raise
+            holder.swap(model, metadata, load_seconds=time.perf_counter() - start)
+            return True
+
+        except Exception as e:
+            raise MyException(e, sys) from e
+
+    def predict_features(self, features: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Scores a float64 feature matrix in model column order through the pandas
+        free path, for columnar batches
+        Returns: predicted labels and the probability of a positive response
+        """
+        try:
+            fast_predictor = self.get_fast_predictor()
+            predictions, probabilities = fast_predictor.predict_features_with_proba(features)
+            positive_index = list(fast_predictor.trained_model_object.classes_).index(1)
+
+            return predictions, probabilities[:, positive_index]
+
+        except Exception as e:
+            raise MyException(e, sys) from e
+
+    def predict_record(self, record: dict) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Scores one VehicleData shaped record through the pandas free fast path
+        Returns: predicted label and the probability of a positive response
+        """
+        try:
+            fast_predictor = self.get_fast_predictor()
+            predictions, probabilities = fast_predictor.predict_with_proba(record)
+            positive_index = list(fast_predictor.trained_model_object.classes_).index(1)
+
+            return predictions, probabilities[:, positive_index]
+
+        except Exception as e:
+            raise MyException(e, sys) from e
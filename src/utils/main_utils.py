@@ -2,7 +2,6 @@ import os
 import sys 
 
 import numpy as np
-import dill # extends the functionality of pickle module
 import yaml
 from pandas import DataFrame
 
@@ -17,6 +16,17 @@ def read_yaml_file(file_path:str)->dict:
     except Exception as e:
         raise MyException(e,sys) from e
 
+def get_schema_dtypes(schema_config:dict)->dict:
+    '''
+    Returns {column name: pandas dtype} from the columns section of schema.yaml
+    '''
+    try:
+        dtype_map={"int":"int64","float":"float64","category":"category"}
+        return {column:dtype_map[dtype] for entry in schema_config["columns"] for column,dtype in entry.items()}
+
+    except Exception as e:
+        raise MyException(e,sys) from e
+
 def write_yaml_file(file_path:str,content:object,replace: bool=False)->None:
     try:
         if replace:
@@ -32,11 +42,18 @@ def write_yaml_file(file_path:str,content:object,replace: bool=False)->None:
 
 def load_object(file_path:str)->object:
     '''
-    Returns model/object from project directory{file_path}
+    Returns model/object from project directory{file_path}, compact model
+    artifacts (see save_object) are recognized by their first bytes
     '''
+    def unpickle(file_obj):
+        # dill extends the functionality of pickle module, only needed here
+        import dill
+        return dill.load(file_obj)
+
     try:
+        from src.entity.compact_model import load_model_file
         with open(file_path,"rb") as file_obj:
-            obj=dill.load(file_obj)
+            obj=load_model_file(file_obj,unpickle)
         return obj
     except Exception as e:
         raise MyException(e,sys) from e
@@ -65,13 +82,21 @@ def load_numpy_array_data(file_path:str)->np.array:
     except Exception as e:
         raise MyException(e,sys) from e
 
-def save_object(file_path:str,obj:object)->None:
+def save_object(file_path:str,obj:object,compact:bool=False)->None:
+    '''
+    compact: write a MyModel in the compact array format instead of a dill pickle
+    '''
     logging.info("Entered the save_object method of utils")
 
     try:
         os.makedirs(os.path.dirname(file_path),exist_ok=True)
         with open(file_path,"wb") as file_obj:
-            dill.dump(obj,file_obj)
+            if compact:
+                from src.entity.compact_model import save_compact_model
+                save_compact_model(obj,file_obj)
+            else:
+                import dill
+                dill.dump(obj,file_obj)
 
         logging.info("Exited the save_object method of utils")
 
@@ -0,0 +1,129 @@
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Callable, Dict, Optional
+
+import uvicorn
+
+from src.exception import MyException
+from src.logger import logging, stop_logging
+
+def get_process_memory(pid:int)->Optional[Dict[str,int]]:
+    '''
+    Returns rss, pss, unique (private) and shared memory of a process in bytes,
+    read from /proc/<pid>/smaps_rollup. None where that file is not available
+    '''
+    try:
+        fields={}
+        with open(f"/proc/{pid}/smaps_rollup") as smaps_file:
+            for line in smaps_file:
+                parts=line.split()
+                if len(parts)==3 and parts[2]=="kB":
+                    fields[parts[0].rstrip(":")]=int(parts[1])*1024
+        return {
+            "rss":fields.get("Rss",0),
+            "pss":fields.get("Pss",0),
+            "unique":fields.get("Private_Clean",0)+fields.get("Private_Dirty",0),
+            "shared":fields.get("Shared_Clean",0)+fields.get("Shared_Dirty",0),
+        }
+    except OSError:
+        return None
+
+class PreforkServer:
+    '''
+    Runs the app in several uvicorn worker processes forked from one master that
+    loaded the model first. Workers inherit the model pages copy-on-write, so the
+    forest and preprocessing pipeline exist once in memory instead of once per worker.
+    The master restarts workers that die and logs each worker's unique memory.
+    '''
+    def __init__(self,app,host:str,port:int,workers:int,preload:Callable[[],None],
+                 memory_report_seconds:float):
+        self.app=app
+        self.host=host
+        self.port=port
+        self.workers=workers
+        self.preload=preload
+        self.memory_report_seconds=memory_report_seconds
+        self.worker_pids:Dict[int,int]={}
+        self._stopping=False
+
+    def _spawn_worker(self,sock:socket.socket,worker_id:int)->None:
+        pid=os.fork()
+        if pid==0:
+            # worker: default signal handling, uvicorn installs its own
+            signal.signal(signal.SIGTERM,signal.SIG_DFL)
+            signal.signal(signal.SIGINT,signal.SIG_DFL)
+            try:
+                server=uvicorn.Server(uvicorn.Config(self.app,host=self.host,port=self.port))
+                server.run(sockets=[sock])
+            finally:
+                # os._exit skips atexit, write out the queued log records first
+                stop_logging()
+                os._exit(0)
+        self.worker_pids[pid]=worker_id
+        logging.info(f"Started worker {worker_id} with pid {pid}")
+
+    def _stop(self,signum,frame)->None:
+        self._stopping=True
+        for pid in list(self.worker_pids):
+            try:
+                os.kill(pid,signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def report_memory(self)->None:
+        for pid,worker_id in sorted(self.worker_pids.items(),key=lambda item:item[1]):
+            memory=get_process_memory(pid)
+            if memory is None:
+                continue
+            logging.info(f"Worker {worker_id} (pid {pid}) memory MB: "
+                         f"unique={memory['unique']/2**20:.1f} shared={memory['shared']/2**20:.1f} "
+                         f"rss={memory['rss']/2**20:.1f} pss={memory['pss']/2**20:.1f}")
+
+    def run(self)->None:
+        try:
+            if not hasattr(os,"fork"):
+                raise RuntimeError("Prefork serving needs os.fork, run a single worker on this platform")
+
+            logging.info("Loading the model in the master before forking workers")
+            self.preload()
+            # move everything loaded so far out of the collector's reach, so that
+            # collections in the workers do not write to (and copy) the shared pages
+            gc.collect()
+            gc.freeze()
+
+            sock=socket.socket(socket.AF_INET,socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET,socket.SO_REUSEADDR,1)
+            sock.bind((self.host,self.port))
+            sock.listen(2048)
+            sock.set_inheritable(True)
+
+            for worker_id in range(self.workers):
+                self._spawn_worker(sock,worker_id)
+
+            signal.signal(signal.SIGTERM,self._stop)
+            signal.signal(signal.SIGINT,self._stop)
+
+            next_report=time.monotonic()+self.memory_report_seconds
+            while self.worker_pids:
+                pid,status=os.waitpid(-1,os.WNOHANG)
+                if pid in self.worker_pids:
+                    worker_id=self.worker_pids.pop(pid)
+                    if not self._stopping:
+                        logging.warning(f"Worker {worker_id} (pid {pid}) exited with status {status}, restarting it")
+                        self._spawn_worker(sock,worker_id)
+                    continue
+
+                if time.monotonic()>=next_report:
+                    self.report_memory()
+                    next_report=time.monotonic()+self.memory_report_seconds
+                time.sleep(0.5)
+
+            sock.close()
+            logging.info("All workers stopped")
+
+        except Exception as e:
+            raise MyException(e,sys) from e
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+from src.entity.compiled_forest import CompiledForest
+
+@pytest.fixture(scope="module")
+def data():
+    rng=np.random.default_rng(0)
+    x=rng.normal(size=(3000,8))
+    # a few low cardinality columns, so many rows sit exactly on a split threshold
+    x[:,5]=rng.integers(0,3,len(x))
+    x[:,6]=rng.integers(0,2,len(x))
+    y=((x[:,0]+x[:,5]-x[:,6]+rng.normal(scale=0.5,size=len(x)))>0.5).astype(float)
+    return x,y
+
+@pytest.fixture(scope="module")
+def forest(data):
+    x,y=data
+    return RandomForestClassifier(n_estimators=25,min_samples_split=7,min_samples_leaf=6,max_depth=10,
+                                  random_state=101).fit(x[:2000],y[:2000])
+
+def test_matches_sklearn_exactly(data,forest):
+    x=data[0][2000:]
+    compiled_forest=CompiledForest.from_forest(forest)
+    assert np.array_equal(compiled_forest.predict_proba(x),forest.predict_proba(x))
+    assert np.array_equal(compiled_forest.predict(x),forest.predict(x))
+
+def test_matches_sklearn_on_split_thresholds(forest):
+    # inputs equal to the float64 thresholds, which are rounded down to float32 in the engine
+    compiled_forest=CompiledForest.from_forest(forest)
+    thresholds=np.concatenate([estimator.tree_.threshold[estimator.tree_.children_left!=-1]
+                               for estimator in forest.estimators_])
+    x=np.tile(thresholds[:,np.newaxis],(1,forest.n_features_in_))
+    assert np.array_equal(compiled_forest.predict_proba(x),forest.predict_proba(x))
+
+def test_matches_sklearn_across_chunks(data,forest):
+    x=data[0][2000:]
+    compiled_forest=CompiledForest.from_forest(forest)
+    compiled_forest.max_cells_per_chunk=len(compiled_forest.roots)*7
+    assert np.array_equal(compiled_forest.predict_proba(x),forest.predict_proba(x))
+
+def test_single_row(data,forest):
+    x=data[0][2000:2001]
+    compiled_forest=CompiledForest.from_forest(forest)
+    assert np.array_equal(compiled_forest.predict_proba(x),forest.predict_proba(x))
+
+def test_arrays_round_trip(data,forest):
+    x=data[0][2000:]
+    compiled_forest=CompiledForest.from_forest(forest)
+    rebuilt=CompiledForest.from_arrays(compiled_forest.to_arrays())
+    assert np.array_equal(rebuilt.predict_proba(x),forest.predict_proba(x))
+    assert np.array_equal(rebuilt.classes_,forest.classes_)
+
+def test_rejects_invalid_input(forest):
+    compiled_forest=CompiledForest.from_forest(forest)
+    with pytest.raises(ValueError):
+        compiled_forest.predict_proba(np.zeros((2,forest.n_features_in_+1)))
+    x=np.zeros((2,forest.n_features_in_))
+    x[1,0]=np.nan
+    with pytest.raises(ValueError):
+        compiled_forest.predict_proba(x)